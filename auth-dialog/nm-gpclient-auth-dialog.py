@@ -17,6 +17,15 @@ Two modes:
     e.g. "otp" for an RSA token / one-time code, "password", "username".
     A hint prefixed with "x-vpn-message:" carries the human-readable
     prompt message from the VPN service.
+
+With --external-ui-mode (GNOME Shell) no window is opened: the prompt is
+described as a keyfile on stdout and the agent renders it natively.
+
+Otherwise prompts are shown by the prompt service (this script with --prompt-service),
+which the session bus starts on the first request and which keeps GTK
+initialised, so later prompts (the gateway's after the portal's, the next
+connection's) appear without a GTK cold start. When it is not available, the
+dialog is shown in-process.
 """
 
 import argparse
@@ -36,6 +45,38 @@ PLAIN_TEXT_HINTS = ("username", "otp")
 # what the connection happens to have saved, and never pre-fill them.
 ONE_TIME_HINTS = ("otp",)
 
+# --external-ui-mode keyfile (GNOME Shell's VPN request handler reads it)
+EXTERNAL_UI_GROUP = "VPN Plugin UI"
+EXTERNAL_UI_VERSION = 2
+
+# Session bus prompt service (config/org.freedesktop.NetworkManager.gpclient.Prompt.service)
+PROMPT_SERVICE_NAME = "org.freedesktop.NetworkManager.gpclient.Prompt"
+PROMPT_SERVICE_PATH = "/org/freedesktop/NetworkManager/gpclient/Prompt"
+PROMPT_SERVICE_INTERFACE = PROMPT_SERVICE_NAME
+PROMPT_SERVICE_XML = f"""
+<node>
+  <interface name="{PROMPT_SERVICE_INTERFACE}">
+    <method name="Ask">
+      <arg type="s" name="vpn_name" direction="in"/>
+      <arg type="as" name="requested" direction="in"/>
+      <arg type="s" name="message" direction="in"/>
+      <arg type="a{{ss}}" name="existing_secrets" direction="in"/>
+      <arg type="a{{ss}}" name="data" direction="in"/>
+      <arg type="b" name="reprompt" direction="in"/>
+      <arg type="b" name="answered" direction="out"/>
+      <arg type="a{{ss}}" name="secrets" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+# The service exits after this long without a prompt on screen; the next
+# request starts it again
+PROMPT_SERVICE_IDLE_EXIT = 15 * 60
+
+# Ask() waits for the user: no D-Bus call timeout (G_MAXINT)
+PROMPT_CALL_TIMEOUT_MS = 2**31 - 1
+
 
 def read_stdin_data():
     """Read DATA_KEY/DATA_VAL and SECRET_KEY/SECRET_VAL pairs until DONE"""
@@ -79,6 +120,46 @@ def output_secrets(secrets):
     sys.stdout.flush()
 
 
+def keyfile_escape(value):
+    """Escape a GKeyFile string value"""
+    value = (
+        value.replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+    if value.startswith(" "):
+        value = "\\s" + value[1:]
+    return value
+
+
+def output_external_ui(vpn_name, description, entries):
+    """Describe the prompt as a keyfile for the agent to render.
+
+    `entries` are (key, value, should_ask) tuples. The agent reads stdout up
+    to EOF, asks for the ShouldAsk entries itself and hands every value to
+    NetworkManager, so nothing is written after this and QUIT never comes.
+    """
+    lines = [
+        f"[{EXTERNAL_UI_GROUP}]",
+        f"Version={EXTERNAL_UI_VERSION}",
+        f"Description={keyfile_escape(description)}",
+        f"Title={keyfile_escape(f'Authenticate VPN: {vpn_name}')}",
+    ]
+    for key, value, should_ask in entries:
+        label = SECRET_LABELS.get(key, key.replace("-", " ").capitalize())
+        lines += [
+            "",
+            f"[{key}]",
+            f"Value={keyfile_escape(value)}",
+            f"Label={keyfile_escape(label)}",
+            f"IsSecret={'false' if key in PLAIN_TEXT_HINTS else 'true'}",
+            f"ShouldAsk={'true' if should_ask else 'false'}",
+        ]
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
 def parse_hints(raw_hints):
     """Split hints into requested secret keys and an optional message"""
     keys = []
@@ -91,16 +172,23 @@ def parse_hints(raw_hints):
     return keys, message
 
 
-def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
-    """Show a GTK dialog asking for the requested secrets.
+def prompt_description(vpn_name, message, reprompt):
+    if message:
+        return message
+    if reprompt:
+        return f"Authentication failed. Enter the credentials for “{vpn_name}” again."
+    return f"Credentials are required to connect to “{vpn_name}”."
 
-    Returns a dict {key: value} or None when the user cancelled.
-    """
-    import gi
 
-    gi.require_version("Gtk", "3.0")
-    from gi.repository import Gtk
+def prefill_value(key, existing_secrets, reprompt):
+    """The stored value to offer for `key` - never for one-time secrets"""
+    if reprompt or key in ONE_TIME_HINTS:
+        return ""
+    return existing_secrets.get(key, "")
+
 
+def build_dialog(Gtk, vpn_name, requested, message, existing_secrets, data, reprompt):
+    """Build and show the GTK dialog; returns (dialog, {key: entry})"""
     dialog = Gtk.Dialog(title=f"Authenticate VPN: {vpn_name}")
     dialog.set_modal(True)
     dialog.set_keep_above(True)
@@ -114,14 +202,7 @@ def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
     content.set_spacing(8)
 
     header = Gtk.Label()
-    if message:
-        header.set_text(message)
-    elif reprompt:
-        header.set_text(
-            f"Authentication failed. Enter the credentials for “{vpn_name}” again."
-        )
-    else:
-        header.set_text(f"Credentials are required to connect to “{vpn_name}”.")
+    header.set_text(prompt_description(vpn_name, message, reprompt))
     header.set_line_wrap(True)
     header.set_max_width_chars(60)
     header.set_xalign(0)
@@ -149,8 +230,7 @@ def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
         entry.set_activates_default(True)
         if key not in PLAIN_TEXT_HINTS:
             entry.set_visibility(False)
-        if not reprompt and key not in ONE_TIME_HINTS and existing_secrets.get(key):
-            entry.set_text(existing_secrets[key])
+        entry.set_text(prefill_value(key, existing_secrets, reprompt))
         grid.attach(entry, 1, row, 1, 1)
         entries[key] = entry
 
@@ -161,7 +241,22 @@ def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
             next(iter(entries.values())),
         )
         first_empty.grab_focus()
+    return dialog, entries
+
+
+def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
+    """Show a GTK dialog asking for the requested secrets.
+
+    Returns a dict {key: value} or None when the user cancelled.
+    """
+    import gi
 
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk
+
+    dialog, entries = build_dialog(
+        Gtk, vpn_name, requested, message, existing_secrets, data, reprompt
+    )
     response = dialog.run()
     result = None
     if response == Gtk.ResponseType.OK:
@@ -175,7 +270,150 @@ def ask_user(vpn_name, requested, message, existing_secrets, data, reprompt):
     return result
 
 
+def ask_prompt_service(vpn_name, requested, message, existing_secrets, data, reprompt):
+    """Ask through the prompt service on the session bus.
+
+    Returns (reached, result): reached is False when the service could not be
+    used and the caller should show the dialog itself; result is as for
+    ask_user().
+    """
+    try:
+        from gi.repository import Gio, GLib
+
+        bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        reply = bus.call_sync(
+            PROMPT_SERVICE_NAME,
+            PROMPT_SERVICE_PATH,
+            PROMPT_SERVICE_INTERFACE,
+            "Ask",
+            GLib.Variant(
+                "(sassa{ss}a{ss}b)",
+                (
+                    vpn_name,
+                    list(requested),
+                    message or "",
+                    dict(existing_secrets),
+                    dict(data),
+                    reprompt,
+                ),
+            ),
+            GLib.VariantType.new("(ba{ss})"),
+            Gio.DBusCallFlags.NONE,
+            PROMPT_CALL_TIMEOUT_MS,
+            None,
+        )
+    except Exception as e:
+        print(f"Prompt service not available ({e}), asking in-process", file=sys.stderr)
+        return False, None
+
+    answered, secrets = reply.unpack()
+    return True, (dict(secrets) if answered else None)
+
+
+class PromptService:
+    """The session bus side of ask_prompt_service(): one dialog per Ask() call,
+    answered when the user closes it. Several can be open at once."""
+
+    def __init__(self, Gtk, GLib):
+        self.Gtk = Gtk
+        self.GLib = GLib
+        self.open_dialogs = 0
+        self._idle_source = None
+
+    def on_method_call(
+        self, _connection, _sender, _path, _interface, method, parameters, invocation
+    ):
+        if method != "Ask":
+            invocation.return_dbus_error(
+                "org.freedesktop.DBus.Error.UnknownMethod", f"Unknown method {method}"
+            )
+            return
+
+        vpn_name, requested, message, existing_secrets, data, reprompt = (
+            parameters.unpack()
+        )
+        dialog, entries = build_dialog(
+            self.Gtk,
+            vpn_name,
+            requested,
+            message or None,
+            existing_secrets,
+            data,
+            reprompt,
+        )
+        self.open_dialogs += 1
+        self._disarm_idle_exit()
+
+        def on_response(dialog, response):
+            answered = response == self.Gtk.ResponseType.OK
+            secrets = (
+                {key: entry.get_text() for key, entry in entries.items()}
+                if answered
+                else {}
+            )
+            dialog.destroy()
+            invocation.return_value(self.GLib.Variant("(ba{ss})", (answered, secrets)))
+            self.open_dialogs -= 1
+            self.arm_idle_exit()
+
+        dialog.connect("response", on_response)
+        dialog.present()
+
+    def arm_idle_exit(self):
+        self._disarm_idle_exit()
+        if self.open_dialogs == 0:
+            self._idle_source = self.GLib.timeout_add_seconds(
+                PROMPT_SERVICE_IDLE_EXIT, self._idle_exit
+            )
+
+    def _disarm_idle_exit(self):
+        if self._idle_source is not None:
+            self.GLib.source_remove(self._idle_source)
+            self._idle_source = None
+
+    def _idle_exit(self):
+        self._idle_source = None
+        self.Gtk.main_quit()
+        return False
+
+
+def run_prompt_service():
+    """Serve prompts on the session bus until idle (D-Bus activated)"""
+    import gi
+
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gio, GLib, Gtk
+
+    service = PromptService(Gtk, GLib)
+    interface = Gio.DBusNodeInfo.new_for_xml(PROMPT_SERVICE_XML).interfaces[0]
+
+    def on_bus_acquired(connection, _name):
+        connection.register_object(
+            PROMPT_SERVICE_PATH, interface, service.on_method_call, None, None
+        )
+
+    def on_name_lost(_connection, name):
+        # Another instance owns it (or the bus went away): nothing to serve
+        print(f"Lost the bus name {name}", file=sys.stderr)
+        Gtk.main_quit()
+
+    Gio.bus_own_name(
+        Gio.BusType.SESSION,
+        PROMPT_SERVICE_NAME,
+        Gio.BusNameOwnerFlags.NONE,
+        on_bus_acquired,
+        None,
+        on_name_lost,
+    )
+    service.arm_idle_exit()
+    Gtk.main()
+    return 0
+
+
 def main():
+    if "--prompt-service" in sys.argv[1:]:
+        return run_prompt_service()
+
     parser = argparse.ArgumentParser(description="GlobalProtect VPN auth dialog")
     parser.add_argument("-u", "--uuid", required=True)
     parser.add_argument("-n", "--name", required=True)
@@ -184,7 +422,9 @@ def main():
     parser.add_argument("-r", "--reprompt", action="store_true")
     parser.add_argument("-t", "--hint", action="append", default=[])
     parser.add_argument(
-        "--external-ui-mode", action="store_true", help="Ignored (not supported)"
+        "--external-ui-mode",
+        action="store_true",
+        help="Describe the prompt on stdout for the agent to render",
     )
     args = parser.parse_args()
 
@@ -194,6 +434,17 @@ def main():
 
     data, existing_secrets = read_stdin_data()
     requested, message = parse_hints(args.hint)
+    description = prompt_description(args.name, message, args.reprompt)
+
+    def answer(secrets):
+        """Hand `secrets` back without asking anyone"""
+        if args.external_ui_mode:
+            entries = [(key, value, False) for key, value in secrets.items()]
+            output_external_ui(args.name, description, entries)
+        else:
+            output_secrets(secrets)
+            wait_for_quit()
+        return 0
 
     if not requested:
         # No hints: NetworkManager wants the connection's stored secrets, not
@@ -205,16 +456,12 @@ def main():
         # what kept the connection editor spinning until the 25 s secrets
         # timeout expired (issue #8). Answer with an empty set instead.
         if data.get("auth-mode", "saml") != "credentials":
-            output_secrets({})
-            wait_for_quit()
-            return 0
+            return answer({})
 
         # Standard login portal, but the password is explicitly not required
         # (password-flags: 4 = NOT_REQUIRED).
         if data.get("password-flags", "0") == "4":
-            output_secrets({})
-            wait_for_quit()
-            return 0
+            return answer({})
 
         # Standard login portal: only the password is stored as a secret.
         requested = ["password"]
@@ -225,18 +472,31 @@ def main():
         key in ONE_TIME_HINTS for key in requested
     )
     if reusable and all(existing_secrets.get(key) for key in requested):
-        output_secrets({key: existing_secrets[key] for key in requested})
-        wait_for_quit()
-        return 0
+        return answer({key: existing_secrets[key] for key in requested})
 
     if not args.allow_interaction:
         print("No secrets available and interaction is not allowed", file=sys.stderr)
         return 1
 
+    if args.external_ui_mode:
+        output_external_ui(
+            args.name,
+            description,
+            [
+                (key, prefill_value(key, existing_secrets, args.reprompt), True)
+                for key in requested
+            ],
+        )
+        return 0
+
     try:
-        result = ask_user(
+        reached, result = ask_prompt_service(
             args.name, requested, message, existing_secrets, data, args.reprompt
         )
+        if not reached:
+            result = ask_user(
+                args.name, requested, message, existing_secrets, data, args.reprompt
+            )
     except Exception as e:
         print(f"Failed to show auth dialog: {e}", file=sys.stderr)
         return 1
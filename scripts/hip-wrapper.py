@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Caching CSD wrapper for gpclient's HIP (Host Integrity Protection) reports.
+
+nm-gpclient-service passes this script to gpclient as --csd-wrapper. openconnect
+runs it at connect time and again on every HIP re-check, as
+
+    hip-wrapper --cookie C [--client-ip IP] [--client-ipv6 IP6] --md5 M --client-os OS
+
+Generating the report means scanning the host, which takes seconds on managed
+machines. The first run hands the arguments to the real wrapper (gpclient's
+hipreport.sh) and caches its report. Later runs on an unchanged host take the
+cached body and only substitute the per-session fields: the MD5, the client
+addresses, the user and domain from the cookie, and the generation time.
+
+The host state is fingerprinted from:
+- the OS release, host name and machine id
+- the package databases (dpkg/rpm): an install or upgrade misses the cache
+- security-product state files, including $GPCLIENT_HIP_STATE_FILES
+  (colon-separated)
+- the global addresses of non-tunnel interfaces
+- the real wrapper itself
+
+The cache is per user, in $XDG_CACHE_HOME/nm-gpclient (~/.cache/nm-gpclient).
+Entries expire after $GPCLIENT_HIP_CACHE_TTL seconds (0 disables the cache).
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs
+
+# Per user: gpclient makes the desktop user (SUDO_UID) the CSD user, and
+# openconnect drops to it before running the wrapper, so a root-owned directory
+# would never be writable
+CACHE_DIR = os.environ.get("GPCLIENT_HIP_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "nm-gpclient"
+)
+CACHE_FILE = "hip-report.json"
+DEFAULT_TTL = 24 * 3600
+
+# gpclient's own lookup order (crates/openconnect/src/vpn_utils.rs)
+REAL_WRAPPERS = (
+    "/usr/libexec/gpclient/hipreport.sh",
+    "/usr/lib/x86_64-linux-gnu/openconnect/hipreport.sh",
+    "/usr/lib/aarch64-linux-gnu/openconnect/hipreport.sh",
+    "/usr/lib/openconnect/hipreport.sh",
+    "/usr/libexec/openconnect/hipreport.sh",
+)
+
+HOST_FILES = ("/etc/os-release", "/etc/hostname", "/etc/machine-id")
+
+# Changes whenever a package is installed, removed or upgraded
+PACKAGE_DATABASES = (
+    "/var/lib/dpkg/status",
+    "/var/lib/rpm/rpmdb.sqlite",
+    "/var/lib/rpm/Packages",
+    "/usr/lib/sysimage/rpm/rpmdb.sqlite",
+)
+
+# State of security products a HIP profile typically checks
+SECURITY_STATE_FILES = (
+    "/etc/opt/microsoft/mdatp/managed/mdatp_managed.json",
+    "/var/opt/microsoft/mdatp/wdavstate",
+    "/var/lib/clamav/daily.cld",
+    "/var/lib/clamav/daily.cvd",
+    "/etc/selinux/config",
+    "/etc/ufw/ufw.conf",
+)
+
+TUNNEL_PREFIXES = ("gpd", "tun", "wg", "ppp")
+
+# Fields that change per session, and the report element that holds each
+SESSION_FIELDS = {
+    "md5": "md5-sum",
+    "client-ip": "ip-address",
+    "client-ipv6": "ipv6-address",
+    "user": "user-name",
+    "domain": "domain",
+}
+
+
+def parse_args(argv):
+    """openconnect's arguments as a dict ("--md5 X" -> {"md5": "X"})"""
+    args = {}
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        if arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            args[key] = value
+        elif arg.startswith("--") and index + 1 < len(argv):
+            args[arg[2:]] = argv[index + 1]
+            index += 1
+        index += 1
+    return args
+
+
+def session_values(args):
+    cookie = parse_qs(args.get("cookie", ""))
+    return {
+        "md5": args.get("md5", ""),
+        "client-ip": args.get("client-ip", ""),
+        "client-ipv6": args.get("client-ipv6", ""),
+        "user": cookie.get("user", [""])[0],
+        "domain": cookie.get("domain", [""])[0],
+    }
+
+
+def real_wrapper():
+    configured = os.environ.get("GPCLIENT_HIP_REAL_WRAPPER")
+    candidates = (configured,) if configured else REAL_WRAPPERS
+    for path in candidates:
+        if path and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+def _global_addresses():
+    try:
+        result = subprocess.run(
+            ["ip", "-o", "addr", "show", "scope", "global"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return []
+    addresses = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and not parts[1].startswith(TUNNEL_PREFIXES):
+            addresses.append(" ".join(parts[1:4]))
+    return sorted(addresses)
+
+
+def host_fingerprint(args, wrapper):
+    """Digest of everything the report describes except the session fields"""
+    state = {
+        "client-os": args.get("client-os", ""),
+        "wrapper": _file_stamp(wrapper),
+        "host": [],
+        "packages": [_file_stamp(path) for path in PACKAGE_DATABASES],
+        "security": [],
+        "addresses": _global_addresses(),
+    }
+    for path in HOST_FILES:
+        try:
+            with open(path, "rb") as handle:
+                state["host"].append(hashlib.sha256(handle.read()).hexdigest())
+        except OSError:
+            state["host"].append(None)
+    extra = os.environ.get("GPCLIENT_HIP_STATE_FILES", "")
+    for path in SECURITY_STATE_FILES + tuple(p for p in extra.split(":") if p):
+        state["security"].append(_file_stamp(path))
+    encoded = json.dumps(state, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def substitute(report, cached, current):
+    """The cached report with this session's values in place of the cached ones"""
+    for field, element in SESSION_FIELDS.items():
+        old, new = cached.get(field, ""), current.get(field, "")
+        if old == new:
+            continue
+        # Only inside the field's own element: a short value ("1", "yes")
+        # also appears elsewhere in the report
+        report = re.sub(
+            rf"<{element}>{re.escape(old)}</{element}>",
+            lambda _match, element=element, new=new: f"<{element}>{new}</{element}>",
+            report,
+        )
+    now = time.strftime("%m/%d/%Y %H:%M:%S")
+    return re.sub(
+        r"<generate-time>[^<]*</generate-time>",
+        f"<generate-time>{now}</generate-time>",
+        report,
+    )
+
+
+def load_cache(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def store_cache(path, entry):
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        # The report names the user and the machine: owner only
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as handle:
+            json.dump(entry, handle)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"hip-wrapper: cannot cache the report: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    wrapper = real_wrapper()
+    if wrapper is None:
+        print("hip-wrapper: no HIP report script (hipreport.sh) found", file=sys.stderr)
+        return 1
+
+    try:
+        ttl = float(os.environ.get("GPCLIENT_HIP_CACHE_TTL", DEFAULT_TTL))
+    except ValueError:
+        ttl = DEFAULT_TTL
+    path = os.path.join(CACHE_DIR, CACHE_FILE)
+    current = session_values(args)
+
+    fingerprint = host_fingerprint(args, wrapper) if ttl > 0 else None
+    if fingerprint:
+        entry = load_cache(path)
+        if (
+            entry
+            and entry.get("fingerprint") == fingerprint
+            and 0 <= time.time() - entry.get("created", 0) < ttl
+        ):
+            sys.stdout.write(substitute(entry["report"], entry["session"], current))
+            sys.stdout.flush()
+            print("hip-wrapper: HIP report from cache", file=sys.stderr)
+            return 0
+
+    result = subprocess.run([wrapper] + argv, stdout=subprocess.PIPE)
+    sys.stdout.buffer.write(result.stdout)
+    sys.stdout.flush()
+    if result.returncode == 0 and fingerprint and result.stdout.strip():
+        store_cache(
+            path,
+            {
+                "fingerprint": fingerprint,
+                "created": time.time(),
+                "session": current,
+                "report": result.stdout.decode("utf-8", errors="replace"),
+            },
+        )
+    return result.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Entry point for nm-gpclient-service, installed as
+/usr/lib/NetworkManager/nm-gpclient-service.
+
+The service itself is installed as a module (nm_gpclient_service.py in
+SERVICE_MODULE_DIR) and imported from here, so Python keeps its bytecode in
+__pycache__. Run directly as a script, the whole service would be compiled
+again on every D-Bus activation.
+"""
+
+import sys
+
+SERVICE_MODULE_DIR = "/usr/lib/nm-gpclient"
+
+if __name__ == "__main__":
+    sys.path.insert(0, SERVICE_MODULE_DIR)
+    from nm_gpclient_service import main
+
+    sys.exit(main())
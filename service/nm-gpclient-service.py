@@ -9,21 +9,22 @@ Rewritten using python-sdbus for proper D-Bus interface implementation.
 """
 
 import asyncio
+import codecs
+import errno
 import fcntl
+import json
 import logging
 import os
-import pty
 import re
-import shutil
 import signal
 import socket
 import struct
 import subprocess
 import sys
-import termios
-from collections import deque
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from collections import Counter, deque
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
 
 from sdbus import (
     DbusInterfaceCommonAsync,
@@ -42,11 +43,72 @@ handler.setFormatter(logging.Formatter("%(name)s [%(levelname)s] %(message)s"))
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+
+class LazyPattern:
+    """A regular expression compiled on first use.
+
+    The patterns below only matter once gpclient is running; compiling them at
+    import would add to every D-Bus activation. Behaves like the re.Pattern it
+    wraps.
+    """
+
+    def __init__(self, pattern: Union[str, bytes], flags: int = 0):
+        self._source = (pattern, flags)
+        self._compiled: Optional[re.Pattern] = None
+
+    def __getattr__(self, name):
+        if self._compiled is None:
+            self._compiled = re.compile(*self._source)
+        return getattr(self._compiled, name)
+
+
+# --- Journal logging ---------------------------------------------------------
+#
+# Under systemd, stderr ends up in the journal as plain text only. Writing the
+# native journal protocol instead lets every entry carry the activation it
+# belongs to as structured fields, so one connection can be followed with e.g.
+#
+#   journalctl -u nm-gpclient CONNECTION_UUID=<uuid>
+#
+# Messages are formatted lazily (%-style arguments), so a disabled DEBUG line
+# costs nothing even when it would dump the whole connection dict.
+JOURNAL_SOCKET = "/run/systemd/journal/socket"
+SYSLOG_IDENTIFIER = "nm-gpclient-service"
+
+# Activation context attached to every journal entry (see _set_log_context)
+LOG_CONTEXT: Dict[str, str] = {}
+LOG_CONTEXT_FIELDS = ("CONNECTION_UUID", "PHASE", "GATEWAY", "GPCLIENT_PID")
+
+# gpclient under -v prints a lot of near-identical lines. Each one is kept in
+# the failure ring buffer, but at most GPCLIENT_LOG_BURST lines are logged in a
+# row and GPCLIENT_LOG_RATE per second after that; the rest is counted and the
+# count logged once output calms down.
+GPCLIENT_LOG_BURST = 50
+GPCLIENT_LOG_RATE = 10.0
+GPCLIENT_OUTPUT_RING_LINES = 400
+
+# Lines that are always logged, whatever the rate limiter says
+GPCLIENT_IMPORTANT_LINE_RE = LazyPattern(r"\b(?:ERROR|WARN|Error|error)\b")
+
+JOURNAL_PRIORITIES = {
+    logging.CRITICAL: 2,
+    logging.ERROR: 3,
+    logging.WARNING: 4,
+    logging.INFO: 6,
+    logging.DEBUG: 7,
+}
+
+
 # D-Bus service constants
 NM_DBUS_SERVICE_GPCLIENT = "org.freedesktop.NetworkManager.gpclient"
 NM_DBUS_INTERFACE_VPN = "org.freedesktop.NetworkManager.VPN.Plugin"
 NM_DBUS_PATH_GPCLIENT = "/org/freedesktop/NetworkManager/VPN/Plugin"
 
+# Our own interface on the same object, for debugging the service itself
+NM_DBUS_INTERFACE_GPCLIENT_DIAGNOSTICS = (
+    "org.freedesktop.NetworkManager.gpclient.Diagnostics"
+)
+
 # VPN Plugin states
 NM_VPN_SERVICE_STATE_UNKNOWN = 0
 NM_VPN_SERVICE_STATE_INIT = 1
@@ -65,6 +127,22 @@ NM_VPN_PLUGIN_FAILURE_BAD_IP_CONFIG = 2
 # exclusively by gpclient; tun0/tun1 may also belong to other VPN clients.
 TUNNEL_INTERFACES = ["gpd0", "tun0", "tun1"]
 
+# Concurrent sessions: with --bus-name NetworkManager runs one service process
+# per connection. Each activation claims its own gpdN (passed as gpclient
+# --interface) with a claim file in ACTIVATION_DIR naming its PID.
+ACTIVATION_DIR = "/run/nm-gpclient/activations"
+TUNNEL_INTERFACE_PREFIX = "gpd"
+MAX_TUNNEL_INTERFACES = 16
+
+# gpclient refuses to start while the PID in its lock file is alive, and
+# `gpclient disconnect` signals that PID. A second session runs gpclient in a
+# private mount namespace with its own lock file bound over this path.
+GPCLIENT_LOCK_FILE = "/var/run/gpclient.lock"
+
+# Where interfaces show up. A module constant so the benchmarks can run the
+# connect path against a fake network stack (tests/bench).
+SYS_CLASS_NET = "/sys/class/net"
+
 GPCLIENT_BINARY = "/usr/bin/gpclient"
 
 # Secret name used for one-time codes in SecretsRequired/NewSecrets
@@ -83,7 +161,7 @@ OTP_SECRET_KEY = "otp"
 # for with a global flag placed before the subcommand. We watch for the error
 # and retry once with the flag, so nobody has to know the option exists
 # (issue #2).
-OPENSSL_LEGACY_ERROR_RE = re.compile(
+OPENSSL_LEGACY_ERROR_RE = LazyPattern(
     r"unsafe legacy renegotiation disabled|--fix-openssl"
 )
 
@@ -91,11 +169,202 @@ OPENSSL_LEGACY_ERROR_RE = re.compile(
 # (NewSecrets from NetworkManager) before giving up.
 SECRETS_REQUEST_TIMEOUT = 300
 
+# Learned prompts: the kinds of prompt (never the answers) each successful
+# activation of a connection saw. When the last runs all asked the user for a
+# one-time code first, the next activation asks for it right away, while
+# gpclient is still doing TLS and prelogin, and holds the code in memory until
+# the prompt appears. A code older than EARLY_OTP_MAX_AGE is not typed in:
+# tokens roll over, and a rejected code fails the whole login.
+PROMPT_HISTORY_PATH = "/var/lib/nm-gpclient/prompt-history.json"
+PROMPT_HISTORY_RUNS = 3
+PROMPT_HISTORY_MAX_ENTRIES = 64
+EARLY_OTP_MIN_RUNS = 2
+EARLY_OTP_MAX_AGE = 120
+
+# A stored password goes to gpclient --passwd-on-stdin instead of its prompt,
+# for connections whose recent runs all took it (see PromptHistory). It is
+# written when gpclient logs that it reads it - not before: stdin is the PTY,
+# and a raw-mode prompt shown first (a username prompt, say) would take the
+# bytes as keystrokes. Later rounds reuse it without reading again.
+PASSWORD_STDIN_LINE = "Reading password from standard input"
+PASSWORD_STDIN_REUSED_LINE = "Reusing the password read from standard input"
+
 # How long a prompt candidate must stay unchanged before we act on it.
 # gpclient (inquire) renders prompts incrementally; the debounce avoids
 # reacting to half-rendered lines.
 PROMPT_DEBOUNCE_SECONDS = 0.5
 
+# --- Timing -----------------------------------------------------------------
+#
+# Every wait in the service goes through the running event loop (asyncio.sleep,
+# asyncio.wait_for, loop_time()), so the loop is its only clock. The unit tests
+# run the service on a loop with a virtual clock (tests/unit/conftest.py), where
+# a five-minute secrets timeout passes without waiting for it.
+TUNNEL_POLL_INTERVAL = 0.5
+
+# Deadlines for processes we stop or run: gpclient after SIGTERM and SIGKILL,
+# `gpclient disconnect`, `ip link del` and nmcli profile writes
+GPCLIENT_TERMINATE_TIMEOUT = 5
+GPCLIENT_KILL_TIMEOUT = 2
+GPCLIENT_DISCONNECT_TIMEOUT = 10
+LINK_DELETE_TIMEOUT = 5
+NMCLI_TIMEOUT = 10
+
+# Idle exit: after this long without a session or a call from NetworkManager
+# the service exits, and D-Bus activation starts it again for the next
+# connection. GPCLIENT_IDLE_EXIT or --idle-exit override it, 0 or --persist
+# keep the service running.
+IDLE_EXIT_TIMEOUT = 180
+IDLE_EXIT_ENV = "GPCLIENT_IDLE_EXIT"
+IDLE_CHECK_INTERVAL = 5.0
+
+
+# --- Path MTU ---------------------------------------------------------------
+#
+# Without --mtu, openconnect sizes the tunnel for a 1500-byte path. Behind
+# hotel Wi-Fi and LTE links with a smaller path MTU, every full-size ESP packet
+# is then fragmented, and throughput collapses. Before gpclient starts we
+# probe the path to the server the profile points at. The gateway is only
+# known once gpclient has talked to the portal; it is normally in the same
+# network. From that path MTU we derive the tunnel MTU, pass it as --mtu and
+# report it in Ip4Config.
+#
+# The probe sends UDP with DF set to GlobalProtect's ESP port. Routers that
+# cannot forward it answer with ICMP "fragmentation needed", which lowers the
+# kernel's path MTU for the route (IP_MTU). No raw sockets, so no root either.
+# Results are cached per server and uplink (the default gateway's MAC), so a
+# known network costs no probe at all.
+MTU_CACHE_PATH = "/var/lib/nm-gpclient/mtu-cache.json"
+MTU_CACHE_TTL = 7 * 24 * 3600
+MTU_CACHE_MAX_ENTRIES = 64
+PMTU_PROBE_PORT = 4501
+PMTU_PROBE_ROUNDS = 3
+PMTU_PROBE_WAIT = 0.2
+PMTU_PROBE_TIMEOUT = 2.0
+MIN_TUNNEL_MTU = 576
+MAX_UDP_PAYLOAD = 65507
+
+# Linux socket options (not exported by every Python build)
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+# Per-packet encapsulation cost outside the tunnel MTU. ESP (UDP 4501): outer
+# IPv4 + UDP + SPI/sequence + AES-CBC IV + the largest ICV (HMAC-SHA256-128);
+# the padded payload plus its 2-byte trailer must fill whole 16-byte blocks.
+# TLS fallback: outer IPv4 + TCP with timestamps + TLS record header + AES-GCM
+# explicit nonce and tag + the 16-byte GlobalProtect packet header.
+ESP_OVERHEAD = 20 + 8 + 8 + 16 + 16
+ESP_BLOCK_SIZE = 16
+ESP_TRAILER = 2
+TLS_OVERHEAD = 20 + 32 + 5 + 8 + 16 + 16
+
+# vpn.data transport: auto (ESP, HTTPS when ESP cannot be set up), esp (fail
+# instead of falling back, so the next activation tries ESP again) or tls
+# (--no-dtls: skip the ESP attempt on networks that block UDP)
+TRANSPORT_SETTINGS = ("auto", "esp", "tls")
+
+# openconnect messages that show which transport carries the tunnel. After
+# "using HTTPS instead" openconnect does not try ESP again in that session.
+TRANSPORT_MESSAGES = (
+    ("ESP session established", "esp"),
+    ("ESP tunnel connected", "esp"),
+    ("Failed to connect ESP tunnel; using HTTPS instead", "tls"),
+    ("Connecting to HTTPS tunnel endpoint", "tls"),
+)
+
+PROC_NET_ROUTE = "/proc/net/route"
+PROC_NET_ARP = "/proc/net/arp"
+
+
+def loop_time() -> float:
+    """Current time on the running event loop's clock (monotonic outside one)"""
+    try:
+        return asyncio.get_running_loop().time()
+    except RuntimeError:
+        return time.monotonic()
+
+
+# --- Activation tracing -----------------------------------------------------
+#
+# An occasional 60-second connect is impossible to explain from the journal
+# alone, so an activation can be written out as a span tree: GPCLIENT_TRACE set
+# to a file (overwritten by every activation) or a directory (one file per
+# activation), or the EnableTracing() diagnostics call. The output is the
+# Chrome trace event format, which Perfetto and chrome://tracing load as is.
+#
+# Parts of an activation overlap - gpclient runs while we wait for the user
+# and poll for the tunnel - so every span goes to a named track, shown as its
+# own row.
+TRACE_ENV = "GPCLIENT_TRACE"
+TRACE_TRACKS = (
+    "activation",
+    "preflight",
+    "gpclient",
+    "prompts",
+    "secrets",
+    "nmcli",
+    "tunnel",
+)
+
+# --- PTY session recording --------------------------------------------------
+#
+# GPCLIENT_RECORD set to a file or a directory (or the EnableRecording()
+# diagnostics call) saves the exact byte stream gpclient wrote to its terminal,
+# with relative timestamps, plus the keys we typed back - as an asciicast v2
+# file. A capture from a problem portal can then be replayed offline through
+# the whole prompt logic (tests/replay/gpclient-replay.py). Every secret we
+# type (passwords, one-time codes) is replaced by RECORDING_REDACTED in both
+# directions before it is written.
+RECORD_ENV = "GPCLIENT_RECORD"
+RECORDING_REDACTED = "<redacted>"
+
+# --- Sampling profiler ------------------------------------------------------
+#
+# "Connect hangs for 40 s" needs to show where the time went. SIGUSR1 or the
+# StartProfiling() diagnostics call starts a wall-clock profile: a thread
+# samples the stack of every thread, the event loop's included, and the loop
+# itself dumps the await chain of every pending task. SIGUSR2, StopProfiling(),
+# the next STARTED or failure - or PROFILE_MAX_SECONDS - stop it and write the
+# samples in the collapsed-stack format flamegraph.pl and speedscope read. Task
+# dumps are weighted to count in the same unit as thread samples, so a stack's
+# count times PROFILE_SAMPLE_INTERVAL is roughly the time spent in it.
+PROFILE_DIR = "/var/lib/nm-gpclient/profiles"
+PROFILE_SAMPLE_INTERVAL = 0.01
+PROFILE_TASK_INTERVAL = 0.1
+PROFILE_MAX_SECONDS = 600
+
+# Names asyncio gives a task it was not given one
+DEFAULT_TASK_NAME_RE = LazyPattern(r"^Task-\d+$")
+
+# --- Memory budget ----------------------------------------------------------
+#
+# The service lives as long as the session, which can be days of gpclient
+# output, so nothing it keeps per session grows with that output: a line is cut
+# to its last OUTPUT_LINE_MAX_CHARS characters (the end is where a prompt label
+# is), the failure ring keeps at most OUTPUT_RING_MAX_CHARS characters and the
+# gateway list GATEWAY_LIST_MAX_ENTRIES entries. What was trimmed is counted,
+# logged at Disconnect() and shown in the TrimmedOutput diagnostics property.
+OUTPUT_LINE_MAX_CHARS = 4096
+OUTPUT_RING_MAX_CHARS = 256 * 1024
+GATEWAY_LIST_MAX_ENTRIES = 64
+
+# TakeMemorySnapshot(): frames kept per traced allocation, and how many of the
+# biggest changes since the previous snapshot are reported
+TRACEMALLOC_FRAMES = 8
+MEMORY_DIFF_TOP = 25
+
+# --- Pushed configuration ---------------------------------------------------
+#
+# The vpnc hook (config/90-gpclient-routing) saves what the gateway pushed -
+# DNS servers, the default domain, the split-DNS domains - to the file named
+# in GPCLIENT_NM_PUSHED_CONFIG, and keeps vpnc-script away from the resolver.
+# We report it to NetworkManager in Ip4Config instead, so it sets up split DNS:
+# systemd-resolved sends only the corporate names over the tunnel, public
+# lookups stay local.
+PUSHED_CONFIG_DIR = "/run/nm-gpclient"
+PUSHED_CONFIG_ENV = "GPCLIENT_NM_PUSHED_CONFIG"
+
 # --- Session environment ----------------------------------------------------
 #
 # NetworkManager starts this service with a bare environment, so gpauth - and
@@ -135,6 +404,13 @@ SESSION_LEADER_PROCESSES = (
 BROWSER_WRAPPER = "/usr/libexec/gpclient/browser-wrapper"
 LEGACY_EDGE_WRAPPER = "/usr/libexec/gpclient/edge-wrapper"
 
+# Caching CSD wrapper for HIP reports (scripts/hip-wrapper.py): regenerates the
+# report only when the host state changed or the cached one is older than the
+# TTL (vpn.data hip-cache-ttl, seconds; 0 runs gpclient's own wrapper each time)
+HIP_WRAPPER = "/usr/libexec/gpclient/hip-wrapper"
+HIP_CACHE_TTL = 24 * 3600
+HIP_CACHE_TTL_ENV = "GPCLIENT_HIP_CACHE_TTL"
+
 # Friendly browser names accepted in vpn.data, normalised for the wrapper
 BROWSER_ALIASES = {
     "edge": "edge",
@@ -149,7 +425,7 @@ BROWSER_ALIASES = {
 
 # Concrete binaries the connection editors used to offer - wrapping them keeps
 # existing profiles working and fixes them at the same time
-WRAPPED_BROWSER_PATH_RE = re.compile(
+WRAPPED_BROWSER_PATH_RE = LazyPattern(
     r"^/usr/bin/(?:microsoft-edge\S*|google-chrome\S*|chromium\S*|firefox\S*)$"
 )
 
@@ -176,7 +452,7 @@ BROWSER_BINARIES = {
 # We answer it ourselves: the gateway from vpn.data preferred-gateway, or the
 # first proposal when there is none. The list is cached in the connection
 # profile afterwards so the connection editor can offer it (issue #7).
-SELECT_HELP_RE = re.compile(r"^\[.*(?:to move|to select|to filter|↑↓).*\]$")
+SELECT_HELP_RE = LazyPattern(r"^\[.*(?:to move|to select|to filter|↑↓).*\]$")
 SELECT_OPTION_MARKERS = ">^v "
 SELECT_FRAME_MAX_LINES = 24
 
@@ -189,15 +465,58 @@ SELECT_MAX_STEPS = 200
 SELECT_REDRAW_TIMEOUT = 1.5
 SELECT_POLL_INTERVAL = 0.05
 
+# gpclient's terminal size - wide, so prompts don't wrap mid-line
+PTY_ROWS = 24
+PTY_COLUMNS = 200
+
+# One read of gpclient's output. A verbose session writes a few MB of it, read
+# into the same buffer over and over rather than into a new bytes object each time
+PTY_READ_SIZE = 4096
+
 # Separator for the cached gateway list in vpn.data. Commas cannot be used:
 # `nmcli connection modify ... +vpn.data` splits key=value pairs on them.
 GATEWAY_LIST_SEPARATOR = ";"
 
 # gpclient logs the gateway it picked when it did not have to ask
-GATEWAY_CHOSEN_RE = re.compile(
+GATEWAY_CHOSEN_RE = LazyPattern(
     r"Connecting to (?:the only available|the selected) gateway: (?P<gateway>.+?)\s*$"
 )
 
+# --- Service configuration --------------------------------------------------
+#
+# Tunables a fleet can set without patching the service: SERVICE_CONFIG_PATH,
+# then the *.conf files in SERVICE_CONFIG_PATH.d/ in name order, a later file
+# overriding an earlier one. INI syntax, all keys in a [service] section:
+#
+#   [service]
+#   prompt-debounce = 0.3
+#   session-leader-processes = gnome-shell, plasmashell, systemd
+#
+# Read at start-up and again on SIGHUP. The values replace the constants below
+# (key -> constant, type, minimum, maximum; for a list, the number of entries);
+# a session in progress keeps running and uses them from its next wait on. A
+# value that does not validate is logged and the constant keeps its default.
+SERVICE_CONFIG_PATH = "/etc/nm-gpclient/service.conf"
+SERVICE_CONFIG_SECTION = "service"
+SERVICE_TUNABLES = {
+    "secrets-request-timeout": ("SECRETS_REQUEST_TIMEOUT", float, 10, 3600),
+    "prompt-debounce": ("PROMPT_DEBOUNCE_SECONDS", float, 0.05, 5),
+    "select-redraw-timeout": ("SELECT_REDRAW_TIMEOUT", float, 0.1, 30),
+    "select-max-steps": ("SELECT_MAX_STEPS", int, 1, 10000),
+    "tunnel-poll-interval": ("TUNNEL_POLL_INTERVAL", float, 0.05, 10),
+    "gpclient-terminate-timeout": ("GPCLIENT_TERMINATE_TIMEOUT", float, 0.1, 60),
+    "gpclient-kill-timeout": ("GPCLIENT_KILL_TIMEOUT", float, 0.1, 60),
+    "gpclient-disconnect-timeout": ("GPCLIENT_DISCONNECT_TIMEOUT", float, 0.1, 120),
+    "link-delete-timeout": ("LINK_DELETE_TIMEOUT", float, 0.1, 60),
+    "session-leader-processes": ("SESSION_LEADER_PROCESSES", tuple, 1, 32),
+}
+SERVICE_TUNABLE_DEFAULTS = {
+    constant: globals()[constant] for constant, *_ in SERVICE_TUNABLES.values()
+}
+
+# A process name as `pgrep -x` takes it
+PROCESS_NAME_RE = LazyPattern(r"^[\w.+-]+$")
+
 # --- Interactive prompt detection -------------------------------------------
 #
 # For portals that do NOT use SAML (Prelogin::Standard in gpclient, e.g. RSA
@@ -217,23 +536,56 @@ GATEWAY_CHOSEN_RE = re.compile(
 # connection or interactively via the SecretsRequired/NewSecrets D-Bus flow.
 
 # CSI / OSC / other escape sequences emitted by inquire (crossterm)
-ANSI_ESCAPE_RE = re.compile(
+ANSI_ESCAPE_RE = LazyPattern(
     r"\x1b\[[0-9;?]*[ -/]*[@-~]"  # CSI sequences (colors, cursor, clear)
     r"|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)"  # OSC sequences
     r"|\x1b[@-Z\\-_]"  # other Fe escape sequences
 )
 
 # Control characters except \n, \r and \t
-CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+CONTROL_CHARS_RE = LazyPattern(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+# gpclient's output is cleaned by AnsiTokenizer, on the raw bytes: escape
+# sequences and control characters are all ASCII, and bytes.translate() drops
+# the control characters far faster than a regex over decoded text. The result
+# is what strip_ansi() gives, except for the sequences below, which the
+# tokenizer reports as events instead.
+ANSI_EVENT_SEQUENCES = rb"\[(?:\?25[hl]|[012]?K)"
+TOKEN_LINE_BREAK = 0
+TOKEN_CURSOR_SHOW = 1
+TOKEN_CURSOR_HIDE = 2
+TOKEN_CLEAR_LINE = 3
+ANSI_EVENTS = {
+    "[?25h": TOKEN_CURSOR_SHOW,
+    "[?25l": TOKEN_CURSOR_HIDE,
+    "[K": TOKEN_CLEAR_LINE,
+    "[0K": TOKEN_CLEAR_LINE,
+    "[1K": TOKEN_CLEAR_LINE,
+    "[2K": TOKEN_CLEAR_LINE,
+}
+
+# ANSI_ESCAPE_RE as bytes, minus the event sequences; an ESC that starts none
+# of them goes too, like CONTROL_CHARS_RE would drop it
+ANSI_IGNORED_RE = LazyPattern(
+    rb"\x1b(?!" + ANSI_EVENT_SEQUENCES + rb")"
+    rb"(?:\[[0-9;?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])?"
+)
+ANSI_EVENT_RE = LazyPattern(r"\x1b(" + ANSI_EVENT_SEQUENCES.decode() + ")")
+CONTROL_BYTES = bytes(
+    [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x1B), *range(0x1C, 0x20), 0x7F]
+)
 
 # An escape sequence cut in half by a read boundary. Without holding the head
 # back, ESC is dropped as a control character and the rest leaks into the text -
 # which is how a prompt label ended up as "[39m Password" in the #2 report.
-INCOMPLETE_ANSI_RE = re.compile(r"\x1b\[?[0-9;?]*$")
+# Looked for in the last ANSI_CARRY_LIMIT bytes only; an OSC title longer than
+# that is cleaned in pieces rather than held back without end.
+INCOMPLETE_ANSI_RE = LazyPattern(rb"\x1b(?:\[[0-9;?]*[ -/]*|\][^\x07\x1b]*\x1b?)?\Z")
+ANSI_CARRY_LIMIT = 256
 
 # "Please enter RSA token (Portal: vpn.example.com)" banner printed by
 # gpclient before a standard (non-SAML) authentication round.
-AUTH_BANNER_RE = re.compile(
+AUTH_BANNER_RE = LazyPattern(
     r"^(?P<message>.+?)\s*\((?P<kind>Portal|Gateway):\s*(?P<server>[^)]+)\)\s*$"
 )
 
@@ -251,7 +603,11 @@ ONE_TIME_SECRET_WORDS = (
 
 
 def strip_ansi(text: str) -> str:
-    """Remove ANSI escape sequences and control chars (except \\n \\r \\t)"""
+    """Remove ANSI escape sequences and control chars (except \\n \\r \\t).
+
+    What AnsiTokenizer does to gpclient's output in one go; kept as the
+    reference its tests compare against.
+    """
     text = ANSI_ESCAPE_RE.sub("", text)
     return CONTROL_CHARS_RE.sub("", text)
 
@@ -435,6 +791,8 @@ def resolve_browser(value: str) -> Tuple[str, Optional[str]]:
     )
     if target.startswith("/"):
         return target, None
+    import shutil
+
     for candidate in BROWSER_BINARIES.get(target, ()):
         path = candidate if candidate.startswith("/") else shutil.which(candidate)
         if path and os.path.exists(path):
@@ -442,30 +800,1731 @@ def resolve_browser(value: str) -> Tuple[str, Optional[str]]:
     return target, None
 
 
+class AnsiTokenizer:
+    """Turn gpclient's raw PTY output into text, line breaks and events.
+
+    feed() takes the bytes of one read and returns a list of tokens: a str is
+    a run of text, TOKEN_LINE_BREAK a \\r, \\n or \\r\\n, and TOKEN_CURSOR_SHOW,
+    TOKEN_CURSOR_HIDE and TOKEN_CLEAR_LINE the escape sequences inquire draws
+    its prompts with. Any other escape sequence and control character is
+    dropped, exactly as strip_ansi() drops them.
+
+    Each read is cleaned in a single pass for escape sequences, with the
+    control characters translated away and the lines split by C code; Python
+    only sees one token per line. An escape sequence, a UTF-8 character or a
+    \\r\\n cut by the read boundary is carried over to the next feed().
+    """
+
+    def __init__(self):
+        self._carry = b""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._after_cr = False
+
+    def feed(self, data: Any, final: bool = False) -> List[Union[str, int]]:
+        """Tokens for the next output; `final` flushes whatever was carried"""
+        if self._carry:
+            data = self._carry + data
+            self._carry = b""
+        if not final:
+            window = max(0, len(data) - ANSI_CARRY_LIMIT)
+            partial = INCOMPLETE_ANSI_RE.search(data, window)
+            if partial:
+                self._carry = bytes(data[partial.start() :])
+                data = data[: partial.start()]
+
+        text = self._decoder.decode(
+            ANSI_IGNORED_RE.sub(b"", data).translate(None, CONTROL_BYTES), final
+        )
+        tokens: List[Union[str, int]] = []
+        if "\x1b" in text:
+            # Only event sequences are left: text, event, text, event, ..., text
+            parts = ANSI_EVENT_RE.split(text)
+            self._split_lines(parts[0], tokens)
+            for index in range(1, len(parts), 2):
+                tokens.append(ANSI_EVENTS[parts[index]])
+                self._split_lines(parts[index + 1], tokens)
+        else:
+            self._split_lines(text, tokens)
+        return tokens
+
+    def _split_lines(self, text: str, tokens: List[Union[str, int]]) -> None:
+        if not text:
+            return
+        if self._after_cr and text[0] == "\n":
+            # The \n of a \r\n the last read ended inside
+            text = text[1:]
+            if not text:
+                self._after_cr = False
+                return
+        last = text[-1]
+        self._after_cr = last == "\r"
+
+        terminated = last == "\r" or last == "\n"
+        # str.splitlines() also splits on NEL, LS and PS (the ASCII ones it
+        # splits on are gone with CONTROL_BYTES)
+        if text.isascii() or not (
+            "\x85" in text or "\u2028" in text or "\u2029" in text
+        ):
+            segments = text.splitlines()
+        else:
+            segments = re.split(r"\r\n?|\n", text)
+            if terminated:
+                segments.pop()
+        # segment, break, segment, break, ... - ending in a break if `text` did
+        count = 2 * len(segments) - (not terminated)
+        run: List[Union[str, int]] = [TOKEN_LINE_BREAK] * count
+        run[0::2] = segments
+        tokens.extend(run)
+
+
 class OutputScanner:
     """Split a raw PTY output stream into complete lines and a pending tail.
 
     inquire redraws prompt lines using \\r, so both \\r and \\n are treated as
     line separators; the last unterminated segment is the tail (a potential
-    prompt waiting for input).
+    prompt waiting for input). Fed AnsiTokenizer's tokens, it also follows
+    whether inquire has the cursor shown - it hides it while drawing a prompt,
+    and keeps lines to OUTPUT_LINE_MAX_CHARS, counting the characters cut in
+    `trimmed`.
     """
 
-    def __init__(self):
+    def __init__(self, trimmed: Optional[Counter] = None):
         self._tail = ""
+        self.cursor_visible = True
+        self.trimmed = trimmed if trimmed is not None else Counter()
 
     @property
     def tail(self) -> str:
         return self._tail
 
-    def feed(self, text: str) -> List[str]:
-        """Feed decoded output, return newly completed lines"""
-        pending = self._tail + text
-        segments = re.split(r"[\r\n]", pending)
-        self._tail = segments[-1]
-        return [seg for seg in segments[:-1] if seg.strip()]
+    def feed_tokens(self, tokens: List[Union[str, int]]) -> List[str]:
+        """Feed AnsiTokenizer tokens, return newly completed lines"""
+        lines = []
+        tail = self._tail
+        limit = OUTPUT_LINE_MAX_CHARS
+        for token in tokens:
+            if token.__class__ is str:
+                tail += token
+            elif token == TOKEN_LINE_BREAK:
+                if tail.strip():
+                    if len(tail) > limit:
+                        self.trimmed["line-chars"] += len(tail) - limit
+                        tail = tail[-limit:]
+                    lines.append(tail)
+                tail = ""
+            elif token == TOKEN_CURSOR_HIDE:
+                self.cursor_visible = False
+            elif token == TOKEN_CURSOR_SHOW:
+                self.cursor_visible = True
+        if len(tail) > limit:
+            self.trimmed["line-chars"] += len(tail) - limit
+            tail = tail[-limit:]
+        self._tail = tail
+        return lines
+
+
+class OutputRing(deque):
+    """The last lines of gpclient output, also kept to OUTPUT_RING_MAX_CHARS.
+
+    The oldest lines go first, whichever limit is reached; those dropped for
+    the size are counted in `trimmed`.
+    """
+
+    def __init__(self, maxlen: int, trimmed: Optional[Counter] = None):
+        super().__init__((), maxlen)
+        self.chars = 0
+        self.trimmed = trimmed if trimmed is not None else Counter()
+
+    def append(self, line: str) -> None:
+        if len(self) == self.maxlen:
+            self.chars -= len(self[0])
+        super().append(line)
+        self.chars += len(line)
+        while self.chars > OUTPUT_RING_MAX_CHARS and len(self) > 1:
+            self.chars -= len(self.popleft())
+            self.trimmed["ring-lines"] += 1
+
+    def clear(self) -> None:
+        super().clear()
+        self.chars = 0
+
+
+class JournalHandler(logging.Handler):
+    """logging handler speaking the native systemd journal protocol.
+
+    Fields come from LOG_CONTEXT and from a `journal` dict passed as
+    `extra={"journal": {...}}`. Values containing a newline use the protocol's
+    length-prefixed binary form.
+    """
+
+    def __init__(self, path: str = JOURNAL_SOCKET):
+        super().__init__()
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    @staticmethod
+    def _field(key: str, value: Any) -> bytes:
+        data = str(value).encode("utf-8", errors="replace")
+        if b"\n" not in data:
+            return key.encode() + b"=" + data + b"\n"
+        return key.encode() + b"\n" + struct.pack("<Q", len(data)) + data + b"\n"
+
+    def encode(self, record: logging.LogRecord) -> bytes:
+        fields = {
+            "MESSAGE": self.format(record),
+            "PRIORITY": JOURNAL_PRIORITIES.get(record.levelno, 6),
+            "SYSLOG_IDENTIFIER": SYSLOG_IDENTIFIER,
+            "LOGGER": record.name,
+            "CODE_FILE": record.pathname,
+            "CODE_LINE": record.lineno,
+            "CODE_FUNC": record.funcName,
+        }
+        fields.update(LOG_CONTEXT)
+        fields.update(getattr(record, "journal", None) or {})
+        return b"".join(
+            self._field(key, value) for key, value in fields.items() if value != ""
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._socket.sendto(self.encode(record), self.path)
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self._socket.close()
+        super().close()
+
+
+def configure_journal_logging() -> bool:
+    """Log to the journal natively when systemd connected stderr to it.
+
+    JOURNAL_STREAM is how systemd says so; run by hand in a terminal the
+    service keeps logging to stderr.
+    """
+    if not os.environ.get("JOURNAL_STREAM") or not os.path.exists(JOURNAL_SOCKET):
+        return False
+
+    journal = JournalHandler()
+    journal.setFormatter(logging.Formatter("%(message)s"))
+    logger.removeHandler(handler)
+    logger.addHandler(journal)
+    return True
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `burst` at once, `rate` per second after"""
+
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._stamp = clock()
+
+    def allow(self) -> bool:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class TraceSpan:
+    """One timed span of an activation trace, ended explicitly or by `with`"""
+
+    def __init__(self, trace: "ActivationTrace", name: str, track: str, args):
+        self._trace = trace
+        self.name = name
+        self.track = track
+        self.args = args
+        self.start = time.perf_counter()
+        self.ended = False
+
+    def annotate(self, **args: Any) -> None:
+        """Attach more attributes (e.g. the outcome) before the span ends"""
+        self.args.update(args)
+
+    def end(self, **args: Any) -> None:
+        if self.ended:
+            return
+        self.ended = True
+        self.args.update(args)
+        self._trace._record_span(self)
+
+    def __enter__(self) -> "TraceSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, _tb) -> None:
+        if exc_type is not None and not self.ended:
+            error = "cancelled" if exc_type is asyncio.CancelledError else repr(exc)
+            self.args.setdefault("error", error)
+        self.end()
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is off - every operation is a no-op"""
+
+    def annotate(self, **args: Any) -> None:
+        pass
+
+    def end(self, **args: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class ActivationTrace:
+    """Collect the spans of one activation and write them as a Chrome trace.
+
+    Disabled (no path) it costs one attribute check per span. Spans still open
+    when the activation finishes - typically the gpclient process, which keeps
+    running once the tunnel is up - are closed at that point and marked open.
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._origin = 0.0
+        self._events: List[Dict[str, Any]] = []
+        self._open: List[TraceSpan] = []
+        self._root: Optional[TraceSpan] = None
+        self._sequence = 0  # activations traced by this process
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def active(self) -> bool:
+        """True between start() and finish() of a traced activation"""
+        return self._root is not None
+
+    def start(self, **args: Any) -> None:
+        """Begin a new activation, dropping whatever an earlier one left"""
+        self._events = []
+        self._open = []
+        self._root = None
+        if not self.enabled:
+            return
+        self._origin = time.perf_counter()
+        self._sequence += 1
+        self._root = TraceSpan(self, "activation", "activation", args)
+        self._open.append(self._root)
+
+    def annotate(self, **args: Any) -> None:
+        """Attach attributes to the activation itself (gateway, auth mode...)"""
+        if self._root is not None:
+            self._root.annotate(**args)
+
+    def span(self, name: str, track: str, **args: Any):
+        """Open a span; end it with .end() or use it as a context manager"""
+        if self._root is None:
+            return NULL_SPAN
+        span = TraceSpan(self, name, track, args)
+        self._open.append(span)
+        return span
+
+    def instant(self, name: str, track: str, **args: Any) -> None:
+        """Record a point in time (a retry decision, a detected banner)"""
+        if self._root is None:
+            return
+        self._events.append(
+            {
+                "name": name,
+                "cat": "nm-gpclient",
+                "ph": "i",
+                "s": "t",
+                "ts": self._micros(time.perf_counter()),
+                "pid": os.getpid(),
+                "tid": self._track_id(track),
+                "args": args,
+            }
+        )
+
+    def finish(self, outcome: str, uuid: str = "") -> Optional[str]:
+        """Close the activation and write the trace, return the file written"""
+        if self._root is None:
+            return None
+
+        root = self._root
+        self._root = None
+        for span in list(self._open):
+            if span is not root:
+                span.end(open=True)
+        root.end(outcome=outcome)
+
+        events = self._metadata_events() + self._events
+        self._events = []
+        self._open = []
+
+        target = self.path
+        if os.path.isdir(target):
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            name = (
+                f"nm-gpclient-{uuid or 'activation'}-{stamp}-"
+                f"{os.getpid()}.{self._sequence}.json"
+            )
+            target = os.path.join(target, name)
+
+        try:
+            # Owner only, like PTY recordings: it names the gateways
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w") as handle:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, handle)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Cannot write the activation trace to {target}: {e}")
+            return None
+
+        logger.info(f"Activation trace written to {target}")
+        return target
+
+    def _record_span(self, span: TraceSpan) -> None:
+        if span in self._open:
+            self._open.remove(span)
+        end = time.perf_counter()
+        self._events.append(
+            {
+                "name": span.name,
+                "cat": "nm-gpclient",
+                "ph": "X",
+                "ts": self._micros(span.start),
+                "dur": round((end - span.start) * 1_000_000, 1),
+                "pid": os.getpid(),
+                "tid": self._track_id(span.track),
+                "args": {key: _trace_value(value) for key, value in span.args.items()},
+            }
+        )
+
+    def _micros(self, moment: float) -> float:
+        return round((moment - self._origin) * 1_000_000, 1)
+
+    @staticmethod
+    def _track_id(track: str) -> int:
+        try:
+            return TRACE_TRACKS.index(track) + 1
+        except ValueError:
+            return len(TRACE_TRACKS) + 1
+
+    @staticmethod
+    def _metadata_events() -> List[Dict[str, Any]]:
+        pid = os.getpid()
+        events = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "nm-gpclient-service"},
+            }
+        ]
+        for index, track in enumerate(TRACE_TRACKS, start=1):
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": index,
+                    "args": {"name": track},
+                }
+            )
+            events.append(
+                {
+                    "name": "thread_sort_index",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": index,
+                    "args": {"sort_index": index},
+                }
+            )
+        return events
+
+
+def _trace_value(value: Any) -> Any:
+    """Span attributes end up in JSON - keep plain values, stringify the rest"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_trace_value(item) for item in value]
+    return str(value)
+
+
+class PtyRecorder:
+    """Write gpclient's PTY session as an asciicast v2 recording.
+
+    Output is stored as the raw bytes decoded with surrogateescape, so a
+    replay reproduces them exactly - including a multi-byte character that a
+    read split in two. Events are written as they happen, a session that
+    hangs still leaves a usable file behind. The file is the owner's only:
+    redaction covers the secrets the service knows of, not all of them.
+
+    Output whose end could be the start of a secret is held back until the
+    next read, so a secret that gpclient echoes across two reads is still
+    redacted whole.
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._handle = None
+        self._start = 0.0
+        self._secrets: List[str] = []
+        self._sequence = 0
+        self._pending = ""
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def recording(self) -> bool:
+        return self._handle is not None
+
+    def start(self, title: str, uuid: str = "") -> Optional[str]:
+        """Open a new recording for one gpclient process"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        self._pending = ""
+        if not self.enabled:
+            return None
+
+        self._sequence += 1
+        target = self.path
+        if os.path.isdir(target):
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            target = os.path.join(
+                target,
+                f"gpclient-{uuid or 'session'}-{stamp}-"
+                f"{os.getpid()}.{self._sequence}.cast",
+            )
+
+        try:
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # An existing file keeps its mode through O_CREAT
+            os.fchmod(fd, 0o600)
+            self._handle = os.fdopen(fd, "w", encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"Cannot record the gpclient session to {target}: {e}")
+            return None
+
+        self._start = time.monotonic()
+        header = {
+            "version": 2,
+            "width": PTY_COLUMNS,
+            "height": PTY_ROWS,
+            "timestamp": int(time.time()),
+            "title": self._redact(title),
+            "env": {"TERM": "xterm-256color"},
+        }
+        self._write_line(header)
+        logger.info(f"Recording the gpclient session to {target}")
+        return target
+
+    def add_secret(self, secret: str) -> None:
+        """Make sure `secret` never ends up in the recording"""
+        if secret and secret not in self._secrets:
+            self._secrets.append(secret)
+            # Longest first, so a secret containing another is redacted whole
+            self._secrets.sort(key=len, reverse=True)
+
+    def output(self, data: bytes) -> None:
+        if self._handle is None:
+            return
+        # str() rather than .decode(): `data` may be the PTY reader's memoryview
+        text = self._redact(self._pending + str(data, "utf-8", "surrogateescape"))
+        held = self._secret_prefix_at_end(text)
+        self._pending = text[len(text) - held :]
+        if held < len(text):
+            self._event("o", text[: len(text) - held])
+
+    def input(self, data: bytes) -> None:
+        if self._handle is not None:
+            self._flush_pending()
+            self._event("i", self._redact(str(data, "utf-8", "surrogateescape")))
+
+    def marker(self, label: str) -> None:
+        if self._handle is not None:
+            self._flush_pending()
+            self._event("m", label)
+
+    def stop(self) -> None:
+        self._secrets = []
+        if self._handle is None:
+            return
+        self._flush_pending()
+        if self._handle is None:
+            return
+        try:
+            self._handle.close()
+        except OSError:
+            pass
+        self._handle = None
+
+    def _event(self, kind: str, text: str) -> None:
+        self._write_line([round(time.monotonic() - self._start, 6), kind, text])
+
+    def _flush_pending(self) -> None:
+        """Write held-back output: what came next did not complete a secret"""
+        pending, self._pending = self._pending, ""
+        if pending:
+            self._event("o", pending)
+
+    def _redact(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, RECORDING_REDACTED)
+        return text
+
+    def _secret_prefix_at_end(self, text: str) -> int:
+        """Length of the longest end of `text` that some secret starts with"""
+        longest = 0
+        for secret in self._secrets:
+            for size in range(min(len(secret) - 1, len(text)), longest, -1):
+                if text.endswith(secret[:size]):
+                    longest = size
+                    break
+        return longest
+
+    def _write_line(self, value: Any) -> None:
+        try:
+            self._handle.write(json.dumps(value) + "\n")
+            self._handle.flush()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Stopped recording the gpclient session: {e}")
+            self.stop()
+
+
+class SamplingProfiler:
+    """Wall-clock profile of the service, written as collapsed stacks.
+
+    The sampler thread only reads sys._current_frames() - stock CPython, no
+    extra package - and task dumps run on the loop between callbacks, so a
+    profile costs a few percent of one core while it runs and nothing when it
+    does not.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.reason = ""
+        self._thread = None
+        self._stopping = None  # threading.Event for the sampler thread
+        self._thread_stacks: Dict[str, int] = {}
+        self._task_stacks: Dict[str, int] = {}
+        self._timers: List[asyncio.TimerHandle] = []
+        self._loop_thread = 0
+        self._started = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._sequence = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, reason: str) -> bool:
+        """Start profiling from the loop's thread; False if already running"""
+        import threading
+
+        if self._thread is not None:
+            return False
+        loop = asyncio.get_running_loop()
+        self.reason = reason
+        self._thread_stacks = {}
+        self._task_stacks = {}
+        self._loop_thread = threading.get_ident()
+        self._started = time.monotonic()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sample_threads,
+            args=(self._stopping, self._thread_stacks),
+            name="nm-gpclient-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+        self._timers = [
+            loop.call_later(PROFILE_TASK_INTERVAL, self._sample_tasks, loop),
+            loop.call_later(PROFILE_MAX_SECONDS, self.stop, "time limit"),
+        ]
+        logger.info(f"Profiling started ({reason})")
+        return True
+
+    def stop(self, reason: str) -> Optional[str]:
+        """Stop profiling and write the profile; returns the file written"""
+        if self._thread is None:
+            return None
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        elapsed = time.monotonic() - self._started
+
+        stacks = dict(self._thread_stacks)
+        for stack, count in self._task_stacks.items():
+            stacks[stack] = stacks.get(stack, 0) + count
+        self._thread_stacks = {}
+        self._task_stacks = {}
+        self._labels = {}
+
+        self._sequence += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = os.path.join(
+            self.directory,
+            f"nm-gpclient-{stamp}-{os.getpid()}.{self._sequence}.collapsed",
+        )
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            with open(target, "w", encoding="utf-8") as handle:
+                for stack, count in sorted(stacks.items()):
+                    handle.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning(f"Cannot write the profile to {target}: {e}")
+            return None
+
+        logger.info(
+            f"Profiling stopped ({reason}) after {elapsed:.1f}s, "
+            f"{len(stacks)} stacks written to {target}"
+        )
+        return target
+
+    def _sample_threads(self, stopping, stacks: Dict[str, int]) -> None:
+        """The sampler thread: every thread's stack, each PROFILE_SAMPLE_INTERVAL"""
+        import threading
+
+        own = threading.get_ident()
+        while not stopping.wait(PROFILE_SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident == self._loop_thread:
+                    root = "thread:event-loop"
+                else:
+                    root = f"thread:{names.get(ident, ident)}"
+                frames = []
+                while frame is not None:
+                    frames.append(frame)
+                    frame = frame.f_back
+                frames.reverse()
+                stack = self._collapse(root, frames)
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+    def _sample_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+        """On the loop: the await chain of every pending task"""
+        weight = max(1, round(PROFILE_TASK_INTERVAL / PROFILE_SAMPLE_INTERVAL))
+        for task in asyncio.all_tasks(loop):
+            coro = task.get_coro()
+            name = task.get_name()
+            if DEFAULT_TASK_NAME_RE.match(name):
+                name = getattr(coro, "__qualname__", name)
+            frames = []
+            # Follow what each coroutine awaits down to the innermost one
+            while coro is not None:
+                frame = getattr(coro, "cr_frame", None) or getattr(
+                    coro, "gi_frame", None
+                )
+                if frame is None:
+                    break
+                frames.append(frame)
+                coro = getattr(coro, "cr_await", None) or getattr(
+                    coro, "gi_yieldfrom", None
+                )
+            stack = self._collapse(f"task:{name}", frames)
+            self._task_stacks[stack] = self._task_stacks.get(stack, 0) + weight
+        self._timers[0] = loop.call_later(
+            PROFILE_TASK_INTERVAL, self._sample_tasks, loop
+        )
+
+    def _collapse(self, root: str, frames: List[Any]) -> str:
+        """root;outer;...;inner - each frame as: function (file:line)"""
+        parts = [root.replace(";", ":")]
+        for frame in frames:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                name = getattr(code, "co_qualname", code.co_name)
+                where = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+                label = f"{name} ({where})".replace(";", ":")
+                self._labels[code] = label
+            parts.append(label)
+        return ";".join(parts)
+
+
+class MemorySnapshots:
+    """tracemalloc snapshots taken on request, each compared to the one before.
+
+    The first one starts tracing - which slows allocations down and costs
+    memory of its own until stop() - and is the baseline for the next.
+    """
+
+    def __init__(self):
+        self._previous = None
+
+    @property
+    def tracing(self) -> bool:
+        return self._previous is not None
+
+    def take(self) -> List[str]:
+        """Snapshot now; the biggest changes since the previous one"""
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._previous = None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            logger.info("Memory tracing started, the next snapshot compares to now")
+            return []
+
+        changes = [
+            str(stat)
+            for stat in snapshot.compare_to(previous, "lineno")[:MEMORY_DIFF_TOP]
+            if stat.size_diff or stat.count_diff
+        ]
+        current, peak = tracemalloc.get_traced_memory()
+        logger.info(
+            f"Memory since the previous snapshot ({current // 1024} KiB traced, "
+            f"peak {peak // 1024} KiB):\n" + "\n".join(changes)
+        )
+        return changes
+
+    def stop(self) -> None:
+        import tracemalloc
+
+        tracemalloc.stop()
+        self._previous = None
+
+
+class PtyReader:
+    """Read gpclient's PTY output into one reusable buffer.
+
+    Each read fills the same bytearray with readinto() and hands out a
+    memoryview of it, valid until the next read - AnsiTokenizer takes it from
+    there, decoding included.
+    """
+
+    def __init__(self, fd: int, size: int = PTY_READ_SIZE):
+        os.set_blocking(fd, False)
+        self.fd = fd
+        self._file = os.fdopen(fd, "rb", buffering=0)
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def read(self) -> Optional[memoryview]:
+        """The next output, or None once gpclient closed the terminal.
+
+        Only reads once the loop reports the PTY readable. The master raises
+        EIO when gpclient exits, possibly while what it wrote last is still on
+        its way through the terminal, so EIO is only believed the second time
+        in a row.
+        """
+        closed = False
+        while True:
+            await self._readable()
+            try:
+                count = self._file.readinto(self._buffer)
+            except OSError as e:
+                if closed or e.errno != errno.EIO:
+                    return None
+                closed = True
+                continue
+            if count is None:
+                continue
+            if not count:
+                return None
+            return self._view[:count]
+
+    def close(self) -> None:
+        self._stop_waiting()
+        self._file.close()
+
+    async def _readable(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        ready = self._loop.create_future()
+        # The callback can run again before the waiting task resumes
+        self._loop.add_reader(self.fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            self._stop_waiting()
+
+    def _stop_waiting(self) -> None:
+        if self._loop is not None:
+            self._loop.remove_reader(self.fd)
+            self._loop = None
+
+
+def derive_tunnel_mtu(path_mtu: int, transport: str = "esp") -> int:
+    """Largest tunnel MTU whose encapsulated packets fit `path_mtu`"""
+    if transport == "tls":
+        mtu = path_mtu - TLS_OVERHEAD
+    else:
+        space = path_mtu - ESP_OVERHEAD
+        mtu = (space // ESP_BLOCK_SIZE) * ESP_BLOCK_SIZE - ESP_TRAILER
+    return max(MIN_TUNNEL_MTU, mtu)
+
+
+def transport_from_line(line: str) -> Optional[str]:
+    """ "esp" or "tls" when a gpclient line shows the tunnel transport"""
+    for message, transport in TRANSPORT_MESSAGES:
+        if message in line:
+            return transport
+    return None
+
+
+def server_host(server: str) -> str:
+    """Host part of the configured server ("https://vpn.example.com:443/x")"""
+    host = server.strip()
+    if "://" in host:
+        host = host.split("://", 1)[1]
+    host = host.split("/", 1)[0]
+    if host.startswith("["):
+        return host[1:].split("]", 1)[0]
+    if host.count(":") == 1:
+        host = host.split(":", 1)[0]
+    return host
+
+
+def uplink_identity() -> str:
+    """Identify the network we are on: "<interface>/<default gateway MAC>".
+
+    Empty when there is no default route outside a tunnel. The gateway MAC
+    tells networks apart even when they use the same private addressing.
+    """
+    best = None
+    try:
+        with open(PROC_NET_ROUTE) as handle:
+            next(handle, None)
+            for line in handle:
+                fields = line.split()
+                if len(fields) < 8 or fields[1] != "00000000":
+                    continue
+                iface, gateway_hex, metric = fields[0], fields[2], int(fields[6])
+                if (
+                    iface in TUNNEL_INTERFACES
+                    or iface.startswith(TUNNEL_INTERFACE_PREFIX)
+                    or gateway_hex == "00000000"
+                ):
+                    continue
+                if best is None or metric < best[2]:
+                    best = (iface, gateway_hex, metric)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Cannot read the routing table: {e}")
+        return ""
+    if best is None:
+        return ""
+
+    iface, gateway_hex, _ = best
+    gateway = socket.inet_ntoa(struct.pack("<I", int(gateway_hex, 16)))
+    try:
+        with open(PROC_NET_ARP) as handle:
+            next(handle, None)
+            for line in handle:
+                fields = line.split()
+                if len(fields) >= 6 and fields[0] == gateway and fields[5] == iface:
+                    if fields[3] != "00:00:00:00:00:00":
+                        return f"{iface}/{fields[3]}"
+    except OSError as e:
+        logger.debug(f"Cannot read the ARP table: {e}")
+    return f"{iface}/{gateway}"
+
+
+def read_pushed_config(path: Optional[str]) -> Dict[str, str]:
+    """Parse the KEY=value lines the vpnc hook saved (empty when missing)"""
+    if not path:
+        return {}
+    pushed = {}
+    try:
+        with open(path) as handle:
+            for line in handle:
+                key, sep, value = line.rstrip("\n").partition("=")
+                if sep:
+                    pushed[key] = value.strip()
+    except OSError:
+        return {}
+    return pushed
+
+
+def dns_search_domains(pushed: Dict[str, str], profile_domains: List[str]) -> List[str]:
+    """Ip4Config domains: search domains as they are, routing-only ones as ~domain.
+
+    The gateway's default domain is a search domain, its split-DNS list only
+    routes queries. In the profile's dns-domains an entry is a search domain
+    unless it is written as ~domain.
+    """
+    search = pushed.get("CISCO_DEF_DOMAIN", "").split()
+    routing = pushed.get("CISCO_SPLIT_DNS", "").replace(",", " ").split()
+    for domain in profile_domains:
+        if domain.startswith("~"):
+            routing.append(domain[1:])
+        else:
+            search.append(domain)
+
+    domains: List[str] = []
+    for domain in search:
+        domain = domain.rstrip(".")
+        if domain and domain not in domains:
+            domains.append(domain)
+    for domain in routing:
+        domain = domain.rstrip(".")
+        if domain and domain not in domains and f"~{domain}" not in domains:
+            domains.append(f"~{domain}")
+    return domains
+
+
+def parse_cidr_list(value: str) -> List[Tuple[str, int]]:
+    """Parse "10.0.0.0/8 192.0.2.1 fd00::/8 ..." into (address, prefix) pairs"""
+    routes = []
+    for item in value.split():
+        address, _, prefix = item.partition("/")
+        try:
+            host_prefix = 128 if ":" in address else 32
+            routes.append((address, int(prefix) if prefix else host_prefix))
+        except ValueError:
+            logger.warning(f"Ignoring route {item}")
+    return routes
+
+
+def compact_routes(
+    routes: List[Tuple[str, int]], never_default: bool = False
+) -> List[Tuple[str, int]]:
+    """Smallest set of (network, prefix) routes covering the same addresses.
+
+    Host bits are cleared, duplicates and routes inside a larger one are
+    dropped, and adjacent networks are merged (10.0.0.0/24 + 10.0.1.0/24 is
+    10.0.0.0/23). With never-default the default route is left out before
+    merging, so it cannot swallow the rest. IPv4 routes come first, then IPv6.
+    """
+    import ipaddress
+
+    networks: Dict[int, list] = {4: [], 6: []}
+    for dest, prefix in routes:
+        try:
+            network = ipaddress.ip_network(f"{dest}/{prefix}", strict=False)
+        except ValueError as e:
+            logger.warning(f"Ignoring route {dest}/{prefix}: {e}")
+            continue
+        if never_default and network.prefixlen == 0:
+            logger.info("never-default: ignoring the default route")
+            continue
+        networks[network.version].append(network)
+    return [
+        (str(network.network_address), network.prefixlen)
+        for version in (4, 6)
+        for network in ipaddress.collapse_addresses(networks[version])
+    ]
+
+
+def unwrap_variants(section: Dict[str, Any]) -> Dict[str, Any]:
+    """A settings section with sdbus's (signature, value) variants unwrapped"""
+    return {
+        key: value[1] if isinstance(value, tuple) and len(value) == 2 else value
+        for key, value in section.items()
+    }
+
 
+def ipv4_u32(address: str) -> int:
+    """An IPv4 address as Ip4Config's uint32 (network byte order in memory)"""
+    return struct.unpack("<I", socket.inet_aton(address))[0]
 
-class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFACE_VPN):
+
+def settings_digest(connection: Dict[str, Dict[str, Any]]) -> str:
+    """Digest of a connection's settings, leaving out vpn.secrets.
+
+    A new one-time code does not make a new profile revision - the secrets
+    are not part of ConnectionConfig.
+    """
+    import hashlib
+
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(item) for item in value)
+        return value
+
+    settings = dict(connection)
+    vpn = unwrap_variants(connection.get("vpn", {}))
+    vpn.pop("secrets", None)
+    settings["vpn"] = vpn
+    return hashlib.sha256(repr(freeze(settings)).encode()).hexdigest()
+
+
+class ConnectionConfig(NamedTuple):
+    """The connection settings an activation works from, parsed once.
+
+    Built by from_settings() and kept per profile revision (UUID and
+    settings_digest()), so a reconnect or a retry with unchanged settings
+    skips the parsing. The IPv4 addresses that end up in Ip4Config - custom
+    route destinations and DNS servers - are packed up front in `packed`.
+    Secrets are not part of it.
+    """
+
+    uuid: str
+    gateway: str
+    auth_mode: str
+    username: str
+    as_gateway: bool
+    preferred_gateway: str
+    stored_gateway_list: str
+    fix_openssl_mode: str
+    browser: str
+    never_default: bool
+    ignore_auto_routes: bool
+    custom_routes: Tuple[Tuple[str, int], ...]
+    ipv6_never_default: bool
+    ipv6_ignore_auto_routes: bool
+    disable_ipv6: bool
+    dns_servers: Tuple[str, ...]
+    dns_domains: Tuple[str, ...]
+    hip_enabled: bool
+    hip_cache_ttl: int
+    transport_setting: str
+    dpd_interval: Optional[int]
+    mtu_setting: str
+    packed: Mapping[str, int]
+
+    @classmethod
+    def from_settings(
+        cls, connection: Dict[str, Dict[str, Tuple[str, Any]]]
+    ) -> "ConnectionConfig":
+        """Parse Connect()'s settings dict; invalid values fall back with a warning"""
+        if "vpn" not in connection:
+            raise Exception("No VPN data in connection")
+        data = unwrap_variants(connection["vpn"]).get("data", {}) or {}
+        logger.debug("Data dict: %s", data)
+        ipv4 = unwrap_variants(connection.get("ipv4", {}))
+        ipv6 = unwrap_variants(connection.get("ipv6", {}))
+        uuid = unwrap_variants(connection.get("connection", {})).get("uuid", "")
+
+        # The portal address, or a gateway address when as-gateway is set
+        gateway = data.get("gateway", "")
+        if not gateway:
+            raise Exception("No gateway specified")
+
+        never_default = bool(ipv4.get("never-default", False))
+        custom_routes = []
+        # Prefer route-data if present
+        route_data = ipv4.get("route-data")
+        if route_data:
+            for route in route_data:
+                route = unwrap_variants(route)
+                if route.get("dest", ""):
+                    custom_routes.append((route["dest"], int(route.get("prefix", 0))))
+        else:
+            # Fallback: parse "routes" (aau): [dest_u32, prefix, next_hop_u32, metric]
+            for route in ipv4.get("routes", []):
+                if not (isinstance(route, (list, tuple)) and len(route) >= 2):
+                    continue
+                # IMPORTANT: NM uses host order uint32 here on little-endian machines
+                dest = socket.inet_ntoa(struct.pack("<I", int(route[0])))
+                custom_routes.append((dest, int(route[1])))
+                logger.info(f"Custom route: {dest}/{int(route[1])}")
+        if custom_routes:
+            compacted = compact_routes(custom_routes, never_default)
+            logger.info(
+                f"Custom routes: {len(custom_routes)} configured, "
+                f"{len(compacted)} after merging"
+            )
+            custom_routes = compacted
+
+        # Legacy TLS renegotiation workaround (issue #2): auto retries once
+        # after gpclient reports the error, true passes the flag from the
+        # start, false disables the workaround entirely
+        fix_openssl_mode = data.get("fix-openssl", "auto").lower()
+        if fix_openssl_mode not in ("auto", "true", "false"):
+            logger.warning(
+                f"Unknown fix-openssl value {fix_openssl_mode!r}, "
+                "falling back to 'auto'"
+            )
+            fix_openssl_mode = "auto"
+
+        dns_servers = [s.strip() for s in data.get("dns", "").split(";") if s.strip()]
+        dns_domains = [d.strip() for d in data.get("dns-domains", "").split() if d.strip()]
+
+        hip_cache_ttl = HIP_CACHE_TTL
+        ttl_str = data.get("hip-cache-ttl", "").strip()
+        if ttl_str.isdigit():
+            hip_cache_ttl = int(ttl_str)
+        elif ttl_str:
+            logger.warning(f"Invalid hip-cache-ttl {ttl_str!r}, using the default")
+
+        # Transport (default: ESP with the HTTPS fallback)
+        transport = data.get("transport", "auto").strip().lower()
+        if transport not in TRANSPORT_SETTINGS:
+            logger.warning(f"Invalid transport value {transport!r}, falling back to 'auto'")
+            transport = "auto"
+        dpd_interval = None
+        dpd_str = data.get("dpd-interval", "").strip()
+        if dpd_str.isdigit() and int(dpd_str) > 0:
+            dpd_interval = int(dpd_str)
+        elif dpd_str:
+            logger.warning(f"Invalid dpd-interval {dpd_str!r}, leaving it to the gateway")
+
+        # Tunnel MTU (optional): auto probes the path, a number is passed
+        # to gpclient as is, off leaves it to gpclient
+        mtu = data.get("mtu", "auto").strip().lower() or "auto"
+        if mtu not in ("auto", "off") and not (
+            mtu.isdigit() and int(mtu) >= MIN_TUNNEL_MTU
+        ):
+            logger.warning(f"Invalid mtu value {mtu!r}, falling back to 'auto'")
+            mtu = "auto"
+
+        # Invalid addresses are left to the caller, which warns about them
+        packed = {}
+        for address in [dest for dest, _ in custom_routes] + dns_servers:
+            if ":" not in address:
+                try:
+                    packed[address] = ipv4_u32(address)
+                except OSError:
+                    pass
+
+        return cls(
+            uuid=uuid or "",
+            gateway=gateway,
+            auth_mode=data.get("auth-mode", "saml"),
+            username=data.get("username", ""),
+            as_gateway=data.get("as-gateway", "false").lower() == "true",
+            preferred_gateway=data.get("preferred-gateway", "").strip(),
+            stored_gateway_list=data.get("gateway-list", "").strip(),
+            fix_openssl_mode=fix_openssl_mode,
+            browser=data.get("browser", ""),
+            never_default=never_default,
+            ignore_auto_routes=bool(ipv4.get("ignore-auto-routes", False)),
+            custom_routes=tuple(custom_routes),
+            ipv6_never_default=bool(ipv6.get("never-default", False)),
+            ipv6_ignore_auto_routes=bool(ipv6.get("ignore-auto-routes", False)),
+            disable_ipv6=ipv6.get("method", "") == "disabled"
+            or data.get("disable-ipv6", "false").lower() == "true",
+            dns_servers=tuple(dns_servers),
+            dns_domains=tuple(dns_domains),
+            hip_enabled=data.get("hip", "true").lower() == "true",
+            hip_cache_ttl=hip_cache_ttl,
+            transport_setting=transport,
+            dpd_interval=dpd_interval,
+            mtu_setting=mtu,
+            packed=MappingProxyType(packed),
+        )
+
+
+class PathMtuProber:
+    """Find the path MTU to an address with DF-flagged UDP probes"""
+
+    def __init__(
+        self,
+        port: int = PMTU_PROBE_PORT,
+        rounds: int = PMTU_PROBE_ROUNDS,
+        wait: float = PMTU_PROBE_WAIT,
+    ):
+        self.port = port
+        self.rounds = rounds
+        self.wait = wait
+
+    async def probe(self, address: str) -> Optional[int]:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+            sock.connect((address, self.port))
+            # Starts at the outgoing interface's MTU (or the cached path MTU)
+            mtu = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+            for _ in range(self.rounds):
+                payload = min(mtu - 28, MAX_UDP_PAYLOAD)
+                try:
+                    sock.send(bytes(payload))
+                except OSError as e:
+                    # EMSGSIZE: the kernel already knows a smaller path MTU;
+                    # ECONNREFUSED: an earlier probe got "port unreachable"
+                    if e.errno not in (errno.EMSGSIZE, errno.ECONNREFUSED):
+                        raise
+                await asyncio.sleep(self.wait)
+                current = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+                if current >= mtu:
+                    break
+                mtu = current
+            return mtu
+        except OSError as e:
+            logger.debug(f"Path MTU probe to {address} failed: {e}")
+            return None
+        finally:
+            sock.close()
+
+
+class MtuCache:
+    """Path MTUs by server and uplink, in a small JSON file"""
+
+    def __init__(self, path: str = MTU_CACHE_PATH, ttl: float = MTU_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable MTU cache {self.path}: {e}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._load().get(key)
+        if not isinstance(entry, dict):
+            return None
+        if time.time() - entry.get("time", 0) > self.ttl:
+            return None
+        path_mtu = entry.get("path_mtu")
+        return path_mtu if isinstance(path_mtu, int) else None
+
+    def put(self, key: str, path_mtu: int) -> None:
+        entries = self._load()
+        entries[key] = {"path_mtu": path_mtu, "time": time.time()}
+        if len(entries) > MTU_CACHE_MAX_ENTRIES:
+            by_age = sorted(entries, key=lambda k: entries[k].get("time", 0))
+            for old in by_age[: len(entries) - MTU_CACHE_MAX_ENTRIES]:
+                del entries[old]
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, "w") as handle:
+                json.dump(entries, handle)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot write the MTU cache {self.path}: {e}")
+
+
+class PromptHistory:
+    """The prompts recent activations saw, by connection UUID, in a JSON file.
+
+    Each prompt is stored as its kind, label, auth phase and whether the user
+    was asked - never with an answer.
+    """
+
+    def __init__(self, path: str = PROMPT_HISTORY_PATH):
+        self.path = path
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable prompt history {self.path}: {e}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def runs(self, uuid: str) -> List[List[Dict[str, Any]]]:
+        entry = self._load().get(uuid)
+        if not isinstance(entry, dict) or not isinstance(entry.get("runs"), list):
+            return []
+        return [run for run in entry["runs"] if isinstance(run, list)]
+
+    def early_prompt(self, uuid: str) -> Optional[Dict[str, Any]]:
+        """The one-time code prompt to ask for at activation start, if any.
+
+        Only when each of the recent runs (at least EARLY_OTP_MIN_RUNS) asked
+        the user for a one-time code before anything else: a password prompt
+        shown first would otherwise queue behind the early request.
+        """
+        runs = self.runs(uuid)
+        if len(runs) < EARLY_OTP_MIN_RUNS:
+            return None
+        first_asked = []
+        for run in runs:
+            asked = [prompt for prompt in run if prompt.get("asked")]
+            if not asked or asked[0].get("kind") != "otp":
+                return None
+            first_asked.append(asked[0])
+        return first_asked[-1]
+
+    def password_on_stdin(self, uuid: str) -> bool:
+        """Whether the stored password can go to gpclient --passwd-on-stdin.
+
+        gpclient reads that line for the first password field it meets and
+        reuses it for the later rounds. So only when each of the recent runs
+        (at least EARLY_OTP_MIN_RUNS) answered the first credential of every
+        round from the stored password - a token portal wants a one-time code
+        in that field instead.
+        """
+        runs = self.runs(uuid)
+        if len(runs) < EARLY_OTP_MIN_RUNS:
+            return False
+        for run in runs:
+            first: Dict[str, Dict[str, Any]] = {}
+            for prompt in run:
+                if prompt.get("kind") != "username":
+                    first.setdefault(prompt.get("phase", ""), prompt)
+            if not first or any(
+                prompt.get("kind") != "password" or prompt.get("asked")
+                for prompt in first.values()
+            ):
+                return False
+        return True
+
+    def record(self, uuid: str, prompts: List[Dict[str, Any]]) -> None:
+        entries = self._load()
+        runs = self.runs(uuid) + [prompts]
+        entries[uuid] = {"runs": runs[-PROMPT_HISTORY_RUNS:], "time": time.time()}
+        if len(entries) > PROMPT_HISTORY_MAX_ENTRIES:
+            by_age = sorted(entries, key=lambda k: entries[k].get("time", 0))
+            for old in by_age[: len(entries) - PROMPT_HISTORY_MAX_ENTRIES]:
+                del entries[old]
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, "w") as handle:
+                json.dump(entries, handle)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot write the prompt history {self.path}: {e}")
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def gpclient_lock_holder() -> Optional[int]:
+    """PID of the gpclient named in gpclient's lock file, None when it is free.
+
+    Mirrors gpclient's own check: the PID must be alive and be a gpclient.
+    """
+    try:
+        with open(GPCLIENT_LOCK_FILE) as handle:
+            pid = int(handle.read().strip())
+        exe = os.readlink(f"/proc/{pid}/exe")
+    except (OSError, ValueError):
+        return None
+    return pid if "gpclient" in exe else None
+
+
+class ActivationClaim:
+    """Host resources one activation holds while it connects and is up.
+
+    The tunnel interface is claimed with a file in ACTIVATION_DIR named after
+    it and holding the service's PID, taken under a lock on the directory so
+    concurrent activations never pick the same gpdN. A claim whose PID is gone
+    (a crashed service) is taken over.
+    """
+
+    def __init__(self):
+        self.interface: Optional[str] = None
+        self.private_lock: Optional[str] = None
+
+    @staticmethod
+    def _owners() -> Dict[str, int]:
+        """Live claims, interface -> PID"""
+        owners = {}
+        try:
+            names = os.listdir(ACTIVATION_DIR)
+        except OSError:
+            return owners
+        for name in names:
+            if not name.startswith(TUNNEL_INTERFACE_PREFIX):
+                continue
+            try:
+                with open(os.path.join(ACTIVATION_DIR, name)) as handle:
+                    pid = int(handle.read().strip())
+            except (OSError, ValueError):
+                continue
+            if pid_alive(pid):
+                owners[name] = pid
+        return owners
+
+    def others(self) -> Dict[str, int]:
+        """Claims of the other service processes (concurrent sessions)"""
+        return {
+            name: pid for name, pid in self._owners().items() if pid != os.getpid()
+        }
+
+    def claim(self) -> Optional[str]:
+        """Claim the lowest gpdN that is neither claimed nor present"""
+        if self.interface:
+            return self.interface
+        try:
+            os.makedirs(ACTIVATION_DIR, mode=0o700, exist_ok=True)
+            lock = os.open(
+                os.path.join(ACTIVATION_DIR, ".lock"), os.O_RDWR | os.O_CREAT, 0o600
+            )
+        except OSError as e:
+            logger.warning(f"Cannot claim a tunnel interface in {ACTIVATION_DIR}: {e}")
+            return None
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            taken = self.others()
+            for index in range(MAX_TUNNEL_INTERFACES):
+                name = f"{TUNNEL_INTERFACE_PREFIX}{index}"
+                if name in taken or os.path.exists(os.path.join(SYS_CLASS_NET, name)):
+                    continue
+                with open(os.path.join(ACTIVATION_DIR, name), "w") as handle:
+                    handle.write(str(os.getpid()))
+                self.interface = name
+                return name
+            logger.warning("No free tunnel interface name to claim")
+            return None
+        except OSError as e:
+            logger.warning(f"Cannot claim a tunnel interface: {e}")
+            return None
+        finally:
+            os.close(lock)
+
+    def private_gpclient_lock(self) -> Optional[str]:
+        """An empty lock file of our own when another gpclient holds the
+        shared one, None when gpclient can use the shared one"""
+        holder = gpclient_lock_holder()
+        if holder is None:
+            return None
+        path = os.path.join(ACTIVATION_DIR, f"gpclient-{os.getpid()}.lock")
+        try:
+            os.makedirs(ACTIVATION_DIR, mode=0o700, exist_ok=True)
+            open(path, "w").close()
+        except OSError as e:
+            logger.warning(f"Cannot create a private gpclient lock file: {e}")
+            return None
+        logger.info(
+            f"gpclient {holder} holds {GPCLIENT_LOCK_FILE} - running this "
+            "session's gpclient with a private lock file"
+        )
+        self.private_lock = path
+        return path
+
+    def release(self) -> None:
+        if self.interface:
+            path = os.path.join(ACTIVATION_DIR, self.interface)
+            try:
+                with open(path) as handle:
+                    ours = handle.read().strip() == str(os.getpid())
+                if ours:
+                    os.unlink(path)
+            except OSError:
+                pass
+            self.interface = None
+        if self.private_lock:
+            try:
+                os.unlink(self.private_lock)
+            except OSError:
+                pass
+            self.private_lock = None
+
+
+def private_lock_command(cmd: List[str], private_lock: str) -> List[str]:
+    """`cmd` in a private mount namespace where gpclient's lock file is
+    `private_lock` (unshare and sh exec, so the PID stays gpclient's)"""
+    return [
+        "unshare",
+        "--mount",
+        "--propagation",
+        "private",
+        "--",
+        "sh",
+        "-c",
+        'mount --bind "$0" "$1" && shift && exec "$@"',
+        private_lock,
+        GPCLIENT_LOCK_FILE,
+    ] + cmd
+
+
+def parse_tunable(kind: type, minimum: float, maximum: float, raw: str) -> Any:
+    """A SERVICE_TUNABLES value from its config file text; ValueError if invalid"""
+    if kind is tuple:
+        names = tuple(name for name in re.split(r"[\s,]+", raw) if name)
+        if not minimum <= len(names) <= maximum:
+            raise ValueError(f"expected {minimum} to {maximum} names")
+        for name in names:
+            if not PROCESS_NAME_RE.match(name):
+                raise ValueError(f"not a process name: {name!r}")
+        return names
+
+    value = kind(raw)
+    if not minimum <= value <= maximum:
+        raise ValueError(f"must be between {minimum:g} and {maximum:g}")
+    return value
+
+
+def service_config_files(path: str = SERVICE_CONFIG_PATH) -> List[str]:
+    """The config file, if any, and its drop-ins in the order they apply"""
+    files = [path] if os.path.isfile(path) else []
+    try:
+        dropins = sorted(os.listdir(path + ".d"))
+    except OSError:
+        return files
+    return files + [
+        os.path.join(path + ".d", name) for name in dropins if name.endswith(".conf")
+    ]
+
+
+def read_service_config(files: List[str]) -> Dict[str, Any]:
+    """{constant: value} for the valid tunables set in `files`"""
+    if not files:
+        return {}
+    import configparser
+
+    values: Dict[str, Any] = {}
+    for path in files:
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                parser.read_file(handle)
+        except (OSError, UnicodeDecodeError, configparser.Error) as e:
+            logger.warning(f"Ignoring {path}: {e}")
+            continue
+
+        for section in parser.sections():
+            if section != SERVICE_CONFIG_SECTION:
+                logger.warning(f"{path}: unknown section [{section}] ignored")
+        if not parser.has_section(SERVICE_CONFIG_SECTION):
+            continue
+
+        for key, raw in parser.items(SERVICE_CONFIG_SECTION):
+            if key not in SERVICE_TUNABLES:
+                logger.warning(f"{path}: unknown setting {key} ignored")
+                continue
+            constant, kind, minimum, maximum = SERVICE_TUNABLES[key]
+            try:
+                values[constant] = parse_tunable(kind, minimum, maximum, raw)
+            except ValueError as e:
+                logger.warning(f"{path}: invalid {key} = {raw!r} ({e}), ignored")
+    return values
+
+
+def apply_service_config(path: str = SERVICE_CONFIG_PATH) -> List[str]:
+    """(Re)load the service configuration; returns the keys that changed.
+
+    Every tunable gets the value from the files, or its default when they no
+    longer set it - a reload after removing a line undoes it.
+    """
+    files = service_config_files(path)
+    values = read_service_config(files)
+    changed = []
+    for key, (constant, *_) in SERVICE_TUNABLES.items():
+        value = values.get(constant, SERVICE_TUNABLE_DEFAULTS[constant])
+        if globals()[constant] != value:
+            globals()[constant] = value
+            changed.append(key)
+
+    sources = ", ".join(files) or "none"
+    if changed:
+        logger.info(
+            f"Service configuration ({sources}): "
+            + ", ".join(f"{key}={service_tunables()[key]}" for key in changed)
+        )
+    else:
+        logger.debug(f"Service configuration ({sources}): no changes")
+    return changed
+
+
+def service_tunables() -> Dict[str, str]:
+    """The tunables in effect, formatted like the config file takes them"""
+    current = {}
+    for key, (constant, *_) in SERVICE_TUNABLES.items():
+        value = globals()[constant]
+        current[key] = ", ".join(value) if isinstance(value, tuple) else f"{value:g}"
+    return current
+
+
+class GpclientDiagnostics(
+    DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFACE_GPCLIENT_DIAGNOSTICS
+):
+    """Debugging aids for the service itself, next to the NM VPN plugin API.
+
+    Restricted to root by the D-Bus policy (config/nm-gpclient.conf).
+    """
+
+    @dbus_method_async("s")
+    async def EnableTracing(self, path: str) -> None:
+        """Trace the next activations into `path` (a file or a directory)"""
+        path = path or os.environ.get(TRACE_ENV, "")
+        if not path:
+            raise ValueError("No trace path given and GPCLIENT_TRACE is not set")
+        logger.info(f"Activation tracing enabled: {path}")
+        self._trace.path = path
+
+    @dbus_method_async()
+    async def DisableTracing(self) -> None:
+        """Stop tracing; an activation in progress is not written"""
+        logger.info("Activation tracing disabled")
+        self._trace.path = ""
+        self._trace.start()
+
+    @dbus_method_async("s")
+    async def EnableRecording(self, path: str) -> None:
+        """Record the next gpclient sessions into `path` (a file or a directory)"""
+        path = path or os.environ.get(RECORD_ENV, "")
+        if not path:
+            raise ValueError("No recording path given and GPCLIENT_RECORD is not set")
+        logger.info(f"gpclient session recording enabled: {path}")
+        self._recorder.path = path
+
+    @dbus_method_async()
+    async def DisableRecording(self) -> None:
+        """Stop recording, closing a recording in progress"""
+        logger.info("gpclient session recording disabled")
+        self._recorder.path = ""
+        self._recorder.stop()
+
+    @dbus_method_async()
+    async def StartProfiling(self) -> None:
+        """Start a sampling profile (see PROFILE_DIR), like SIGUSR1"""
+        if not self._profiler.start("StartProfiling()"):
+            raise ValueError("A profile is already running")
+
+    @dbus_method_async("", "s")
+    async def StopProfiling(self) -> str:
+        """Stop profiling, like SIGUSR2; returns the profile written or \"\""""
+        return self._profiler.stop("StopProfiling()") or ""
+
+    @dbus_method_async("", "as")
+    async def TakeMemorySnapshot(self) -> List[str]:
+        """Snapshot the service's memory (tracemalloc); returns what changed
+        since the previous snapshot, biggest first - nothing for the first"""
+        return self._memory.take()
+
+    @dbus_method_async()
+    async def StopMemoryTracing(self) -> None:
+        """Stop tracemalloc and drop the snapshot kept for comparison"""
+        logger.info("Memory tracing stopped")
+        self._memory.stop()
+
+    @dbus_property_async("s")
+    def Transport(self) -> str:
+        """Property: "esp" or "tls" once the tunnel is up, "" otherwise"""
+        return self.transport
+
+    @dbus_property_async("a{su}")
+    def TrimmedOutput(self) -> Dict[str, int]:
+        """Property: what the memory budget trimmed in this session so far"""
+        return dict(self._trimmed)
+
+    @dbus_property_async("a{ss}")
+    def Tunables(self) -> Dict[str, str]:
+        """Property: the service configuration in effect (see SERVICE_TUNABLES)"""
+        return service_tunables()
+
+
+class GpclientVPNPlugin(GpclientDiagnostics, interface_name=NM_DBUS_INTERFACE_VPN):
     """NetworkManager VPN Plugin for gpclient using python-sdbus"""
 
     def __init__(self):
@@ -479,8 +2538,54 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self.browser = None
         self.browser_target = None  # GP_BROWSER passed to the wrapper
         self.hip_enabled = True  # HIP enabled by default
+        self.hip_cache_ttl = HIP_CACHE_TTL
         self._state = NM_VPN_SERVICE_STATE_INIT
 
+        # Tunnel MTU: vpn.data mtu is "auto" (probe), a number, or "off"
+        self.mtu_setting = "auto"
+        self.tunnel_mtu: Optional[int] = None
+        self._mtu_prober = PathMtuProber()
+        self._mtu_cache = MtuCache()
+
+        # Where the vpnc hook leaves the pushed DNS configuration
+        self._pushed_config_path: Optional[str] = None
+
+        # IPv6: vpn.data disable-ipv6 (or ipv6.method=disabled) passes
+        # --disable-ipv6; otherwise a tunnel address is reported in Ip6Config
+        self.disable_ipv6 = False
+        self.ipv6_never_default = False
+        self.ipv6_ignore_auto_routes = False
+
+        # Transport: vpn.data transport (auto, esp or tls) and dpd-interval
+        # (--force-dpd); self.transport is what the session actually uses
+        self.transport_setting = "auto"
+        self.dpd_interval: Optional[int] = None
+        self.transport = ""
+
+        # Activation tracing (GPCLIENT_TRACE or the EnableTracing() call)
+        self._trace = ActivationTrace(os.environ.get(TRACE_ENV, ""))
+        self._gpclient_span = NULL_SPAN
+
+        # gpclient output logging: rate limited, the full recent output is
+        # kept in memory and only dumped when the activation fails
+        self._output_limiter = TokenBucket(
+            GPCLIENT_LOG_RATE, GPCLIENT_LOG_BURST, clock=loop_time
+        )
+        self._suppressed_lines = 0
+        # Output buffers stay within the memory budget; what they trimmed is
+        # counted per session
+        self._trimmed: Counter = Counter()
+        self._output_ring = OutputRing(GPCLIENT_OUTPUT_RING_LINES, self._trimmed)
+
+        # PTY session recording (GPCLIENT_RECORD or EnableRecording())
+        self._recorder = PtyRecorder(os.environ.get(RECORD_ENV, ""))
+
+        # Sampling profiler (SIGUSR1/SIGUSR2 or StartProfiling()), stopped by
+        # the next STARTED or failure at the latest
+        self._profiler = SamplingProfiler()
+        # tracemalloc snapshots (TakeMemorySnapshot())
+        self._memory = MemorySnapshots()
+
         # Legacy TLS renegotiation workaround (issue #2)
         self.fix_openssl_mode = "auto"  # auto | true | false
         self.fix_openssl = False  # pass --fix-openssl to gpclient
@@ -501,21 +2606,31 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self.ignore_auto_routes = False
         self.custom_routes = []
 
+        # The connection settings parsed into a ConnectionConfig, per UUID
+        # with the settings_digest() they were parsed from
+        self._config: Optional[ConnectionConfig] = None
+        self._config_cache: Dict[str, Tuple[str, ConnectionConfig]] = {}
+
         # Tunnel-candidate interfaces (with their IPs) that already existed
         # when Connect() started - these must never be picked up by tunnel
         # detection (stale gpd0 from a crashed session, another VPN's tun0;
         # issue #7)
         self._preexisting_ifaces = {}
 
+        # This activation's own tunnel interface and gpclient lock file, so
+        # concurrent sessions (one service process each) stay apart
+        self._activation = ActivationClaim()
+
         # Interactive authentication state (issue #6: RSA token / standard
         # login portals where gpclient prompts on its terminal)
         self.vpn_username = ""
         self.vpn_password = ""
+        self._password_on_stdin = False  # gpclient runs with --passwd-on-stdin
         self._interactive = False
         self._pty_master = None
-        self._pty_transport = None
-        self._output_scanner = OutputScanner()
-        self._ansi_carry = ""  # incomplete escape sequence from the last read
+        self._pty_reader: Optional[PtyReader] = None
+        self._output_scanner = OutputScanner(self._trimmed)
+        self._tokenizer = AnsiTokenizer()
         # Recent complete output lines, used to recognise multi-line prompts
         # (the inquire Select frame with the gateway list) and prompts that
         # inquire has already terminated with a newline
@@ -536,6 +2651,17 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self._answered_password = False
         self._login_failed = False
 
+        # Learned prompts: this activation's prompts, recorded once it is up,
+        # and a one-time code asked for before gpclient showed its prompt
+        # (held in memory only)
+        self._prompt_history = PromptHistory()
+        self._prompts_seen: List[Dict[str, Any]] = []
+        self._early_otp_task = None
+        self._early_otp_at = 0.0
+
+        # Loop time of the last call from NetworkManager (idle exit)
+        self._last_activity = loop_time()
+
         logger.info("GpclientVPNPlugin initialized with python-sdbus")
 
     @dbus_method_async("a{sa{sv}}", "s")
@@ -549,7 +2675,8 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             String with setting name that needs secrets, or empty string if none needed
         """
         logger.debug("=== NeedSecrets() called ===")
-        logger.debug(f"Settings data: {settings}")
+        self._last_activity = loop_time()
+        logger.debug("Settings data: %s", settings)
 
         # SAML (default): authentication happens in the browser via gpauth,
         # no secrets needed upfront.
@@ -581,17 +2708,32 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         connection: Dict[str, Dict[str, Tuple[str, Any]]],
     ) -> Tuple[Dict[str, str], Dict[str, str]]:
         """Extract (data, secrets) dicts from a connection's vpn section"""
-        vpn_section = connection.get("vpn", {})
-        vpn_data = {}
-        for key, value in vpn_section.items():
-            if isinstance(value, tuple) and len(value) == 2:
-                vpn_data[key] = value[1]
-            else:
-                vpn_data[key] = value
+        vpn_data = unwrap_variants(connection.get("vpn", {}))
         data = vpn_data.get("data", {}) or {}
         secrets = vpn_data.get("secrets", {}) or {}
         return data, secrets
 
+    def _connection_config(
+        self, connection: Dict[str, Dict[str, Tuple[str, Any]]]
+    ) -> ConnectionConfig:
+        """The ConnectionConfig of these settings, parsed only for a new revision"""
+        uuid = unwrap_variants(connection.get("connection", {})).get("uuid", "") or ""
+        digest = settings_digest(connection)
+        cached = self._config_cache.get(uuid)
+        if cached and cached[0] == digest:
+            logger.debug("Connection settings unchanged, reusing the parsed config")
+            return cached[1]
+        config = ConnectionConfig.from_settings(connection)
+        self._config_cache[uuid] = (digest, config)
+        return config
+
+    def _ipv4_u32(self, address: str) -> int:
+        """ipv4_u32(address), packed already when the connection config has it"""
+        packed = self._config.packed if self._config else {}
+        if address in packed:
+            return packed[address]
+        return ipv4_u32(address)
+
     @dbus_method_async("a{sa{sv}}")
     async def Connect(self, connection: Dict[str, Dict[str, Tuple[str, Any]]]) -> None:
         """Connect to VPN
@@ -608,100 +2750,31 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         interactive: bool,
     ) -> None:
         """Shared implementation for Connect() and ConnectInteractive()"""
-        logger.debug(f"Full connection data: {connection}")
+        logger.debug("Full connection data: %s", connection)
+        self._last_activity = loop_time()
+        self._reset_attempt_state()
         self._interactive = interactive
-        self._auth_banner = None
-        self._answering = False
-        self._secret_future = None
-        self._last_answer = ""
-        self._phase_key = None
-        self._username_prefilled = False
-        self._answered_username = False
-        self._answered_password = False
-        self._login_failed = False
-        self._output_scanner = OutputScanner()
-        self._ansi_carry = ""
-        self._recent_lines.clear()
-        self._line_counter = 0
-        self._answered_at_line = -1
-        self._answered_select = None
-        self._gateway_list = []
-        self._openssl_error_seen = False
-        self._openssl_retried = False
-        self._otp_flags_written = False
-
-        try:
-            # Extract VPN data
-            if "vpn" not in connection:
-                raise Exception("No VPN data in connection")
+        self._set_log_context(PHASE="connect")
 
-            vpn_section = connection["vpn"]
+        self._trace.start(interactive=interactive)
+        connect_span = self._trace.span("_do_connect", "activation")
 
-            # Parse data from vpn section
-            vpn_data = {}
-            for key, value in vpn_section.items():
-                if isinstance(value, tuple) and len(value) == 2:
-                    vpn_data[key] = value[1]
-                else:
-                    vpn_data[key] = value
-
-            logger.debug(f"Parsed VPN data: {vpn_data}")
-
-            # Parse IPv4 routing configuration
-            ipv4_section = connection.get("ipv4", {})
-            ipv4_config = {}
-            for key, value in ipv4_section.items():
-                if isinstance(value, tuple) and len(value) == 2:
-                    ipv4_config[key] = value[1]
-                else:
-                    ipv4_config[key] = value
+        try:
+            config = self._connection_config(connection)
+            self._config = config
 
-            # Get never-default option
-            self.never_default = ipv4_config.get("never-default", False)
+            self.never_default = config.never_default
             logger.info(f"never-default: {self.never_default}")
-            self.ignore_auto_routes = ipv4_config.get("ignore-auto-routes", False)
+            self.ignore_auto_routes = config.ignore_auto_routes
             logger.info(f"ignore-auto-routes: {self.ignore_auto_routes}")
-
-            self.custom_routes = []
-            # Prefer route-data if present
-            route_data = ipv4_config.get("route-data")
-            if route_data:
-                for route in route_data:
-                    dest_raw = route.get("dest", "")
-                    prefix_raw = route.get("prefix", 0)
-                    dest = dest_raw[1] if isinstance(dest_raw, tuple) else dest_raw
-                    prefix = (
-                        prefix_raw[1] if isinstance(prefix_raw, tuple) else prefix_raw
-                    )
-                    if dest:
-                        self.custom_routes.append((dest, int(prefix)))
-            else:
-                # Fallback: parse "routes" (aau): [dest_u32, prefix, next_hop_u32, metric]
-                routes = ipv4_config.get("routes", [])
-                for r in routes:
-                    if not (isinstance(r, (list, tuple)) and len(r) >= 2):
-                        continue
-                    dest_u32 = int(r[0])
-                    prefix = int(r[1])
-                    try:
-                        prefix = int(prefix)
-                    except Exception:
-                        prefix = 32
-
-                    # IMPORTANT: NM uses host order uint32 here on little-endian machines
-                    dest_ip = socket.inet_ntoa(struct.pack("<I", dest_u32))
-
-                    self.custom_routes.append((dest_ip, prefix))
-                    logger.info(f"Custom route: {dest_ip}/{prefix}")
-
-            # Get the actual data dictionary
-            data_dict = vpn_data.get("data", {})
-            logger.debug(f"Data dict: {data_dict}")
+            self.custom_routes = list(config.custom_routes)
+            self.ipv6_never_default = config.ipv6_never_default
+            self.ipv6_ignore_auto_routes = config.ipv6_ignore_auto_routes
 
             # Stored credentials for standard (non-SAML) login portals.
             # Username lives in vpn.data, password in vpn.secrets.
-            secrets_dict = vpn_data.get("secrets", {}) or {}
-            self.vpn_username = data_dict.get("username", "")
+            _data, secrets_dict = self._parse_vpn_section(connection)
+            self.vpn_username = config.username
             self.vpn_password = secrets_dict.get("password", "")
             # When a username is stored we pass it as gpclient --user, so
             # gpclient does not prompt for it - treat username as already
@@ -714,36 +2787,19 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 logger.info("Stored password: <present>")
 
             # Connection UUID, needed to cache the gateway list in the profile
-            connection_section = connection.get("connection", {})
-            uuid_raw = connection_section.get("uuid", "")
-            self._connection_uuid = (
-                uuid_raw[1] if isinstance(uuid_raw, tuple) else uuid_raw
-            ) or ""
-
-            # Get the server address (required). This is the portal address, or
-            # a gateway address when as-gateway is set.
-            self.gateway = data_dict.get("gateway", "")
-            if not self.gateway:
-                raise Exception("No gateway specified")
+            self._connection_uuid = config.uuid
+
+            self.gateway = config.gateway
             logger.info(f"Server: {self.gateway}")
 
-            # Legacy TLS renegotiation workaround (issue #2): auto retries once
-            # after gpclient reports the error, true passes the flag from the
-            # start, false disables the workaround entirely
-            self.fix_openssl_mode = data_dict.get("fix-openssl", "auto").lower()
-            if self.fix_openssl_mode not in ("auto", "true", "false"):
-                logger.warning(
-                    f"Unknown fix-openssl value {self.fix_openssl_mode!r}, "
-                    "falling back to 'auto'"
-                )
-                self.fix_openssl_mode = "auto"
+            self.fix_openssl_mode = config.fix_openssl_mode
             self.fix_openssl = self.fix_openssl_mode == "true"
             logger.info(f"fix-openssl: {self.fix_openssl_mode}")
 
             # Portal / gateway handling (issue #7)
-            self.as_gateway = data_dict.get("as-gateway", "false").lower() == "true"
-            self.preferred_gateway = data_dict.get("preferred-gateway", "").strip()
-            self._stored_gateway_list = data_dict.get("gateway-list", "").strip()
+            self.as_gateway = config.as_gateway
+            self.preferred_gateway = config.preferred_gateway
+            self._stored_gateway_list = config.stored_gateway_list
             logger.info(f"Treat server as gateway: {self.as_gateway}")
             logger.info(
                 "Preferred gateway: "
@@ -753,39 +2809,69 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             # Get browser (optional). Friendly names and the known browser
             # binaries go through our wrapper, which fixes up the session
             # environment and the auth window lifetime.
-            self.browser, self.browser_target = resolve_browser(
-                data_dict.get("browser", "")
-            )
+            self.browser, self.browser_target = resolve_browser(config.browser)
             logger.info(f"Browser: {self.browser} (target: {self.browser_target})")
 
-            # Get DNS servers (optional)
-            dns_str = data_dict.get("dns", "")
-            if dns_str:
-                self.dns_servers = [s.strip() for s in dns_str.split(";") if s.strip()]
+            self.dns_servers = list(config.dns_servers)
+            if self.dns_servers:
                 logger.info(f"DNS servers configured: {self.dns_servers}")
-
-            # Get custom DNS domains (optional)
-            dns_domains_str = data_dict.get("dns-domains", "")
-            if dns_domains_str:
-                self.dns_domains = [
-                    d.strip() for d in dns_domains_str.split() if d.strip()
-                ]
+            self.dns_domains = list(config.dns_domains)
+            if self.dns_domains:
                 logger.info(f"Custom DNS domains configured: {self.dns_domains}")
 
-            # Get HIP setting (default: enabled)
-            hip_str = data_dict.get("hip", "true")
-            self.hip_enabled = hip_str.lower() == "true"
+            self.hip_enabled = config.hip_enabled
             logger.info(f"HIP enabled: {self.hip_enabled}")
+            self.hip_cache_ttl = config.hip_cache_ttl
+            if self.hip_enabled:
+                logger.info(f"HIP report cache TTL: {self.hip_cache_ttl}s")
+
+            self.disable_ipv6 = config.disable_ipv6
+            logger.info(f"IPv6 disabled: {self.disable_ipv6}")
+
+            self.transport_setting = config.transport_setting
+            self.dpd_interval = config.dpd_interval
+            logger.info(
+                f"Transport: {self.transport_setting}, DPD interval: "
+                + (f"{self.dpd_interval}s" if self.dpd_interval else "<gateway>")
+            )
+
+            self.mtu_setting = config.mtu_setting
+            logger.info(f"MTU: {self.mtu_setting}")
+
+            self._set_log_context(
+                CONNECTION_UUID=self._connection_uuid, GATEWAY=self.gateway
+            )
+            self._trace.annotate(
+                uuid=self._connection_uuid,
+                gateway=self.gateway,
+                auth_mode=config.auth_mode,
+                as_gateway=self.as_gateway,
+                preferred_gateway=self.preferred_gateway,
+                fix_openssl=self.fix_openssl_mode,
+                hip=self.hip_enabled,
+                mtu=self.mtu_setting,
+                ipv6=not self.disable_ipv6,
+                transport=self.transport_setting,
+            )
 
             # Emit state change: preparing
             self.StateChanged.emit(NM_VPN_SERVICE_STATE_STARTING)
 
-            # Clean up a stale gpd0 left by a crashed previous session and
-            # snapshot the tunnel-candidate interfaces that exist BEFORE
-            # gpclient starts, so tunnel detection cannot pick up a stale
-            # or foreign interface (issue #7)
-            await self._cleanup_stale_gpd0()
-            self._preexisting_ifaces = await self._snapshot_tunnel_interfaces()
+            # Clean up a stale gpdN left by a crashed previous session, claim
+            # this session's tunnel interface and snapshot the
+            # tunnel-candidate interfaces that exist BEFORE gpclient starts,
+            # so tunnel detection cannot pick up a stale or foreign interface
+            # (issue #7)
+            with self._trace.span("cleanup-stale-tunnels", "preflight"):
+                await self._cleanup_stale_tunnels()
+            with self._trace.span("claim-interface", "preflight") as span:
+                span.annotate(interface=self._activation.claim())
+            with self._trace.span("snapshot-interfaces", "preflight"):
+                self._preexisting_ifaces = await self._snapshot_tunnel_interfaces()
+            with self._trace.span("path-mtu", "preflight") as span:
+                self.tunnel_mtu = await self._choose_tunnel_mtu()
+                span.annotate(mtu=self.tunnel_mtu)
+            self._prepare_pushed_config()
 
             # Start gpclient process
             success = await self._start_gpclient()
@@ -793,6 +2879,8 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             if not success:
                 raise Exception("Failed to start gpclient process")
 
+            self._start_early_otp()
+
             # Start monitoring for tunnel interface
             self.tunnel_check_task = asyncio.create_task(self._check_tunnel_loop())
 
@@ -800,8 +2888,13 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
         except Exception as e:
             logger.error(f"Connect() failed: {e}")
+            # Before _emit_failure() finishes the trace, which would close the
+            # span as left open
+            connect_span.end(error=str(e))
             self._emit_failure(NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED)
             raise
+        finally:
+            connect_span.end()
 
     @dbus_method_async()
     async def Disconnect(self) -> None:
@@ -826,6 +2919,7 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         if self._secret_future and not self._secret_future.done():
             self._secret_future.cancel()
         self._secret_future = None
+        self._discard_early_otp()
 
         # Stop stdout monitoring
         if self.stdout_monitor_task:
@@ -847,69 +2941,142 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 )
                 self.gpclient_process.terminate()
                 try:
-                    await asyncio.wait_for(self.gpclient_process.wait(), timeout=5)
+                    await asyncio.wait_for(
+                        self.gpclient_process.wait(),
+                        timeout=GPCLIENT_TERMINATE_TIMEOUT,
+                    )
                 except asyncio.TimeoutError:
                     logger.warning("gpclient didn't terminate, killing it")
                     self.gpclient_process.kill()
                     try:
-                        await asyncio.wait_for(self.gpclient_process.wait(), timeout=2)
+                        await asyncio.wait_for(
+                            self.gpclient_process.wait(),
+                            timeout=GPCLIENT_KILL_TIMEOUT,
+                        )
                     except asyncio.TimeoutError:
                         logger.error("gpclient process refused to die after SIGKILL")
             except Exception as e:
                 logger.error(f"Error terminating gpclient: {e}")
 
-        # Also run gpclient disconnect command
-        try:
-            proc = await asyncio.create_subprocess_exec(
-                "/usr/bin/gpclient", "disconnect"
+        # Also run gpclient disconnect command. It signals whichever gpclient
+        # holds the lock file, so not while another session is up.
+        if self._activation.others():
+            logger.info("Other sessions are active - not running 'gpclient disconnect'")
+        else:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    GPCLIENT_BINARY, "disconnect"
+                )
+                await asyncio.wait_for(
+                    proc.wait(), timeout=GPCLIENT_DISCONNECT_TIMEOUT
+                )
+            except Exception as e:
+                logger.error(f"Error running 'gpclient disconnect': {e}")
+        self._activation.release()
+
+        self._trace.finish("disconnected", self._connection_uuid)
+        if self._trimmed:
+            logger.info(
+                "gpclient output trimmed to the memory budget: "
+                + ", ".join(f"{key} {count}" for key, count in self._trimmed.items())
             )
-            await asyncio.wait_for(proc.wait(), timeout=10)
-        except Exception as e:
-            logger.error(f"Error running 'gpclient disconnect': {e}")
+        self._set_log_context(
+            CONNECTION_UUID=None, PHASE=None, GATEWAY=None, GPCLIENT_PID=None
+        )
 
         # Clean up
+        self._reset_attempt_state()
         self.gpclient_process = None
+        self._gpclient_span = NULL_SPAN
         self.dns_servers = []
+        self.dns_domains = []
+        self._remove_pushed_config()
         self.hip_enabled = True
+        self.hip_cache_ttl = HIP_CACHE_TTL
+        self.mtu_setting = "auto"
+        self.tunnel_mtu = None
         self.never_default = False
         self.custom_routes = []
+        self._config = None
+        self.disable_ipv6 = False
+        self.ipv6_never_default = False
+        self.ipv6_ignore_auto_routes = False
+        self.transport_setting = "auto"
+        self.dpd_interval = None
         self.browser_target = None
         self.fix_openssl_mode = "auto"
         self.fix_openssl = False
-        self._openssl_error_seen = False
-        self._openssl_retried = False
-        self._otp_flags_written = False
         self.as_gateway = False
         self.preferred_gateway = ""
         self._connection_uuid = ""
-        self._gateway_list = []
         self._stored_gateway_list = ""
-        self._answered_select = None
+        self.vpn_username = ""
+        self.vpn_password = ""
+        self._password_on_stdin = False  # gpclient runs with --passwd-on-stdin
+        self._interactive = False
+        self._preexisting_ifaces = {}
+
+        # Emit state change
+        self.StateChanged.emit(NM_VPN_SERVICE_STATE_STOPPED)
+        self._last_activity = loop_time()
+
+        logger.info("Disconnected from VPN")
+
+    def _reset_attempt_state(self) -> None:
+        """Forget what one activation learned, at Connect() and Disconnect().
+
+        What the connection's settings set is reset by Disconnect() itself;
+        this is the state gpclient's run builds up along the way.
+        """
+        self._reset_output_state()
+        self._secret_future = None
+        self._username_prefilled = False
+        self._answered_username = False
+        self._answered_password = False
+        self._login_failed = False
+        self._gateway_list = []
+        self._openssl_error_seen = False
+        self._openssl_retried = False
+        self._otp_flags_written = False
+        self.transport = ""
+        self._prompts_seen = []
+        self._output_ring.clear()
+        self._trimmed.clear()
+        self._suppressed_lines = 0
+
+    def _reset_output_state(self) -> None:
+        """Start reading a new gpclient's output: also before a retry"""
+        self._output_scanner = OutputScanner(self._trimmed)
+        self._tokenizer = AnsiTokenizer()
         self._recent_lines.clear()
         self._line_counter = 0
         self._answered_at_line = -1
-        self.vpn_username = ""
-        self.vpn_password = ""
-        self._interactive = False
         self._auth_banner = None
         self._answering = False
         self._last_answer = ""
+        self._answered_select = None
         self._phase_key = None
-        self._username_prefilled = False
-        self._answered_username = False
-        self._answered_password = False
-        self._login_failed = False
-        self._preexisting_ifaces = {}
 
-        # Emit state change
-        self.StateChanged.emit(NM_VPN_SERVICE_STATE_STOPPED)
+    def _is_idle(self) -> bool:
+        """No gpclient running (a session being set up or up has one)"""
+        process = self.gpclient_process
+        return process is None or process.returncode is not None
 
-        logger.info("Disconnected from VPN")
+    async def wait_until_idle(self, timeout: float) -> None:
+        """Return once there has been no session and no call from
+        NetworkManager for `timeout` seconds"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(timeout, IDLE_CHECK_INTERVAL))
+            if not self._is_idle():
+                self._last_activity = loop.time()
+            elif loop.time() - self._last_activity >= timeout:
+                return
 
     @dbus_method_async("a{sv}")
     async def SetConfig(self, config: Dict[str, Tuple[str, Any]]) -> None:
         """Set configuration (optional, for compatibility)"""
-        logger.info(f"SetConfig() called with: {config}")
+        logger.info("SetConfig() called with: %s", config)
 
     @dbus_method_async("a{sv}")
     async def SetIp4Config(self, config: Dict[str, Tuple[str, Any]]) -> None:
@@ -946,6 +3113,7 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
     ) -> None:
         """Secrets provided by NetworkManager after a SecretsRequired signal"""
         logger.info("NewSecrets() called")
+        self._last_activity = loop_time()
         data, secrets = self._parse_vpn_section(connection)
         logger.debug(f"NewSecrets keys: {list(secrets.keys())}")
 
@@ -973,17 +3141,17 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
     @dbus_signal_async("a{sv}")
     def Config(self, config: Dict[str, Tuple[str, Any]]) -> None:
         """Signal: Configuration ready"""
-        logger.info(f"Config signal: {config}")
+        logger.info("Config signal: %s", config)
 
     @dbus_signal_async("a{sv}")
     def Ip4Config(self, config: Dict[str, Tuple[str, Any]]) -> None:
         """Signal: IPv4 configuration ready"""
-        logger.info(f"Ip4Config signal: {config}")
+        logger.info("Ip4Config signal: %s", config)
 
     @dbus_signal_async("a{sv}")
     def Ip6Config(self, config: Dict[str, Tuple[str, Any]]) -> None:
         """Signal: IPv6 configuration ready"""
-        logger.info(f"Ip6Config signal: {config}")
+        logger.info("Ip6Config signal: %s", config)
 
     @dbus_signal_async("s")
     def LoginBanner(self, banner: str) -> None:
@@ -1177,19 +3345,29 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         """Start gpclient process"""
         try:
             # Get real user first (needed for pkill filter)
-            real_uid, real_user, real_home = self._get_real_user()
+            with self._trace.span("real-user", "preflight"):
+                real_uid, real_user, real_home = self._get_real_user()
             logger.info(f"Will run gpclient as user: {real_user}")
 
-            # Kill any hanging gpauth processes first (filtered by user for security)
-            try:
-                subprocess.run(
-                    ["pkill", "-9", "-u", str(real_uid), "gpauth"], timeout=2
-                )
-                logger.debug(
-                    f"Killed any hanging gpauth processes for user {real_user}"
+            # Kill any hanging gpauth processes first (filtered by user for
+            # security) - unless another session may be logging in right now
+            other_sessions = self._activation.others()
+            if other_sessions:
+                logger.info(
+                    f"Other sessions are active ({', '.join(sorted(other_sessions))})"
+                    " - not killing gpauth processes"
                 )
-            except Exception as e:
-                logger.debug(f"No gpauth processes to kill: {e}")
+            else:
+                try:
+                    with self._trace.span("pkill-gpauth", "preflight"):
+                        subprocess.run(
+                            ["pkill", "-9", "-u", str(real_uid), "gpauth"], timeout=2
+                        )
+                    logger.debug(
+                        f"Killed any hanging gpauth processes for user {real_user}"
+                    )
+                except Exception as e:
+                    logger.debug(f"No gpauth processes to kill: {e}")
 
             # Build command.
             #
@@ -1207,21 +3385,52 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
             cmd.append("connect")
 
-            # Add --hip flag if enabled
+            # HIP reports: through the caching wrapper when it is installed
+            # (--csd-wrapper implies --hip), otherwise gpclient's own
             if self.hip_enabled:
-                cmd.append("--hip")
+                if self.hip_cache_ttl > 0 and os.access(HIP_WRAPPER, os.X_OK):
+                    cmd.extend(["--csd-wrapper", HIP_WRAPPER])
+                else:
+                    cmd.append("--hip")
 
             # The server is a gateway, not a portal: skip the portal workflow
             # so the user is not authenticated twice
             if self.as_gateway:
                 cmd.append("--as-gateway")
 
+            if self.tunnel_mtu:
+                cmd.extend(["--mtu", str(self.tunnel_mtu)])
+
+            if self.disable_ipv6:
+                cmd.append("--disable-ipv6")
+
+            if self.transport_setting == "tls":
+                cmd.append("--no-dtls")
+
+            if self.dpd_interval:
+                cmd.extend(["--force-dpd", str(self.dpd_interval)])
+
+            if self._activation.interface:
+                cmd.extend(["--interface", self._activation.interface])
+
             # Pass stored username so standard-login portals don't prompt for it
             if self.vpn_username:
                 cmd.extend(["--user", self.vpn_username])
 
+            # ...and the stored password on stdin, when this connection is
+            # known to take it in every round (PromptHistory.password_on_stdin)
+            self._password_on_stdin = bool(
+                self.vpn_password
+            ) and self._prompt_history.password_on_stdin(self._connection_uuid)
+            if self._password_on_stdin:
+                cmd.append("--passwd-on-stdin")
+
             cmd.extend(["--browser", self.browser, self.gateway])
 
+            private_lock = self._activation.private_gpclient_lock()
+            if private_lock:
+                cmd = private_lock_command(cmd, private_lock)
+
             logger.info(f"Spawning: {' '.join(cmd)}")
 
             # Set up environment
@@ -1234,7 +3443,9 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
                 # Import the user's graphical session environment so gpauth can
                 # actually open the SAML browser (issue #7)
-                session_env = self._get_session_env(real_uid, real_home)
+                with self._trace.span("session-env", "preflight") as span:
+                    session_env = self._get_session_env(real_uid, real_home)
+                    span.annotate(keys=sorted(session_env))
                 env.update(session_env)
                 logger.info(
                     f"Environment: SUDO_UID={real_uid}, session keys: "
@@ -1255,12 +3466,12 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             )
             env["GPCLIENT_NM_NEVER_DEFAULT"] = "1" if self.never_default else "0"
 
-            # Export custom DNS domains for vpnc hook
-            if self.dns_domains:
-                env["GPCLIENT_CUSTOM_DNS_DOMAINS"] = " ".join(self.dns_domains)
-                logger.info(
-                    f"Exporting custom DNS domains: {env['GPCLIENT_CUSTOM_DNS_DOMAINS']}"
-                )
+            # The vpnc hook hands the pushed DNS configuration back to us
+            if self._pushed_config_path:
+                env[PUSHED_CONFIG_ENV] = self._pushed_config_path
+
+            # Read by the HIP wrapper, which openconnect runs with our env
+            env[HIP_CACHE_TTL_ENV] = str(self.hip_cache_ttl)
 
             # Spawn gpclient under a PTY. Standard-login portals (RSA token
             # challenges, issue #6) make gpclient prompt interactively via the
@@ -1269,11 +3480,23 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             # output and answer via NM's secrets flow.
             env["TERM"] = "xterm-256color"
 
+            import pty
+            import termios
+
             master_fd, slave_fd = pty.openpty()
             # Wide window so prompts don't wrap mid-line
             fcntl.ioctl(
-                master_fd, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 200, 0, 0)
+                master_fd,
+                termios.TIOCSWINSZ,
+                struct.pack("HHHH", PTY_ROWS, PTY_COLUMNS, 0, 0),
             )
+            if self._password_on_stdin:
+                # gpclient reads the password as a line, in canonical mode -
+                # where the terminal would echo it into the output we log.
+                # inquire's prompts draw their own input and are unaffected.
+                attributes = termios.tcgetattr(slave_fd)
+                attributes[3] &= ~termios.ECHO
+                termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
 
             def _child_setup():
                 # New session + make the PTY slave (fd 0) the controlling
@@ -1296,6 +3519,18 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             self._pty_master = master_fd
 
             logger.info(f"Started gpclient with PID {self.gpclient_process.pid}")
+            self._set_log_context(GPCLIENT_PID=str(self.gpclient_process.pid))
+            self._recorder.start(
+                " ".join(cmd), self._connection_uuid
+            )
+            self._gpclient_span = self._trace.span(
+                "gpclient",
+                "gpclient",
+                pid=self.gpclient_process.pid,
+                fix_openssl=self.fix_openssl,
+                as_gateway=self.as_gateway,
+                hip=self.hip_enabled,
+            )
 
             # Start monitoring PTY output
             self.stdout_monitor_task = asyncio.create_task(
@@ -1313,40 +3548,30 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         if not self.gpclient_process or self._pty_master is None:
             return
 
-        loop = asyncio.get_running_loop()
-        reader = asyncio.StreamReader()
-        protocol = asyncio.StreamReaderProtocol(reader)
-        pty_file = os.fdopen(self._pty_master, "rb", buffering=0)
-
         try:
-            self._pty_transport, _ = await loop.connect_read_pipe(
-                lambda: protocol, pty_file
-            )
+            self._pty_reader = PtyReader(self._pty_master)
         except Exception as e:
             logger.error(f"Failed to attach PTY reader: {e}")
-            pty_file.close()
-            self._pty_master = None
+            self._close_pty()
             # Without the reader we can neither detect prompts nor see gpclient
             # finish, so fail the activation and stop gpclient instead of
             # leaving NM stuck in STARTING with an orphaned process (review #9).
             self._fail_login(f"Failed to attach PTY reader: {e}")
             return
 
+        reader = self._pty_reader
         last_logged_line = None
 
         try:
             while True:
-                try:
-                    chunk = await reader.read(4096)
-                except OSError:
-                    # PTY master raises EIO when the child exits
-                    break
-                if not chunk:
+                chunk = await reader.read()
+                if chunk is None:
+                    # Whatever the tokenizer still holds was cut off for good
+                    self._consume_output(b"", final=True)
                     break
 
-                lines = self._consume_output(
-                    chunk.decode("utf-8", errors="replace")
-                )
+                self._recorder.output(chunk)
+                lines = self._consume_output(chunk)
 
                 # Once the answered prompt is committed as a full line (its
                 # echo flushed), stop suppressing on the old answer - otherwise
@@ -1362,17 +3587,21 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                     # only recognisable by its position (marker, space, value)
                     self._recent_lines.append(raw_line)
                     self._line_counter += 1
+                    self._output_ring.append(raw_line.rstrip())
 
                     line = raw_line.strip()
                     # inquire redraws lines on every keystroke; skip repeats
                     if line == last_logged_line:
                         continue
                     last_logged_line = line
-                    logger.info(f"gpclient output: {line}")
+                    self._log_gpclient_line(line)
 
                     chosen = GATEWAY_CHOSEN_RE.search(line)
                     if chosen:
                         self._record_gateways([chosen.group("gateway")])
+                        self._trace.instant(
+                            "gateway chosen", "gpclient", gateway=chosen.group("gateway")
+                        )
 
                     if "--as-gateway" in line:
                         logger.warning(
@@ -1393,6 +3622,8 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                             f"({banner['kind']}: {banner['server']})"
                         )
                         self._auth_banner = banner
+                        self._trace.instant("auth banner", "prompts", **banner)
+                        self._set_log_context(PHASE=f"{banner['kind'].lower()}-auth")
                         # A new auth banner means a new Portal/Gateway round;
                         # reset per-phase username/password tracking so the
                         # gateway round can reuse the stored password once.
@@ -1401,6 +3632,25 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                             self._phase_key = phase_key
                             self._reset_phase_state()
 
+                    if self._password_on_stdin:
+                        if PASSWORD_STDIN_LINE in line:
+                            # Answered like the prompt it replaces, at once,
+                            # instead of a check still pending from earlier
+                            # output. Marked as being answered already, so the
+                            # prompt check after this chunk leaves it alone.
+                            if self._prompt_task and not self._prompt_task.done():
+                                self._prompt_task.cancel()
+                            self._answering = True
+                            self._prompt_task = asyncio.create_task(
+                                self._handle_prompt("Password")
+                            )
+                        elif PASSWORD_STDIN_REUSED_LINE in line:
+                            self._note_reused_password()
+
+                    transport = transport_from_line(line)
+                    if transport:
+                        self._note_transport(transport)
+
                     # Check for connection success indicators
                     if any(
                         msg in line
@@ -1414,12 +3664,17 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                         logger.info(
                             "Detected VPN connection message - checking for interface"
                         )
+                        self._trace.instant("connected message", "gpclient", line=line)
 
                 self._schedule_prompt_check()
 
             # Process ended
+            self._flush_suppressed_lines()
             returncode = await self.gpclient_process.wait()
+            self._recorder.marker(f"exit {returncode}")
+            self._recorder.stop()
             logger.info(f"gpclient process exited with status {returncode}")
+            self._gpclient_span.end(returncode=returncode)
 
             if returncode != 0 and not self._login_failed:
                 if await self._retry_with_openssl_fix():
@@ -1433,7 +3688,44 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         except Exception as e:
             logger.error(f"Error monitoring gpclient output: {e}")
 
-    def _consume_output(self, text: str) -> List[str]:
+    def _log_gpclient_line(self, line: str) -> None:
+        """Log one line of gpclient output, within the rate limit"""
+        if self._output_limiter.allow() or GPCLIENT_IMPORTANT_LINE_RE.search(line):
+            self._flush_suppressed_lines()
+            logger.info("gpclient output: %s", line)
+        else:
+            self._suppressed_lines += 1
+
+    def _flush_suppressed_lines(self) -> None:
+        """Report how many gpclient lines the rate limit kept out of the log"""
+        if self._suppressed_lines:
+            logger.info(
+                "%d gpclient output lines not logged (rate limit)",
+                self._suppressed_lines,
+            )
+            self._suppressed_lines = 0
+
+    def _dump_output_ring(self) -> None:
+        """Log the recent gpclient output in full - only done on failure"""
+        if not self._output_ring:
+            return
+        logger.error(
+            "Last %d lines of gpclient output:\n%s",
+            len(self._output_ring),
+            "\n".join(self._output_ring),
+        )
+        self._output_ring.clear()
+
+    @staticmethod
+    def _set_log_context(**fields: Optional[str]) -> None:
+        """Update the fields attached to every journal entry (None removes)"""
+        for key, value in fields.items():
+            if value is None:
+                LOG_CONTEXT.pop(key, None)
+            else:
+                LOG_CONTEXT[key] = value
+
+    def _consume_output(self, data: Any, final: bool = False) -> List[str]:
         """Clean a chunk of PTY output and return the lines it completed.
 
         An escape sequence cut in half by the read boundary is held back until
@@ -1441,15 +3733,7 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         the remainder leaks into the text (issue #2: a prompt label that read
         "[39m Password").
         """
-        text = self._ansi_carry + text
-        self._ansi_carry = ""
-
-        split = INCOMPLETE_ANSI_RE.search(text)
-        if split:
-            self._ansi_carry = split.group(0)
-            text = text[: split.start()]
-
-        return self._output_scanner.feed(strip_ansi(text))
+        return self._output_scanner.feed_tokens(self._tokenizer.feed(data, final))
 
     async def _retry_with_openssl_fix(self) -> bool:
         """Restart gpclient once with --fix-openssl after a legacy TLS error.
@@ -1477,6 +3761,9 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
         self._openssl_retried = True
         self.fix_openssl = True
+        self._trace.instant(
+            "retry", "gpclient", reason="openssl legacy renegotiation", flag="--fix-openssl"
+        )
 
         # Drop the finished process and its PTY before starting over
         if self._prompt_task and not self._prompt_task.done():
@@ -1486,22 +3773,15 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self.gpclient_process = None
 
         # Fresh output state for the new attempt
-        self._output_scanner = OutputScanner()
-        self._ansi_carry = ""
-        self._recent_lines.clear()
-        self._line_counter = 0
-        self._answered_at_line = -1
-        self._auth_banner = None
-        self._answering = False
-        self._last_answer = ""
-        self._answered_select = None
-        self._phase_key = None
+        self._reset_output_state()
         self._reset_phase_state()
 
         # Same groundwork as before the first attempt: whatever the failed run
         # left behind must not be mistaken for the new tunnel (issue #7)
-        await self._cleanup_stale_gpd0()
-        self._preexisting_ifaces = await self._snapshot_tunnel_interfaces()
+        with self._trace.span("cleanup-stale-tunnels", "preflight", retry=True):
+            await self._cleanup_stale_tunnels()
+        with self._trace.span("snapshot-interfaces", "preflight", retry=True):
+            self._preexisting_ifaces = await self._snapshot_tunnel_interfaces()
 
         if await self._start_gpclient():
             return True
@@ -1510,13 +3790,13 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         return False
 
     def _close_pty(self) -> None:
-        """Close the PTY master (and its transport, if a reader was attached)"""
-        if self._pty_transport:
+        """Close the PTY master (through its reader, if one was attached)"""
+        if self._pty_reader:
             try:
-                self._pty_transport.close()
+                self._pty_reader.close()
             except Exception as e:
-                logger.debug(f"Error closing PTY transport: {e}")
-            self._pty_transport = None
+                logger.debug(f"Error closing PTY reader: {e}")
+            self._pty_reader = None
             self._pty_master = None
         elif self._pty_master is not None:
             try:
@@ -1532,8 +3812,13 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         a failure, and without it the activation sits there until its own
         connect timeout expires, which reads as a hang (issue #2).
         """
+        self._flush_suppressed_lines()
+        self._dump_output_ring()
+        self._set_log_context(PHASE="failed")
         self.Failure.emit(reason)
         self.StateChanged.emit(NM_VPN_SERVICE_STATE_STOPPED)
+        self._trace.finish(f"failure {reason}", self._connection_uuid)
+        self._profiler.stop(f"failure {reason}")
 
     def _schedule_prompt_check(self) -> None:
         """(Re)schedule the debounced check for a pending interactive prompt.
@@ -1650,35 +3935,47 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
         banner_msg = self._auth_banner["message"] if self._auth_banner else ""
         kind = self._classify_prompt_kind(label, banner_msg)
+        span = self._trace.span("prompt", "prompts", label=label, kind=kind)
 
         # Anything already printed must not be taken for a new prompt again
         self._answered_at_line = self._line_counter
         self._answering = True
+        secret = True
+        asked = True
         try:
+            if kind != "otp" and self._early_otp_task:
+                # The early request holds the only secrets slot: let the user
+                # finish it before asking for anything else
+                await asyncio.wait([self._early_otp_task])
             if kind == "username":
                 if self.vpn_username and not self._answered_username:
                     logger.info("Answering username prompt from stored username")
                     answer = self.vpn_username
+                    asked = False
                 else:
                     answer = await self._request_secret_interactive(
                         "username", label, banner_msg
                     )
                 self._answered_username = True
+                secret = False
             elif kind == "otp":
-                logger.info(
-                    "Prompt looks like a one-time secret (token/OTP/challenge), "
-                    "asking the user"
-                )
-                # Do this first: a passcode left in the profile would be handed
-                # back by the agent without asking anyone (issue #2)
-                await self._forget_one_time_secret()
-                answer = await self._request_secret_interactive(
-                    OTP_SECRET_KEY, label, banner_msg
-                )
+                answer = await self._take_early_otp()
+                if answer is None:
+                    logger.info(
+                        "Prompt looks like a one-time secret (token/OTP/challenge), "
+                        "asking the user"
+                    )
+                    # Do this first: a passcode left in the profile would be
+                    # handed back by the agent without asking anyone (issue #2)
+                    await self._forget_one_time_secret()
+                    answer = await self._request_secret_interactive(
+                        OTP_SECRET_KEY, label, banner_msg
+                    )
             else:
                 if self.vpn_password and not self._answered_password:
                     logger.info("Answering password prompt from stored password")
                     answer = self.vpn_password
+                    asked = False
                 else:
                     answer = await self._request_secret_interactive(
                         "password", label, banner_msg
@@ -1686,12 +3983,79 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 self._answered_password = True
         except Exception as e:
             logger.error(f"Cannot answer prompt {label!r}: {e}")
+            span.end(error=str(e))
             self._fail_login(str(e))
             return
         finally:
             self._answering = False
 
-        self._write_answer(answer)
+        self._prompts_seen.append(
+            {
+                "kind": kind,
+                "label": label,
+                "phase": self._auth_banner["kind"] if self._auth_banner else "",
+                "asked": asked,
+            }
+        )
+        self._write_answer(answer, secret=secret)
+        span.end()
+
+    def _start_early_otp(self) -> None:
+        """Ask for a one-time code now when this connection always needs one"""
+        if not self._interactive or not self._connection_uuid:
+            return
+        prompt = self._prompt_history.early_prompt(self._connection_uuid)
+        if prompt is None:
+            return
+        logger.info(
+            "Recent activations of this connection asked for a one-time code "
+            "first - asking for it now, while gpclient connects"
+        )
+        self._early_otp_task = asyncio.create_task(
+            self._request_early_otp(prompt.get("label") or "One-time code")
+        )
+
+    async def _request_early_otp(self, label: str) -> str:
+        with self._trace.span("early one-time code", "secrets", label=label):
+            # As for a prompt: a stored passcode must not answer this
+            await self._forget_one_time_secret()
+            answer = await self._request_secret_interactive(OTP_SECRET_KEY, label, "")
+        self._early_otp_at = asyncio.get_running_loop().time()
+        return answer
+
+    async def _take_early_otp(self) -> Optional[str]:
+        """The code asked for early (waiting for the user if need be), once"""
+        task, self._early_otp_task = self._early_otp_task, None
+        if task is None:
+            return None
+        await asyncio.wait([task])
+        if task.cancelled() or task.exception() is not None:
+            logger.info("The early one-time code request failed, asking again")
+            return None
+        age = asyncio.get_running_loop().time() - self._early_otp_at
+        if age > EARLY_OTP_MAX_AGE:
+            logger.info(
+                f"The one-time code asked for early is {age:.0f}s old, asking again"
+            )
+            return None
+        logger.info("Answering the one-time code prompt with the code asked for early")
+        return task.result()
+
+    def _discard_early_otp(self) -> None:
+        """Drop an early code the activation never asked for"""
+        task, self._early_otp_task = self._early_otp_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            logger.info("gpclient did not ask for the one-time code - discarding it")
+
+    def _record_prompts(self) -> None:
+        """Learn this activation's prompts for the next one (see PromptHistory)"""
+        self._discard_early_otp()
+        if self._connection_uuid:
+            self._prompt_history.record(self._connection_uuid, self._prompts_seen)
 
     def _record_gateways(self, options: List[str]) -> None:
         """Remember gateways seen during this attempt, for the profile cache"""
@@ -1700,8 +4064,12 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             # commas, so neither may survive inside an entry
             entry = option.replace(",", " ").replace(GATEWAY_LIST_SEPARATOR, " ")
             entry = " ".join(entry.split())
-            if entry and entry not in self._gateway_list:
-                self._gateway_list.append(entry)
+            if not entry or entry in self._gateway_list:
+                continue
+            if len(self._gateway_list) >= GATEWAY_LIST_MAX_ENTRIES:
+                self._trimmed["gateways"] += 1
+                continue
+            self._gateway_list.append(entry)
 
     async def _handle_select_prompt(self, frame: Dict[str, Any]) -> None:
         """Answer gpclient's gateway list without interrupting the user.
@@ -1715,6 +4083,11 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self._answered_select = frame["message"]
         self._answered_at_line = self._line_counter
         self._answering = True
+        span = self._trace.span(
+            "gateway list", "prompts", offered=len(options), more=frame["more"]
+        )
+        wanted = current = None
+        steps = 0
         try:
             self._record_gateways(options)
             logger.info(f"gpclient asks to choose: {frame['message']}")
@@ -1798,6 +4171,7 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 steps += 1
         finally:
             self._answering = False
+            span.end(steps=steps, selected=current, wanted=wanted)
 
     async def _press_list_down(self) -> Optional[Dict[str, Any]]:
         """Move the list cursor one entry down, return the redrawn frame.
@@ -1812,9 +4186,8 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
         self._write_keys(KEY_DOWN, "move down the gateway list")
 
-        loop = asyncio.get_running_loop()
-        deadline = loop.time() + SELECT_REDRAW_TIMEOUT
-        while loop.time() < deadline:
+        deadline = loop_time() + SELECT_REDRAW_TIMEOUT
+        while loop_time() < deadline:
             await asyncio.sleep(SELECT_POLL_INTERVAL)
             frame = detect_select_prompt(list(self._recent_lines))
             if frame is None:
@@ -1835,6 +4208,7 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             logger.debug(f"No connection UUID, skipping nmcli {arguments}")
             return False
 
+        span = self._trace.span("nmcli modify", "nmcli", arguments=list(arguments))
         try:
             proc = await asyncio.create_subprocess_exec(
                 "nmcli",
@@ -1845,11 +4219,15 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
             )
-            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
+            _, stderr = await asyncio.wait_for(
+                proc.communicate(), timeout=NMCLI_TIMEOUT
+            )
         except Exception as e:
             logger.warning(f"nmcli modify {arguments} failed: {e}")
+            span.end(error=str(e))
             return False
 
+        span.end(returncode=proc.returncode)
         if proc.returncode != 0:
             logger.warning(
                 f"nmcli modify {arguments} failed with {proc.returncode}: "
@@ -1953,18 +4331,21 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         self._secret_future = loop.create_future()
 
         hints = [f"x-vpn-message:{message}", secret_key]
-        self.SecretsRequired.emit((message, hints))
+        with self._trace.span(
+            "SecretsRequired -> NewSecrets", "secrets", secret=secret_key, label=label
+        ):
+            self.SecretsRequired.emit((message, hints))
 
-        try:
-            secrets = await asyncio.wait_for(
-                self._secret_future, timeout=SECRETS_REQUEST_TIMEOUT
-            )
-        except asyncio.TimeoutError:
-            raise Exception(
-                f"Timed out waiting for the user to provide {secret_key!r}"
-            )
-        finally:
-            self._secret_future = None
+            try:
+                secrets = await asyncio.wait_for(
+                    self._secret_future, timeout=SECRETS_REQUEST_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise Exception(
+                    f"Timed out waiting for the user to provide {secret_key!r}"
+                )
+            finally:
+                self._secret_future = None
 
         value = secrets.get(secret_key, "")
         if not value and len(secrets) == 1:
@@ -1975,12 +4356,26 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
 
         return value
 
-    def _write_answer(self, answer: str) -> None:
+    def _write_answer(self, answer: str, secret: bool = True) -> None:
         """Type an answer into gpclient's PTY"""
+        if secret:
+            self._recorder.add_secret(answer)
         self._last_answer = answer
         # inquire (crossterm raw mode) treats \r as Enter
         self._write_keys(answer.encode("utf-8") + KEY_ENTER, "answer")
 
+    def _note_reused_password(self) -> None:
+        """gpclient --passwd-on-stdin reused the password line for this round"""
+        self._answered_password = True
+        self._prompts_seen.append(
+            {
+                "kind": "password",
+                "label": "Password",
+                "phase": self._auth_banner["kind"] if self._auth_banner else "",
+                "asked": False,
+            }
+        )
+
     def _write_keys(self, data: bytes, description: str) -> None:
         """Send raw key bytes to gpclient's PTY"""
         if self._pty_master is None:
@@ -1988,10 +4383,44 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             return
         try:
             os.write(self._pty_master, data)
+            self._recorder.input(data)
             logger.debug(f"Sent {description} to gpclient")
         except OSError as e:
             logger.error(f"Failed to send {description} to PTY: {e}")
 
+    def _note_transport(self, transport: str) -> None:
+        """Record the transport gpclient reports; enforce transport=esp"""
+        if transport == self.transport:
+            return
+        previous, self.transport = self.transport, transport
+        logger.info(
+            f"Tunnel transport: {transport.upper()}"
+            + (f" (was {previous.upper()})" if previous else "")
+        )
+        self._trace.instant("transport", "gpclient", transport=transport)
+        if transport != "tls" or self.transport_setting == "tls":
+            return
+        if self.transport_setting == "esp":
+            logger.error(
+                "ESP could not be set up and transport=esp does not allow the "
+                "HTTPS fallback - stopping the connection"
+            )
+            # Reported here, not again when gpclient exits
+            self._login_failed = True
+            self._emit_failure(NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED)
+            if self.gpclient_process:
+                try:
+                    self.gpclient_process.terminate()
+                except ProcessLookupError:
+                    pass
+        else:
+            logger.warning(
+                "ESP could not be set up - the tunnel runs over HTTPS (TCP), "
+                "which is much slower. If this network blocks UDP 4501, set "
+                "transport=tls to skip the ESP attempt; transport=esp fails "
+                "the connection instead of falling back"
+            )
+
     def _fail_login(self, reason: str) -> None:
         """Emit a login failure and terminate gpclient"""
         logger.error(f"Login failed: {reason}")
@@ -2003,19 +4432,25 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             except ProcessLookupError:
                 pass
 
-    async def _get_iface_ipv4(self, iface: str) -> Tuple[Any, int]:
-        """Get the first IPv4 address of an interface.
+    async def _get_iface_addresses(
+        self, iface: str
+    ) -> Tuple[Optional[Tuple[str, int]], Optional[Tuple[str, int]]]:
+        """Get the first IPv4 and global IPv6 address of an interface.
+
+        One `ip -o addr show dev` run (a single netlink dump) for both
+        families.
 
         Returns:
-            (ip_address, prefix) tuple; ip_address is None when the
-            interface has no IPv4 address or the lookup failed.
+            (ipv4, ipv6), each an (address, prefix) tuple or None when the
+            interface has no such address or the lookup failed.
         """
         try:
             result = await asyncio.create_subprocess_exec(
                 "ip",
-                "-4",
+                "-o",
                 "addr",
                 "show",
+                "dev",
                 iface,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
@@ -2023,26 +4458,100 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             stdout, _ = await result.communicate()
         except Exception as e:
             logger.warning(f"Failed to get tunnel IP for {iface}: {e}")
-            return None, 32
-
-        ip_addr = None
-        prefix = 32
-        for line in stdout.decode("utf-8", errors="replace").split("\n"):
-            if "inet " in line:
-                parts = line.strip().split()
-                if len(parts) >= 2:
-                    addr_with_prefix = parts[1]
-                    if "/" in addr_with_prefix:
-                        try:
-                            ip_addr, prefix_str = addr_with_prefix.split("/", 1)
-                            prefix = int(prefix_str)
-                        except ValueError:
-                            ip_addr = addr_with_prefix
-                            prefix = 32
-                    else:
-                        ip_addr = addr_with_prefix
-                break
-        return ip_addr, prefix
+            return None, None
+
+        ipv4 = ipv6 = None
+        for line in stdout.decode("utf-8", errors="replace").splitlines():
+            # "7: gpd0    inet 10.1.2.3/32 scope global gpd0\ ..."
+            # "7: gpd0    inet6 fd00::5/64 scope global \ ..."
+            parts = line.split()
+            if len(parts) < 4 or parts[2] not in ("inet", "inet6"):
+                continue
+            address, _, prefix_str = parts[3].partition("/")
+            try:
+                prefix = int(prefix_str) if prefix_str else None
+            except ValueError:
+                prefix = None
+            if parts[2] == "inet":
+                if ipv4 is None:
+                    ipv4 = (address, 32 if prefix is None else prefix)
+            elif ipv6 is None and "link" not in parts[4:6]:
+                # Link-local addresses are not what the gateway assigned
+                ipv6 = (address, 128 if prefix is None else prefix)
+        return ipv4, ipv6
+
+    def _external_gateway(self, pushed: Dict[str, str]) -> Optional[Tuple[str, Any]]:
+        """Config's gateway: the VPN server (vpnc-script's VPNGATEWAY), if pushed"""
+        import ipaddress
+
+        address = pushed.get("VPNGATEWAY", "")
+        try:
+            parsed = ipaddress.ip_address(address)
+        except ValueError:
+            if address:
+                logger.warning(f"Ignoring VPN gateway address {address!r}")
+            return None
+        if parsed.version == 4:
+            return ("u", self._ipv4_u32(address))
+        return ("ay", parsed.packed)
+
+    def _build_ip6_config(
+        self,
+        ipv6: Optional[Tuple[str, int]],
+        pushed: Dict[str, str],
+        dns_servers: List[str],
+    ) -> Optional[Dict[str, Tuple[str, Any]]]:
+        """Ip6Config for the tunnel's IPv6 address, None without one"""
+        if self.disable_ipv6 or not ipv6:
+            return None
+        import ipaddress
+
+        address, prefix = ipv6
+        try:
+            packed = ipaddress.IPv6Address(address).packed
+        except ValueError as e:
+            logger.warning(f"Ignoring tunnel IPv6 address {address}: {e}")
+            return None
+        config: Dict[str, Tuple[str, Any]] = {
+            "address": ("ay", packed),
+            "prefix": ("u", prefix),
+        }
+        logger.info(f"Added IPv6 address: {address}/{prefix}")
+
+        dns6 = []
+        for dns in dns_servers:
+            if ":" not in dns:
+                continue
+            try:
+                dns6.append(ipaddress.IPv6Address(dns).packed)
+                logger.info(f"Added IPv6 DNS server: {dns}")
+            except ValueError as e:
+                logger.warning(f"Failed to convert DNS {dns}: {e}")
+        if dns6:
+            config["dns"] = ("aay", dns6)
+
+        split_routes = []
+        if not self.ipv6_ignore_auto_routes:
+            split_routes = parse_cidr_list(pushed.get("SPLIT_INC6_ROUTES", ""))
+        if split_routes:
+            split_routes += [(dns, 128) for dns in dns_servers if ":" in dns]
+        routes = [
+            (ipaddress.IPv6Address(dest).packed, dest_prefix, bytes(16), 0)
+            for dest, dest_prefix in compact_routes(
+                split_routes, self.ipv6_never_default
+            )
+        ]
+        if routes:
+            # (dest, prefix, next hop, metric); no next hop on the tunnel
+            config["routes"] = ("a(ayuayu)", routes)
+            logger.info(f"Added {len(routes)} IPv6 routes")
+        return config
+
+    def _tunnel_candidates(self) -> List[str]:
+        """The claimed interface, or the names gpclient picks on its own"""
+        if self._activation.interface:
+            return [self._activation.interface]
+        return TUNNEL_INTERFACES
 
     async def _snapshot_tunnel_interfaces(self) -> Dict[str, Any]:
         """Record tunnel-candidate interfaces existing before gpclient starts.
@@ -2052,9 +4561,10 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         session or another VPN client's tunnel (issue #7).
         """
         snapshot = {}
-        for iface in TUNNEL_INTERFACES:
-            if os.path.exists(f"/sys/class/net/{iface}"):
-                ip_addr, _ = await self._get_iface_ipv4(iface)
+        for iface in self._tunnel_candidates():
+            if os.path.exists(os.path.join(SYS_CLASS_NET, iface)):
+                ipv4, _ = await self._get_iface_addresses(iface)
+                ip_addr = ipv4[0] if ipv4 else None
                 snapshot[iface] = ip_addr
                 logger.info(
                     f"Interface {iface} (IP: {ip_addr}) already exists before "
@@ -2063,17 +4573,99 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                 )
         return snapshot
 
-    async def _cleanup_stale_gpd0(self) -> None:
-        """Remove a leftover gpd0 interface from a previous session.
+    async def _choose_tunnel_mtu(self) -> Optional[int]:
+        """Tunnel MTU to pass as gpclient --mtu, None to leave it to gpclient"""
+        if self.mtu_setting == "off":
+            return None
+        if self.mtu_setting != "auto":
+            return int(self.mtu_setting)
+
+        host = server_host(self.gateway)
+        uplink = uplink_identity()
+        key = f"{host}|{uplink}" if uplink else ""
+
+        path_mtu = self._mtu_cache.get(key) if key else None
+        if path_mtu is not None:
+            logger.info(f"Path MTU to {host} via {uplink}: {path_mtu} (cached)")
+        else:
+            try:
+                path_mtu = await asyncio.wait_for(
+                    self._probe_path_mtu(host), timeout=PMTU_PROBE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                path_mtu = None
+            if path_mtu is None:
+                logger.info(
+                    f"Path MTU to {host} unknown - leaving the tunnel MTU to gpclient"
+                )
+                return None
+            logger.info(f"Path MTU to {host} via {uplink or '?'}: {path_mtu}")
+            if key:
+                self._mtu_cache.put(key, path_mtu)
+
+        transport = "tls" if self.transport_setting == "tls" else "esp"
+        mtu = derive_tunnel_mtu(path_mtu, transport)
+        logger.info(
+            f"Tunnel MTU: {mtu} ({transport.upper()} over a {path_mtu}-byte path)"
+        )
+        return mtu
+
+    async def _probe_path_mtu(self, host: str) -> Optional[int]:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, PMTU_PROBE_PORT, family=socket.AF_INET, type=socket.SOCK_DGRAM
+            )
+        except OSError as e:
+            logger.debug(f"Cannot resolve {host} for the path MTU probe: {e}")
+            return None
+        return await self._mtu_prober.probe(infos[0][4][0])
+
+    def _prepare_pushed_config(self) -> None:
+        """Pick the file the vpnc hook saves the pushed configuration to"""
+        self._remove_pushed_config()
+        path = os.path.join(PUSHED_CONFIG_DIR, f"pushed-config-{os.getpid()}")
+        try:
+            os.makedirs(PUSHED_CONFIG_DIR, mode=0o700, exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(path)
+        except OSError as e:
+            logger.warning(
+                f"Cannot use {path} ({e}) - vpnc-script keeps configuring DNS"
+            )
+            return
+        self._pushed_config_path = path
+
+    def _remove_pushed_config(self) -> None:
+        if not self._pushed_config_path:
+            return
+        try:
+            os.unlink(self._pushed_config_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Cannot remove {self._pushed_config_path}: {e}")
+        self._pushed_config_path = None
+
+    @staticmethod
+    def _read_iface_mtu(iface: str) -> Optional[int]:
+        try:
+            with open(os.path.join(SYS_CLASS_NET, iface, "mtu")) as handle:
+                return int(handle.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    async def _cleanup_stale_tunnels(self) -> None:
+        """Remove leftover gpdN interfaces from previous sessions.
 
-        gpd0 is created exclusively by gpclient and gpclient enforces a
-        single session via its lock file, so a gpd0 with no running gpclient
-        process is always stale. A stale gpd0 blackholes routing (the portal
-        becomes unreachable) and used to be picked up by tunnel detection as
-        a live connection (issue #7). tun0/tun1 may belong to other VPN
-        clients and are never touched.
+        gpdN is created exclusively by gpclient, so a gpdN with no running
+        gpclient process is always stale. A stale gpd0 blackholes routing (the
+        portal becomes unreachable) and used to be picked up by tunnel
+        detection as a live connection (issue #7). While any gpclient runs -
+        another session's included - nothing is touched. tun0/tun1 may belong
+        to other VPN clients and are never touched either.
         """
-        if not os.path.exists("/sys/class/net/gpd0"):
+        stale = self._gpd_interfaces()
+        if not stale:
             return
 
         try:
@@ -2086,8 +4678,8 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             )
             if await proc.wait() == 0:
                 logger.warning(
-                    "gpd0 exists and a gpclient process is running - "
-                    "not cleaning up"
+                    f"{', '.join(stale)} exist and a gpclient process is "
+                    "running - not cleaning up"
                 )
                 return
         except Exception as e:
@@ -2095,14 +4687,16 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
             return
 
         logger.warning(
-            "Found stale gpd0 interface with no gpclient process - cleaning up"
+            f"Found stale {', '.join(stale)} with no gpclient process - cleaning up"
         )
         try:
             proc = await asyncio.create_subprocess_exec(
-                "/usr/bin/gpclient", "disconnect"
+                GPCLIENT_BINARY, "disconnect"
             )
             try:
-                await asyncio.wait_for(proc.wait(), timeout=10)
+                await asyncio.wait_for(
+                    proc.wait(), timeout=GPCLIENT_DISCONNECT_TIMEOUT
+                )
             except asyncio.TimeoutError:
                 logger.warning("'gpclient disconnect' timed out, killing it")
                 proc.kill()
@@ -2110,34 +4704,51 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
         except Exception as e:
             logger.debug(f"'gpclient disconnect' during cleanup failed: {e}")
 
-        if os.path.exists("/sys/class/net/gpd0"):
+        for iface in self._gpd_interfaces():
             try:
                 proc = await asyncio.create_subprocess_exec(
-                    "ip", "link", "del", "gpd0"
+                    "ip", "link", "del", iface
                 )
                 try:
-                    await asyncio.wait_for(proc.wait(), timeout=5)
+                    await asyncio.wait_for(proc.wait(), timeout=LINK_DELETE_TIMEOUT)
                 except asyncio.TimeoutError:
-                    logger.warning("'ip link del gpd0' timed out, killing it")
+                    logger.warning(f"'ip link del {iface}' timed out, killing it")
                     proc.kill()
                     await proc.wait()
             except Exception as e:
-                logger.error(f"Failed to delete stale gpd0: {e}")
+                logger.error(f"Failed to delete stale {iface}: {e}")
+                continue
+            if not os.path.exists(os.path.join(SYS_CLASS_NET, iface)):
+                logger.info(f"Stale {iface} interface removed")
 
-        if not os.path.exists("/sys/class/net/gpd0"):
-            logger.info("Stale gpd0 interface removed")
+    @staticmethod
+    def _gpd_interfaces() -> List[str]:
+        try:
+            names = os.listdir(SYS_CLASS_NET)
+        except OSError:
+            return []
+        return sorted(
+            name
+            for name in names
+            if name.startswith(TUNNEL_INTERFACE_PREFIX)
+            and name[len(TUNNEL_INTERFACE_PREFIX):].isdigit()
+        )
 
     async def _check_tunnel_loop(self) -> None:
         """Periodically check for tunnel interface"""
+        span = self._trace.span("tunnel detection", "tunnel")
+        polls = 0
         try:
             while True:
-                for iface in TUNNEL_INTERFACES:
-                    iface_path = f"/sys/class/net/{iface}"
+                polls += 1
+                for iface in self._tunnel_candidates():
+                    iface_path = os.path.join(SYS_CLASS_NET, iface)
                     if not os.path.exists(iface_path):
                         continue
 
                     # Check if interface has an IP address (not just exists)
-                    ip_addr, prefix = await self._get_iface_ipv4(iface)
+                    ipv4, ipv6 = await self._get_iface_addresses(iface)
+                    ip_addr, prefix = ipv4 if ipv4 else (None, 32)
 
                     # Only consider interface valid if it has an IP
                     if not ip_addr:
@@ -2205,19 +4816,23 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                         "tundev": ("s", iface),
                     }
 
+                    # What openconnect actually set on the interface, falling
+                    # back to what we asked for
+                    mtu = self._read_iface_mtu(iface) or self.tunnel_mtu
+                    if mtu:
+                        config["mtu"] = ("u", mtu)
+                        logger.info(f"Added MTU: {mtu}")
+
                     # Add IP address if found
                     if ip_addr:
-                        # Convert IP to 32-bit integer (network byte order)
-                        ip_int = struct.unpack("!I", socket.inet_aton(ip_addr))[0]
-                        config["address"] = ("u", ip_int)
+                        config["address"] = ("u", self._ipv4_u32(ip_addr))
                         config["prefix"] = ("u", prefix)
                         logger.info(f"Added address: {ip_addr}/{prefix}")
 
                     # Add gateway (required by NetworkManager, even with never-default)
                     # NetworkManager uses never-default to control routing, not plugin
                     if gateway:
-                        gateway_int = struct.unpack("!I", socket.inet_aton(gateway))[0]
-                        config["gateway"] = ("u", gateway_int)
+                        config["gateway"] = ("u", self._ipv4_u32(gateway))
                         if self.never_default:
                             logger.info(
                                 f"Added gateway (but never-default is set): {gateway}"
@@ -2225,35 +4840,60 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                         else:
                             logger.info(f"Added gateway: {gateway}")
 
-                    # Add custom routes if specified
-                    if self.custom_routes:
+                    # Routes: the profile's custom routes and the split-include
+                    # routes the routing hook handed over instead of letting
+                    # vpnc-script install them, merged once. Like vpnc-script
+                    # did for a split tunnel, the pushed DNS servers are
+                    # reached through the tunnel too.
+                    pushed = read_pushed_config(self._pushed_config_path)
+                    # The profile's DNS servers override the pushed ones;
+                    # openconnect mixes both families in INTERNAL_IP4_DNS
+                    dns_servers = self.dns_servers or (
+                        pushed.get("INTERNAL_IP4_DNS", "").split()
+                        + pushed.get("INTERNAL_IP6_DNS", "").split()
+                    )
+                    split_routes = []
+                    if not self.ignore_auto_routes:
+                        split_routes = parse_cidr_list(
+                            pushed.get("SPLIT_INC_ROUTES", "")
+                        )
+                    if split_routes:
+                        split_routes += [
+                            (dns, 32)
+                            for dns in pushed.get("INTERNAL_IP4_DNS", "").split()
+                            if ":" not in dns
+                        ]
+                    wanted = self.custom_routes + split_routes
+                    if wanted:
                         routes = []
-                        for dest, dest_prefix in self.custom_routes:
-                            try:
-                                dest_int = struct.unpack("!I", socket.inet_aton(dest))[
-                                    0
-                                ]
-                                # Route format: (dest_ip, prefix, next_hop, metric)
-                                # For VPN, next_hop is usually 0 (direct route)
-                                routes.append((dest_int, dest_prefix, 0, 0))
-                                logger.info(f"Added custom route: {dest}/{dest_prefix}")
-                            except Exception as e:
-                                logger.warning(
-                                    f"Failed to add route {dest}/{dest_prefix}: {e}"
-                                )
+                        for dest, dest_prefix in compact_routes(
+                            wanted, self.never_default
+                        ):
+                            # (dest, prefix, next hop, metric); no next hop on
+                            # a point-to-point tunnel. Addresses are network
+                            # byte order in memory, like the DNS servers below.
+                            routes.append((self._ipv4_u32(dest), dest_prefix, 0, 0))
+                            logger.debug(f"Added route: {dest}/{dest_prefix}")
 
                         if routes:
                             config["routes"] = ("a(uuuu)", routes)
+                            logger.info(
+                                f"Added {len(routes)} routes ("
+                                f"{len(self.custom_routes)} custom, "
+                                f"{len(split_routes)} pushed)"
+                            )
 
-                    # Add DNS servers if configured
-                    if self.dns_servers:
+                    # DNS: the servers (IPv6 ones go to Ip6Config), and the
+                    # domains telling NetworkManager which names go to them
+                    if dns_servers:
                         # Convert DNS servers to integer format
                         dns_list = []
-                        for dns in self.dns_servers:
+                        for dns in dns_servers:
+                            if ":" in dns:
+                                continue
                             try:
                                 # Convert IP string to 32-bit integer
-                                dns_int = struct.unpack("<I", socket.inet_aton(dns))[0]
-                                dns_list.append(dns_int)
+                                dns_list.append(self._ipv4_u32(dns))
                                 logger.info(f"Added DNS server: {dns}")
                             except Exception as e:
                                 logger.warning(f"Failed to convert DNS {dns}: {e}")
@@ -2261,8 +4901,41 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                         if dns_list:
                             config["dns"] = ("au", dns_list)
 
+                    domains = dns_search_domains(pushed, self.dns_domains)
+                    if domains:
+                        config["domains"] = ("as", domains)
+                        logger.info(f"Added DNS domains: {domains}")
+
+                    ip6_config = self._build_ip6_config(ipv6, pushed, dns_servers)
+
+                    span.end(
+                        iface=iface,
+                        address=f"{ip_addr}/{prefix}",
+                        address6=f"{ipv6[0]}/{ipv6[1]}" if ip6_config else "",
+                        polls=polls,
+                    )
+                    self._set_log_context(PHASE="started")
+
+                    # The generic part first: it tells NetworkManager which of
+                    # Ip4Config and Ip6Config to wait for
+                    generic: Dict[str, Tuple[str, Any]] = {
+                        "tundev": ("s", iface),
+                        "has-ip4": ("b", True),
+                        "has-ip6": ("b", ip6_config is not None),
+                    }
+                    # "gateway" here is the VPN server's public address, which
+                    # NetworkManager pins a host route to; not the tunnel's
+                    external = self._external_gateway(pushed)
+                    if external:
+                        generic["gateway"] = external
+                    if "mtu" in config:
+                        generic["mtu"] = config["mtu"]
+                    self.Config.emit(generic)
+
                     # Emit Ip4Config signal
                     self.Ip4Config.emit(config)
+                    if ip6_config is not None:
+                        self.Ip6Config.emit(ip6_config)
 
                     # Emit state change: activated
                     self.StateChanged.emit(NM_VPN_SERVICE_STATE_STARTED)
@@ -2273,22 +4946,24 @@ class GpclientVPNPlugin(DbusInterfaceCommonAsync, interface_name=NM_DBUS_INTERFA
                     # legacy TLS workaround
                     await self._persist_gateway_list()
                     await self._persist_fix_openssl()
+                    self._record_prompts()
+                    self._trace.finish("started", self._connection_uuid)
+                    self._profiler.stop("started")
 
                     # Stop checking
                     return
 
-                # Wait 500ms before next check
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(TUNNEL_POLL_INTERVAL)
 
         except asyncio.CancelledError:
             logger.debug("Tunnel monitoring cancelled")
+            span.end(cancelled=True, polls=polls)
             raise
 
 
 async def main_async():
     """Async main entry point"""
     import argparse
-    import hashlib
 
     parser = argparse.ArgumentParser(description="NetworkManager gpclient VPN service")
     parser.add_argument(
@@ -2297,6 +4972,18 @@ async def main_async():
         help="Don't quit when VPN connection terminates",
     )
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument(
+        "--bus-name",
+        default=NM_DBUS_SERVICE_GPCLIENT,
+        help="D-Bus name to own (NetworkManager passes one per connection)",
+    )
+    parser.add_argument(
+        "--idle-exit",
+        type=float,
+        metavar="SECONDS",
+        help=f"Exit after this long without a session (default "
+        f"${IDLE_EXIT_ENV} or {IDLE_EXIT_TIMEOUT}, 0 never)",
+    )
     args = parser.parse_args()
 
     # Enable debug mode: from --debug flag or GPCLIENT_DEBUG env var (default: disabled for security)
@@ -2305,43 +4992,38 @@ async def main_async():
     if debug_mode:
         logger.setLevel(logging.DEBUG)
 
-    logger.info("Starting gpclient VPN service (python-sdbus)")
-
-    # Log version information in debug mode
-    if debug_mode:
-        try:
-            import datetime
+    configure_journal_logging()
 
-            script_path = os.path.abspath(__file__)
-            with open(script_path, "rb") as f:
-                script_hash = hashlib.md5(f.read()).hexdigest()
-            mtime = os.path.getmtime(script_path)
-            mtime_str = datetime.datetime.fromtimestamp(mtime).strftime(
-                "%Y-%m-%d %H:%M:%S"
-            )
-            logger.debug(f"Script path: {script_path}")
-            logger.debug(f"Script modified: {mtime_str}")
-            logger.debug(f"Script MD5: {script_hash}")
-            logger.debug(f"Python version: {sys.version}")
-            logger.debug("Using python-sdbus (not python-sdbus-networkmanager)")
-        except Exception as e:
-            logger.debug(f"Failed to compute script hash: {e}")
+    logger.info("Starting gpclient VPN service (python-sdbus)")
+    apply_service_config()
 
     # Set system bus as default BEFORE creating any D-Bus objects
     bus = sd_bus_open_system()
     set_default_bus(bus)
     logger.debug("Set system bus as default")
 
-    # Request service name FIRST. If another instance already owns the name
+    # Create and export our VPN plugin object before taking the name: under
+    # D-Bus activation NetworkManager's first call arrives as soon as the name
+    # appears, and must find the object there
+    plugin = GpclientVPNPlugin()
+    plugin.export_to_dbus(NM_DBUS_PATH_GPCLIENT)
+    logger.debug(f"Exported object to path: {NM_DBUS_PATH_GPCLIENT}")
+
+    # Then request the service name. If another instance already owns the name
     # (typical: systemd/D-Bus auto-activated us when NetworkManager first
     # touched the VPN) we exit with a clear message instead of dumping a
     # raw sd-bus traceback that users tend to read as "VPN broken".
+    #
+    # NetworkManager starts one instance per connection with --bus-name
+    # (supports-multiple-connections in the .name file), so concurrent
+    # sessions each get their own process and plugin object.
+    bus_name = args.bus_name
     try:
-        await request_default_bus_name_async(NM_DBUS_SERVICE_GPCLIENT)
+        await request_default_bus_name_async(bus_name)
     except Exception as e:
         if type(e).__name__ == "SdBusRequestNameExistsError":
             print(
-                f"ERROR: D-Bus name {NM_DBUS_SERVICE_GPCLIENT} is already owned\n"
+                f"ERROR: D-Bus name {bus_name} is already owned\n"
                 "by another nm-gpclient-service instance (likely auto-started\n"
                 "by systemd/D-Bus). To run this binary manually for debugging,\n"
                 "stop the auto-started instance first:\n"
@@ -2352,14 +5034,31 @@ async def main_async():
             )
             sys.exit(1)
         raise
-    logger.info(f"Acquired D-Bus service name: {NM_DBUS_SERVICE_GPCLIENT}")
-
-    # Create and export our VPN plugin object
-    plugin = GpclientVPNPlugin()
-    plugin.export_to_dbus(NM_DBUS_PATH_GPCLIENT)
-    logger.debug(f"Exported object to path: {NM_DBUS_PATH_GPCLIENT}")
+    logger.info(f"Acquired D-Bus service name: {bus_name}")
     logger.debug("D-Bus interfaces fully registered and ready")
 
+    # Log version information in debug mode - once the name is ours, so
+    # hashing the service does not hold up the activating call
+    if debug_mode:
+        try:
+            import datetime
+            import hashlib
+
+            script_path = os.path.abspath(__file__)
+            with open(script_path, "rb") as f:
+                script_hash = hashlib.md5(f.read()).hexdigest()
+            mtime = os.path.getmtime(script_path)
+            mtime_str = datetime.datetime.fromtimestamp(mtime).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+            logger.debug(f"Script path: {script_path}")
+            logger.debug(f"Script modified: {mtime_str}")
+            logger.debug(f"Script MD5: {script_hash}")
+            logger.debug(f"Python version: {sys.version}")
+            logger.debug("Using python-sdbus (not python-sdbus-networkmanager)")
+        except Exception as e:
+            logger.debug(f"Failed to compute script hash: {e}")
+
     # Setup signal handlers using asyncio Event
     shutdown_event = asyncio.Event()
 
@@ -2371,6 +5070,34 @@ async def main_async():
         asyncio.get_event_loop().add_signal_handler(
             sig, lambda s=sig: signal_handler(s)
         )
+    # Reloading leaves a session in progress alone
+    asyncio.get_event_loop().add_signal_handler(signal.SIGHUP, apply_service_config)
+    asyncio.get_event_loop().add_signal_handler(
+        signal.SIGUSR1, plugin._profiler.start, "SIGUSR1"
+    )
+    asyncio.get_event_loop().add_signal_handler(
+        signal.SIGUSR2, plugin._profiler.stop, "SIGUSR2"
+    )
+
+    # Exit when idle; D-Bus activation brings the service back
+    idle_exit = args.idle_exit
+    if idle_exit is None:
+        try:
+            idle_exit = float(os.environ.get(IDLE_EXIT_ENV, IDLE_EXIT_TIMEOUT))
+        except ValueError:
+            idle_exit = IDLE_EXIT_TIMEOUT
+    idle_task = None
+    if args.persist or idle_exit <= 0:
+        logger.debug("Idle exit disabled")
+    else:
+
+        def on_idle(task):
+            if not task.cancelled():
+                logger.info(f"No session for {idle_exit:g}s, exiting")
+                shutdown_event.set()
+
+        idle_task = asyncio.create_task(plugin.wait_until_idle(idle_exit))
+        idle_task.add_done_callback(on_idle)
 
     # Run forever
     try:
@@ -2382,12 +5109,18 @@ async def main_async():
         return 1
     finally:
         # Cleanup
+        if idle_task:
+            idle_task.cancel()
+        plugin._profiler.stop("shutdown")
         if plugin.gpclient_process:
             try:
                 plugin.gpclient_process.terminate()
-                await asyncio.wait_for(plugin.gpclient_process.wait(), timeout=5)
+                await asyncio.wait_for(
+                    plugin.gpclient_process.wait(), timeout=GPCLIENT_TERMINATE_TIMEOUT
+                )
             except:
                 pass
+        plugin._activation.release()
 
     logger.info("gpclient VPN service stopped")
     return 0
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Connect-path benchmarks for the nm-gpclient service.
+
+Drives GpclientVPNPlugin.ConnectInteractive() against the scripted
+fake-gpclient.py scenarios, with fake ip/nmcli/pgrep/pkill/loginctl from
+tests/bench/shims first on PATH, interfaces in a temporary directory instead of
+/sys/class/net, private MTU cache and claim directories and the same sdbus stub as the unit tests. No network, root or
+NetworkManager is needed.
+
+Every activation is traced (see "Activation traces" in docs/PYTHON_SERVICE.md),
+so the report has p50/p95 for time-to-STARTED and for each traced phase. Results
+are appended to a JSON history file, and --compare fails when a phase got slower
+than in the previous run.
+
+Run with: make bench  (or: python3 tests/bench/bench_connect.py -n 20 otp saml)
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+SERVICE_PATH = os.path.join(ROOT, "service", "nm-gpclient-service.py")
+CONFTEST_PATH = os.path.join(ROOT, "tests", "unit", "conftest.py")
+FAKE_GPCLIENT = os.path.join(HERE, "fake-gpclient.py")
+SHIMS = os.path.join(HERE, "shims")
+
+DEFAULT_HISTORY = os.path.join(ROOT, "artifacts", "bench-history.json")
+
+# A phase only counts as regressed when it is slower by both margins - the
+# relative one alone flags noise in phases that take a millisecond
+REGRESSION_RATIO = 0.20
+REGRESSION_MIN_MS = 20.0
+
+STARTED_TIMEOUT = 30
+
+SCENARIOS = {
+    "saml": {},
+    "credentials": {"auth-mode": "credentials", "username": "jdoe"},
+    "otp": {"auth-mode": "credentials", "username": "jdoe"},
+    "multigateway": {"preferred-gateway": "gw-london"},
+    "openssl": {"fix-openssl": "auto"},
+}
+SCENARIO_SECRETS = {
+    "credentials": {"password": "s3cret"},
+    "otp": {"password": "s3cret"},
+}
+
+
+def load_service():
+    """Import the service with the unit tests' sdbus stub in place"""
+    spec = importlib.util.spec_from_file_location("bench_conftest", CONFTEST_PATH)
+    conftest = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conftest)
+    conftest._install_sdbus_stub()
+
+    spec = importlib.util.spec_from_file_location("nm_gpclient_service", SERVICE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile (no interpolation; fine for a handful of runs)"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _connection(scenario, uuid):
+    # The path MTU probe goes to the server: keep it on this machine
+    data = {"gateway": "127.0.0.1", "browser": "/bin/true"}
+    data.update(SCENARIOS[scenario])
+    return {
+        "connection": {"uuid": ("s", uuid), "id": ("s", f"bench-{scenario}")},
+        "vpn": {
+            "data": ("a{ss}", data),
+            "secrets": ("a{ss}", dict(SCENARIO_SECRETS.get(scenario, {}))),
+        },
+        "ipv4": {},
+    }
+
+
+def _phase_durations(trace_path):
+    """Milliseconds per traced phase (spans of the same name are summed)"""
+    with open(trace_path) as handle:
+        events = json.load(handle)["traceEvents"]
+    phases = {}
+    for event in events:
+        if event["ph"] == "X":
+            phases[event["name"]] = phases.get(event["name"], 0.0) + event["dur"] / 1000
+    return phases
+
+
+async def _activate(service, scenario, workdir, index):
+    """One activation and disconnect; returns {phase: milliseconds}"""
+    plugin = service.GpclientVPNPlugin()
+    trace_path = os.path.join(workdir, f"{scenario}-{index}.json")
+    plugin._trace.path = trace_path
+    plugin._mtu_cache = service.MtuCache(os.path.join(workdir, "mtu-cache.json"))
+    plugin._prompt_history = service.PromptHistory(
+        os.path.join(workdir, "prompt-history.json")
+    )
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def on_state(state):
+        if state == service.NM_VPN_SERVICE_STATE_STARTED and not started.done():
+            started.set_result(time.perf_counter())
+
+    def on_failure(reason):
+        if not started.done():
+            started.set_exception(RuntimeError(f"{scenario}: activation failed ({reason})"))
+
+    def on_secrets_required(payload):
+        _message, hints = payload
+        answer = {hint: "123456" for hint in hints if not hint.startswith("x-vpn-")}
+        loop.create_task(
+            plugin.NewSecrets({"vpn": {"secrets": ("a{ss}", answer)}})
+        )
+
+    # The stub's signals record into a list; listen to them directly instead
+    cls = service.GpclientVPNPlugin
+    hooks = {
+        cls.StateChanged: on_state,
+        cls.Failure: on_failure,
+        cls.SecretsRequired: on_secrets_required,
+    }
+    saved = {signal: signal.emit for signal in hooks}
+    for signal, hook in hooks.items():
+        signal.emit = hook
+
+    try:
+        begin = time.perf_counter()
+        # The same profile every time, like a user reconnecting: what the
+        # service learns about it (PromptHistory) applies from the third run
+        await plugin.ConnectInteractive(_connection(scenario, f"bench-{scenario}"), {})
+        connected = await asyncio.wait_for(started, STARTED_TIMEOUT)
+        # The trace is written once the profile updates after STARTED are done
+        await asyncio.wait_for(plugin.tunnel_check_task, STARTED_TIMEOUT)
+
+        disconnect_begin = time.perf_counter()
+        await plugin.Disconnect()
+        finished = time.perf_counter()
+    finally:
+        for signal, emit in saved.items():
+            signal.emit = emit
+
+    phases = _phase_durations(trace_path)
+    phases["time-to-STARTED"] = (connected - begin) * 1000
+    phases["Disconnect()"] = (finished - disconnect_begin) * 1000
+    return phases
+
+
+def run_scenario(service, scenario, iterations):
+    """Run `scenario` `iterations` times; returns {phase: [milliseconds]}"""
+    samples = {}
+    with tempfile.TemporaryDirectory(prefix="gpclient-bench-") as workdir:
+        net = os.path.join(workdir, "net")
+        os.mkdir(net)
+        launcher = os.path.join(workdir, "gpclient")
+        with open(launcher, "w") as handle:
+            handle.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_GPCLIENT}" "$@"\n')
+        os.chmod(launcher, 0o755)
+
+        service.GPCLIENT_BINARY = launcher
+        service.SYS_CLASS_NET = net
+        service.ACTIVATION_DIR = os.path.join(workdir, "activations")
+        service.GPCLIENT_LOCK_FILE = os.path.join(workdir, "gpclient.lock")
+        service.PUSHED_CONFIG_DIR = workdir
+        os.environ["BENCH_NET"] = net
+        os.environ["BENCH_SCENARIO"] = scenario
+
+        for index in range(iterations):
+            phases = asyncio.run(_activate(service, scenario, workdir, index))
+            for phase, value in phases.items():
+                samples.setdefault(phase, []).append(value)
+    return samples
+
+
+def summarize(samples):
+    return {
+        phase: {
+            "p50_ms": round(percentile(values, 0.50), 3),
+            "p95_ms": round(percentile(values, 0.95), 3),
+            "runs": len(values),
+        }
+        for phase, values in sorted(samples.items())
+    }
+
+
+def print_report(results):
+    for scenario, phases in results.items():
+        print(f"\n{scenario}")
+        width = max(len(phase) for phase in phases)
+        for phase, stats in phases.items():
+            print(
+                f"  {phase:<{width}}  p50 {stats['p50_ms']:9.1f} ms"
+                f"  p95 {stats['p95_ms']:9.1f} ms"
+            )
+
+
+def _git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "-C", ROOT, "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return result.stdout.strip()
+
+
+def load_history(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return []
+
+
+def regressions(previous, current):
+    """Phases whose p50 got slower than in `previous`, as report lines"""
+    found = []
+    for scenario, phases in current.items():
+        before = previous.get("results", {}).get(scenario, {})
+        for phase, stats in phases.items():
+            if phase not in before:
+                continue
+            old, new = before[phase]["p50_ms"], stats["p50_ms"]
+            if new > old * (1 + REGRESSION_RATIO) and new - old > REGRESSION_MIN_MS:
+                found.append(f"{scenario}/{phase}: p50 {old:.1f} -> {new:.1f} ms")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", help=f"default: all of {list(SCENARIOS)}")
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="exit with 1 when a phase regressed against the previous history entry",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="service logs")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown}")
+
+    for key in ("SUDO_UID", "SUDO_USER", "GPCLIENT_TRACE", "GPCLIENT_RECORD"):
+        os.environ.pop(key, None)
+    os.environ["PATH"] = SHIMS + os.pathsep + os.environ.get("PATH", "")
+
+    service = load_service()
+    service.logger.setLevel(logging.DEBUG if args.verbose else logging.ERROR)
+
+    results = {}
+    for scenario in args.scenarios or list(SCENARIOS):
+        results[scenario] = summarize(run_scenario(service, scenario, args.iterations))
+    print_report(results)
+
+    history = load_history(args.history)
+    previous = history[-1] if history else None
+    history.append(
+        {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "results": results,
+        }
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, "w") as handle:
+        json.dump(history, handle, indent=1)
+    print(f"\nResults appended to {args.history}")
+
+    if args.compare and previous:
+        slower = regressions(previous, results)
+        if slower:
+            print("\nSlower than the previous run:")
+            for line in slower:
+                print(f"  {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+PTY read throughput benchmark: a multi-megabyte gpclient session pushed through
+a real PTY into the service's output monitor - PtyReader, the incremental
+decoder, ANSI stripping, line splitting and the per-line checks.
+
+The session is a synthetic verbose one by default: coloured log lines from
+gpclient and openconnect, gateway names with non-ASCII characters, a Select
+frame with its ↑↓ help line and \\r redraws. With --capture, the output of an
+asciicast recording (GPCLIENT_RECORD, see docs/PYTHON_SERVICE.md) is replayed
+instead. A writer process puts it on the PTY in writes of random size, so reads
+end in the middle of multi-byte characters the way they do in a real session.
+
+The report has p50/p95 for the replay and the throughput, and how many U+FFFD
+the decoding produced - zero for a session that is valid UTF-8, against the
+count decoding every read on its own would have given. The cleanup on its own
+is timed too, in-process in reads of PTY_READ_SIZE: AnsiTokenizer, and for
+comparison decoding followed by strip_ansi() and a line split on \r and \n,
+the way the output was cleaned before the tokenizer. Results are appended to
+a JSON history file like bench_connect.py's, and --compare fails when the
+replay got slower than in the previous run.
+
+Run with: make bench-pty-read  (or: python3 tests/bench/bench_pty_read.py --size 8)
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import logging
+import os
+import platform
+import pty
+import random
+import re
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+
+DEFAULT_HISTORY = os.path.join(ROOT, "artifacts", "bench-pty-read-history.json")
+
+REPLAY_TIMEOUT = 120
+
+# Writes the file in argv[1] to the (raw) terminal once a byte arrives on
+# stdin, in writes of 1..argv[3] bytes chosen with the seed in argv[2]
+WRITER = """
+import os, random, sys, tty
+tty.setraw(0)
+data = open(sys.argv[1], "rb").read()
+os.read(0, 1)
+rng = random.Random(int(sys.argv[2]))
+limit = int(sys.argv[3])
+view = memoryview(data)
+offset = 0
+while offset < len(data):
+    offset += os.write(1, view[offset : offset + rng.randint(1, limit)])
+"""
+
+GATEWAYS = ["gw-zürich", "gw-kraków", "gw-malmö", "gw-são-paulo", "gw-東京"]
+
+SELECT_FRAME = (
+    "\x1b[?25l\x1b[32m?\x1b[0m Which gateway do you want to connect to?\r\n"
+    "\x1b[36m>\x1b[0m {first} ({first}.example.com)\r\n"
+    "  {second} ({second}.example.com)\r\n"
+    "\x1b[36m[↑↓ to move, enter to select, type to filter]\x1b[0m\r\n"
+    "\x1b[4A\r\x1b[2K"
+)
+
+
+def load_service():
+    """Import the service with the unit tests' sdbus stub in place"""
+    sys.path.insert(0, HERE)
+    from bench_connect import load_service as load
+
+    return load()
+
+
+def synthetic_session(size, seed=1):
+    """About `size` bytes of verbose gpclient output"""
+    rng = random.Random(seed)
+    parts = [
+        SELECT_FRAME.format(first=GATEWAYS[0], second=GATEWAYS[1]).encode(),
+        "\x1b[?25h\r\n".encode(),
+    ]
+    total = sum(len(part) for part in parts)
+    counter = 0
+    while total < size:
+        counter += 1
+        gateway = rng.choice(GATEWAYS)
+        kind = rng.random()
+        if kind < 0.5:
+            line = (
+                f"\x1b[2m2026-01-01T00:00:00Z\x1b[0m \x1b[32mDEBUG\x1b[0m "
+                f"openconnect: ESP session established with {gateway}.example.com "
+                f"seq {counter}\r\n"
+            )
+        elif kind < 0.8:
+            line = (
+                f"\x1b[32m INFO\x1b[0m \x1b[2mgpclient::connect\x1b[0m: "
+                f"gateway {gateway} latency {rng.randint(5, 300)} ms\r\n"
+            )
+        elif kind < 0.95:
+            # A progress line redrawn in place
+            line = f"\r\x1b[2KReceived {counter * 1400} bytes from {gateway}"
+            if rng.random() < 0.2:
+                line += "\r\n"
+        else:
+            line = SELECT_FRAME.format(first=gateway, second=rng.choice(GATEWAYS))
+        encoded = line.encode()
+        parts.append(encoded)
+        total += len(encoded)
+    return b"".join(parts)
+
+
+def load_capture(path):
+    """The output of an asciicast v2 recording, as the bytes gpclient wrote"""
+    output = []
+    with open(path, encoding="utf-8") as handle:
+        next(handle)  # header
+        for line in handle:
+            event = json.loads(line)
+            if event[1] == "o":
+                # Stored with surrogateescape: invalid bytes come back as they were
+                output.append(event[2].encode("utf-8", errors="surrogateescape"))
+    return b"".join(output)
+
+
+def chunked_replacements(data, seed, limit):
+    """U+FFFD from decoding each write on its own, the way reads used to be"""
+    rng = random.Random(seed)
+    count = offset = 0
+    while offset < len(data):
+        size = rng.randint(1, limit)
+        count += data[offset : offset + size].decode("utf-8", errors="replace").count("�")
+        offset += size
+    return count
+
+
+async def replay_once(service, path, seed, limit):
+    """One replay; returns (seconds, U+FFFD the monitor saw)"""
+    plugin = service.GpclientVPNPlugin()
+    replaced = 0
+    feed = plugin._tokenizer.feed
+
+    def counting(data, final=False):
+        nonlocal replaced
+        tokens = feed(data, final)
+        replaced += sum(
+            token.count("�") for token in tokens if isinstance(token, str)
+        )
+        return tokens
+
+    plugin._tokenizer.feed = counting
+
+    master, slave = pty.openpty()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        WRITER,
+        path,
+        str(seed),
+        str(limit),
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+    )
+    os.close(slave)
+    plugin._pty_master = master
+    plugin.gpclient_process = process
+
+    # Not timed: the writer's start-up, up to it waiting for the go byte
+    await asyncio.sleep(0.2)
+    begin = time.perf_counter()
+    os.write(master, b"g")
+    monitor = asyncio.create_task(plugin._monitor_gpclient_output())
+    try:
+        await asyncio.wait_for(monitor, timeout=REPLAY_TIMEOUT)
+    finally:
+        if not monitor.done():
+            monitor.cancel()
+        if plugin._prompt_task and not plugin._prompt_task.done():
+            plugin._prompt_task.cancel()
+        plugin._close_pty()
+    return time.perf_counter() - begin, replaced
+
+
+def split_lines(tail, text):
+    """The service's line split before AnsiTokenizer: (new lines, new tail)"""
+    segments = re.split(r"[\r\n]", tail + text)
+    return [seg for seg in segments[:-1] if seg.strip()], segments[-1]
+
+
+def clean_once(service, data, tokenizer=True):
+    """Milliseconds to clean `data` and split it into lines, read by read"""
+    size = service.PTY_READ_SIZE
+    chunks = [data[offset : offset + size] for offset in range(0, len(data), size)]
+    scanner = service.OutputScanner()
+    begin = time.perf_counter()
+    if tokenizer:
+        tokens = service.AnsiTokenizer()
+        for chunk in chunks:
+            scanner.feed_tokens(tokens.feed(chunk))
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        tail = ""
+        for chunk in chunks:
+            _lines, tail = split_lines(tail, service.strip_ansi(decoder.decode(chunk)))
+    return (time.perf_counter() - begin) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    parser.add_argument(
+        "--size", type=float, default=4, help="synthetic session size in MB"
+    )
+    parser.add_argument("--capture", help="replay this asciicast recording instead")
+    parser.add_argument(
+        "--write-size", type=int, default=8192, help="largest single write, in bytes"
+    )
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="exit with 1 when the replay regressed against the previous history entry",
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.pop("GPCLIENT_RECORD", None)
+    os.environ.pop("GPCLIENT_TRACE", None)
+    service = load_service()
+    service.logger.setLevel(logging.ERROR)
+
+    if args.capture:
+        data = load_capture(args.capture)
+        name = f"capture-{os.path.basename(args.capture)}"
+    else:
+        data = synthetic_session(int(args.size * 1024 * 1024))
+        name = f"synthetic-{args.size:g}mb"
+
+    with tempfile.NamedTemporaryFile(prefix="bench-pty-read-") as session:
+        session.write(data)
+        session.flush()
+
+        samples, replaced = [], []
+        for seed in range(args.iterations):
+            elapsed, count = asyncio.run(
+                replay_once(service, session.name, seed, args.write_size)
+            )
+            samples.append(elapsed * 1000)
+            replaced.append(count)
+
+    phases = {"replay": samples, "clean": [], "clean-strip-ansi": []}
+    for _ in range(args.iterations):
+        phases["clean"].append(clean_once(service, data))
+        phases["clean-strip-ansi"].append(clean_once(service, data, tokenizer=False))
+
+    bench = sys.modules["bench_connect"]
+    results = {f"pty-read-{name}": bench.summarize(phases)}
+    bench.print_report(results)
+    megabytes = len(data) / (1024 * 1024)
+    best = min(samples) / 1000
+    print(f"  {megabytes:.1f} MB, best {megabytes / best:.1f} MB/s")
+    print(
+        f"  U+FFFD: {max(replaced)} decoded, "
+        f"{chunked_replacements(data, 0, args.write_size)} decoding each write alone"
+    )
+
+    history = bench.load_history(args.history)
+    previous = history[-1] if history else None
+    history.append(
+        {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": bench._git_revision(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "bytes": len(data),
+            "results": results,
+        }
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, "w") as handle:
+        json.dump(history, handle, indent=1)
+    print(f"\nResults appended to {args.history}")
+
+    if args.compare and previous:
+        slower = bench.regressions(previous, results)
+        if slower:
+            print("\nSlower than the previous run:")
+            for line in slower:
+                print(f"  {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
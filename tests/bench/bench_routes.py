@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Route compaction benchmark: synthetic split-include lists the size some portals
+push, through config/90-gpclient-routing (as vpnc-script sources it) and
+through compact_routes() in the service.
+
+The synthetic list mixes what real portals push: runs of adjacent /24s,
+duplicates, hosts inside pushed networks, scattered /16-/30 networks and a
+default route. The report shows how many routes are left to install and how
+long each stage took.
+
+Run with: make bench-routes  (or: python3 tests/bench/bench_routes.py -n 10000)
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+HOOK = os.path.join(ROOT, "config", "90-gpclient-routing")
+
+# Prints what vpnc-script would install after sourcing the hook
+HOOK_DRIVER = f""". "{HOOK}"
+_i=0
+while [ "$_i" -lt "$CISCO_SPLIT_INC" ]; do
+  eval "echo \\$CISCO_SPLIT_INC_${{_i}}_ADDR/\\$CISCO_SPLIT_INC_${{_i}}_MASKLEN"
+  _i=$((_i+1))
+done
+"""
+
+
+def load_service():
+    """Import the service with the unit tests' sdbus stub in place"""
+    sys.path.insert(0, HERE)
+    from bench_connect import load_service as load
+
+    return load()
+
+
+def synthetic_routes(count, seed=1):
+    """(address, prefix) pairs the way a large portal pushes them"""
+    rng = random.Random(seed)
+    routes = [("0.0.0.0", 0)]
+    while len(routes) < count:
+        kind = rng.random()
+        base = rng.randrange(1 << 24) << 8
+        if kind < 0.4:
+            # A run of adjacent /24s (one site's subnets listed one by one)
+            for step in range(rng.randint(2, 16)):
+                routes.append((str(ipaddress.IPv4Address(base + step * 256)), 24))
+        elif kind < 0.6 and len(routes) > 1:
+            # Duplicate, or a host inside an earlier network
+            address, prefix = rng.choice(routes)
+            network = ipaddress.IPv4Network(f"{address}/{prefix}", strict=False)
+            if prefix and rng.random() < 0.5:
+                host = network[rng.randrange(network.num_addresses)]
+                routes.append((str(host), 32))
+            else:
+                routes.append((address, prefix))
+        else:
+            prefix = rng.randint(16, 30)
+            routes.append((str(ipaddress.IPv4Address(base + rng.randrange(256))), prefix))
+    return routes[:count]
+
+
+def hook_environment(routes, never_default):
+    # Only the fields openconnect sets for a plain route: with the protocol and
+    # ports too, 10k routes do not fit in an exec() environment
+    env = {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "GPCLIENT_NM_NEVER_DEFAULT": "1" if never_default else "0",
+        "CISCO_SPLIT_INC": str(len(routes)),
+    }
+    for index, (address, prefix) in enumerate(routes):
+        mask = ipaddress.IPv4Network(f"0.0.0.0/{prefix}").netmask
+        env[f"CISCO_SPLIT_INC_{index}_ADDR"] = address
+        env[f"CISCO_SPLIT_INC_{index}_MASK"] = str(mask)
+        env[f"CISCO_SPLIT_INC_{index}_MASKLEN"] = str(prefix)
+    return env
+
+
+def run_hook(routes, never_default=True, shell="sh"):
+    """Source the hook like vpnc-script; returns ([cidr], seconds)"""
+    env = hook_environment(routes, never_default)
+    begin = time.perf_counter()
+    result = subprocess.run(
+        [shell, "-c", HOOK_DRIVER], env=env, capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - begin
+    return result.stdout.split(), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--routes", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--shell", default="sh", help="shell sourcing the hook")
+    args = parser.parse_args(argv)
+
+    service = load_service()
+    routes = synthetic_routes(args.routes)
+
+    hook_times, service_times = [], []
+    for _ in range(args.repeat):
+        installed, elapsed = run_hook(routes, shell=args.shell)
+        hook_times.append(elapsed)
+        begin = time.perf_counter()
+        compacted = service.compact_routes(routes, never_default=True)
+        service_times.append(time.perf_counter() - begin)
+
+    expected = [f"{address}/{prefix}" for address, prefix in compacted]
+    print(f"{len(routes)} pushed routes -> {len(installed)} to install")
+    print(f"  hook ({args.shell})        best {min(hook_times) * 1000:8.1f} ms")
+    print(f"  compact_routes()   best {min(service_times) * 1000:8.1f} ms")
+    if sorted(installed) != sorted(expected):
+        print("hook and compact_routes() disagree", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Memory soak benchmark: one long-lived GpclientVPNPlugin reconnects thousands
+of times through the scripted fake-gpclient.py scenarios, the way a service
+that stays up for weeks does, and its resident set size must stay flat.
+
+The setup is bench_connect.py's (fake gpclient, ip, nmcli and friends, no root,
+network or NetworkManager), but with one plugin and one event loop for the
+whole run, and with the tunnel poll and prompt debounce shortened so a
+reconnect takes tens of milliseconds. The scenarios take turns, so prompts,
+secrets requests, the gateway list and the --fix-openssl retry all run
+thousands of times.
+
+RSS is sampled every --sample-every reconnects after a full garbage collection.
+The run fails when RSS at the end is more than --max-growth MiB above where it
+was after the --warmup reconnects. With --tracemalloc the service's own
+TakeMemorySnapshot() is taken at both points and the biggest differences are
+printed.
+
+Run with: make bench-soak  (or: python3 tests/bench/bench_soak.py -n 1000)
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STARTED_TIMEOUT = 30
+
+
+def rss_bytes():
+    """Resident set size of this process"""
+    with open("/proc/self/statm") as handle:
+        return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def soak(service, bench, plugin, scenarios, args):
+    """Reconnect args.reconnects times; returns [(reconnects, RSS)]"""
+    loop = asyncio.get_running_loop()
+    started = None
+
+    def on_state(state):
+        if state == service.NM_VPN_SERVICE_STATE_STARTED and not started.done():
+            started.set_result(None)
+
+    def on_failure(reason):
+        if not started.done():
+            started.set_exception(RuntimeError(f"activation failed ({reason})"))
+
+    def on_secrets_required(payload):
+        _message, hints = payload
+        answer = {hint: "123456" for hint in hints if not hint.startswith("x-vpn-")}
+        loop.create_task(plugin.NewSecrets({"vpn": {"secrets": ("a{ss}", answer)}}))
+
+    # The stub's signals record into a list, which would grow for the whole
+    # run: listen to the ones that matter, drop the rest
+    cls = service.GpclientVPNPlugin
+    for signal in (cls.Config, cls.Ip4Config, cls.Ip6Config):
+        signal.emit = lambda *_payload: None
+    cls.StateChanged.emit = on_state
+    cls.Failure.emit = on_failure
+    cls.SecretsRequired.emit = on_secrets_required
+
+    samples = []
+    for index in range(args.reconnects):
+        if index == args.warmup and args.tracemalloc:
+            plugin._memory.take()
+        if index % args.sample_every == 0:
+            gc.collect()
+            samples.append((index, rss_bytes()))
+
+        scenario = scenarios[index % len(scenarios)]
+        os.environ["BENCH_SCENARIO"] = scenario
+        started = loop.create_future()
+        await plugin.ConnectInteractive(
+            bench._connection(scenario, f"soak-{scenario}"), {}
+        )
+        await asyncio.wait_for(started, STARTED_TIMEOUT)
+        await asyncio.wait_for(plugin.tunnel_check_task, STARTED_TIMEOUT)
+        await plugin.Disconnect()
+
+    gc.collect()
+    samples.append((args.reconnects, rss_bytes()))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--reconnects", type=int, default=10000)
+    parser.add_argument("--scenarios", help="comma-separated, default: all of them")
+    parser.add_argument("--warmup", type=int, default=500, help="reconnects")
+    parser.add_argument("--sample-every", type=int, default=100, help="reconnects")
+    parser.add_argument(
+        "--max-growth", type=float, default=4.0, help="MiB allowed after the warmup"
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="print what grew between the warmup and the end",
+    )
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, HERE)
+    import bench_connect as bench
+
+    scenarios = args.scenarios.split(",") if args.scenarios else list(bench.SCENARIOS)
+    unknown = [name for name in scenarios if name not in bench.SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown}")
+    args.warmup = min(args.warmup, args.reconnects // 2)
+
+    for key in ("SUDO_UID", "SUDO_USER", "GPCLIENT_TRACE", "GPCLIENT_RECORD"):
+        os.environ.pop(key, None)
+    os.environ["PATH"] = bench.SHIMS + os.pathsep + os.environ.get("PATH", "")
+
+    service = bench.load_service()
+    service.logger.setLevel(logging.ERROR)
+    service.TUNNEL_POLL_INTERVAL = 0.01
+    service.PROMPT_DEBOUNCE_SECONDS = 0.02
+
+    with tempfile.TemporaryDirectory(prefix="gpclient-soak-") as workdir:
+        net = os.path.join(workdir, "net")
+        os.mkdir(net)
+        launcher = os.path.join(workdir, "gpclient")
+        with open(launcher, "w") as handle:
+            handle.write(
+                f'#!/bin/sh\nexec "{sys.executable}" "{bench.FAKE_GPCLIENT}" "$@"\n'
+            )
+        os.chmod(launcher, 0o755)
+
+        service.GPCLIENT_BINARY = launcher
+        service.SYS_CLASS_NET = net
+        service.ACTIVATION_DIR = os.path.join(workdir, "activations")
+        service.GPCLIENT_LOCK_FILE = os.path.join(workdir, "gpclient.lock")
+        service.PUSHED_CONFIG_DIR = workdir
+        os.environ["BENCH_NET"] = net
+
+        plugin = service.GpclientVPNPlugin()
+        plugin._mtu_cache = service.MtuCache(os.path.join(workdir, "mtu-cache.json"))
+        plugin._prompt_history = service.PromptHistory(
+            os.path.join(workdir, "prompt-history.json")
+        )
+
+        begin = time.perf_counter()
+        samples = asyncio.run(soak(service, bench, plugin, scenarios, args))
+        elapsed = time.perf_counter() - begin
+        changes = plugin._memory.take() if args.tracemalloc else []
+
+    mib = 1024 * 1024
+    baseline = next(rss for index, rss in samples if index >= args.warmup)
+    final = samples[-1][1]
+    growth = (final - baseline) / mib
+    print(
+        f"\n{args.reconnects} reconnects ({', '.join(scenarios)}) in {elapsed:.0f}s, "
+        f"{elapsed / args.reconnects * 1000:.1f} ms each"
+    )
+    shown = samples[:: max(1, len(samples) // 10)]
+    if shown[-1] is not samples[-1]:
+        shown.append(samples[-1])
+    for index, rss in shown:
+        print(f"  after {index:6d}  RSS {rss / mib:7.1f} MiB")
+    print(f"  growth after the {args.warmup} warmup reconnects: {growth:+.2f} MiB")
+    if changes:
+        print("\nGrew the most (tracemalloc):")
+        for line in changes:
+            print(f"  {line}")
+
+    if growth > args.max_growth:
+        print(f"\nRSS grew by more than {args.max_growth:g} MiB")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the nm-gpclient service: the time from exec to the
+D-Bus name being acquired, which is what a connection waits for when the idle
+service has exited and D-Bus activation starts it again.
+
+Each run execs the service the way D-Bus activation does - a launcher
+importing the service as the module nm_gpclient_service, byte-compiled
+ahead like an installed one - and stops it with SIGTERM once it logs
+"Acquired D-Bus service name". The report has p50/p95 for
+exec-to-name and for the shutdown, and the resident set size right after
+start. With --imports, one extra run under `python3 -X importtime` lists the
+slowest imports.
+
+By default sdbus is replaced by a minimal stub, so the numbers cover the
+interpreter, the service's own imports and its setup but not libsystemd. With
+--bus session (real python-sdbus and a session bus needed) the service owns a
+throwaway name on the session bus instead of the system bus.
+
+Results are appended to a JSON history file like bench_connect.py's, and
+--compare fails when start-up got slower than in the previous run.
+
+Run with: make bench-startup  (or: python3 tests/bench/bench_startup.py -n 20)
+"""
+
+import argparse
+import json
+import os
+import platform
+import py_compile
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+SERVICE_PATH = os.path.join(ROOT, "service", "nm-gpclient-service.py")
+
+DEFAULT_HISTORY = os.path.join(ROOT, "artifacts", "bench-startup-history.json")
+
+READY_LINE = "Acquired D-Bus service name"
+READY_TIMEOUT = 30
+
+# Import the service from the directory in sys.argv[1] and run it with the
+# remaining arguments, like service/launcher.py. Kept small: whatever this
+# imports is counted as start-up time.
+STUB_LAUNCHER = """
+import sys, types
+stub = types.ModuleType("sdbus")
+class DbusInterfaceCommonAsync:
+    def __init_subclass__(cls, **kwargs):
+        pass
+    def export_to_dbus(self, path):
+        pass
+def decorator_factory(*args, **kwargs):
+    def decorator(func):
+        func.emit = lambda *payload: None
+        return func
+    return decorator
+async def request_default_bus_name_async(name):
+    pass
+stub.DbusInterfaceCommonAsync = DbusInterfaceCommonAsync
+stub.dbus_method_async = stub.dbus_property_async = decorator_factory
+stub.dbus_signal_async = decorator_factory
+stub.request_default_bus_name_async = request_default_bus_name_async
+stub.sd_bus_open_system = lambda: None
+stub.set_default_bus = lambda bus: None
+sys.modules["sdbus"] = stub
+sys.path.insert(0, sys.argv.pop(1))
+from nm_gpclient_service import main
+sys.exit(main())
+"""
+
+SESSION_LAUNCHER = """
+import sys
+import sdbus
+sdbus.sd_bus_open_system = sdbus.sd_bus_open_user
+sys.path.insert(0, sys.argv.pop(1))
+from nm_gpclient_service import main
+sys.exit(main())
+"""
+
+# The service installed as a module, like /usr/lib/nm-gpclient; set by main()
+module_dir = None
+
+
+def _bench_connect():
+    sys.path.insert(0, HERE)
+    import bench_connect
+
+    return bench_connect
+
+
+def _rss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _command(bus, index, service_args=("--persist",), python_flags=()):
+    launcher = SESSION_LAUNCHER if bus == "session" else STUB_LAUNCHER
+    name = f"org.freedesktop.NetworkManager.gpclient.Bench{os.getpid()}_{index}"
+    return [sys.executable, *python_flags, "-c", launcher, module_dir] + [
+        "--bus-name",
+        name,
+        *service_args,
+    ]
+
+
+def _environment():
+    env = dict(os.environ)
+    # Log to stderr (where the ready line is read from), not to the journal
+    for key in ("JOURNAL_STREAM", "GPCLIENT_DEBUG", "GPCLIENT_TRACE", "GPCLIENT_RECORD"):
+        env.pop(key, None)
+    return env
+
+
+def start_once(bus, index):
+    """One cold start; returns ({phase: milliseconds}, RSS in KiB)"""
+    begin = time.perf_counter()
+    process = subprocess.Popen(
+        _command(bus, index),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=_environment(),
+        text=True,
+    )
+    output = []
+    try:
+        deadline = begin + READY_TIMEOUT
+        for line in process.stderr:
+            output.append(line)
+            if READY_LINE in line:
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError("no ready line before the timeout")
+        else:
+            raise RuntimeError("the service exited before acquiring its name")
+        ready = time.perf_counter()
+        rss = _rss_kib(process.pid)
+
+        process.send_signal(signal.SIGTERM)
+        process.stderr.read()
+        process.wait(timeout=READY_TIMEOUT)
+        stopped = time.perf_counter()
+    except Exception:
+        process.kill()
+        process.wait()
+        sys.stderr.write("".join(output))
+        raise
+    phases = {
+        "exec-to-name": (ready - begin) * 1000,
+        "shutdown": (stopped - ready) * 1000,
+    }
+    return phases, rss
+
+
+def slowest_imports(bus, count):
+    """The `count` imports with the largest cumulative time, as report lines"""
+    # This run leaves on its own, through the idle exit
+    result = subprocess.run(
+        _command(bus, 0, ("--idle-exit", "0.01"), ("-X", "importtime")),
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        env=_environment(),
+        text=True,
+        timeout=READY_TIMEOUT,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        imports.append((int(cumulative), name.rstrip()))
+    imports.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in imports[:count]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument("--bus", choices=("stub", "session"), default="stub")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="exit with 1 when start-up regressed against the previous history entry",
+    )
+    parser.add_argument(
+        "--imports", type=int, default=0, metavar="N", help="list the N slowest imports"
+    )
+    args = parser.parse_args(argv)
+
+    global module_dir
+    module_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    try:
+        return _run(args)
+    finally:
+        shutil.rmtree(module_dir, ignore_errors=True)
+
+
+def _run(args):
+    # Compiled ahead, as `make install` and the package's postinst do
+    module = os.path.join(module_dir, "nm_gpclient_service.py")
+    shutil.copy(SERVICE_PATH, module)
+    py_compile.compile(module, doraise=True)
+
+    # One untimed start first, so every timed run finds the page cache warm
+    start_once(args.bus, 0)
+
+    samples = {}
+    rss = []
+    for index in range(args.iterations):
+        phases, kib = start_once(args.bus, index)
+        for phase, value in phases.items():
+            samples.setdefault(phase, []).append(value)
+        rss.append(kib)
+
+    bench = _bench_connect()
+    results = {f"startup-{args.bus}": bench.summarize(samples)}
+    bench.print_report(results)
+    print(f"  RSS after start  {max(rss) / 1024:.1f} MB")
+
+    if args.imports:
+        print("\nSlowest imports (cumulative):")
+        for line in slowest_imports(args.bus, args.imports):
+            print(f"  {line}")
+
+    history = bench.load_history(args.history)
+    previous = history[-1] if history else None
+    history.append(
+        {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": bench._git_revision(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "rss_kib": max(rss),
+            "results": results,
+        }
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, "w") as handle:
+        json.dump(history, handle, indent=1)
+    print(f"\nResults appended to {args.history}")
+
+    if args.compare and previous:
+        slower = bench.regressions(previous, results)
+        if slower:
+            print("\nSlower than the previous run:")
+            for line in slower:
+                print(f"  {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Scripted stand-in for gpclient used by the connect-path benchmarks.
+
+The scenario comes from BENCH_SCENARIO:
+
+  saml         browser login, then the tunnel comes up
+  credentials  username/password prompts (username skipped with --user, the
+               password read as a line with --passwd-on-stdin)
+  otp          credentials, then a token code challenge
+  multigateway the portal offers a gateway list to pick from
+  openssl      the first run fails with the legacy renegotiation error,
+               a run with --fix-openssl connects
+
+"Bringing the tunnel up" creates $BENCH_NET/<--interface, default gpd0> with
+its addresses and MTU, which the fake `ip` in tests/bench/shims reports back to
+the service.
+BENCH_AUTH_DELAY (seconds) stands in for the time a browser login takes.
+"""
+
+import os
+import shutil
+import signal
+import sys
+import termios
+import time
+import tty
+
+GATEWAYS = [
+    "gw-warsaw (gw1.example.com)",
+    "gw-frankfurt (gw2.example.com)",
+    "gw-london (gw3.example.com)",
+]
+TUNNEL_ADDRESS = "10.20.30.40/32"
+TUNNEL_ADDRESS6 = "fd00:20:30::40/64"
+
+
+def say(text):
+    sys.stdout.write(text + "\r\n")
+    sys.stdout.flush()
+
+
+def read_answer():
+    value = b""
+    while True:
+        chunk = os.read(0, 64)
+        if not chunk:
+            return value.decode()
+        for byte in chunk:
+            if byte in (13, 10):
+                return value.decode()
+            value += bytes([byte])
+
+
+def ask(label, secret=False):
+    sys.stdout.write(f"? {label}: ")
+    sys.stdout.flush()
+    value = read_answer()
+    shown = "*" * len(value) if secret else value
+    sys.stdout.write(f"\r? {label}: {shown}\r\n")
+    sys.stdout.flush()
+    return value
+
+
+def read_password_line(cooked):
+    """--passwd-on-stdin: one line, read with the terminal out of raw mode"""
+    say("[INFO  gpclient::connect] Reading password from standard input")
+    raw = termios.tcgetattr(0)
+    termios.tcsetattr(0, termios.TCSANOW, cooked)
+    try:
+        return os.read(0, 4096).decode().rstrip("\n")
+    finally:
+        termios.tcsetattr(0, termios.TCSANOW, raw)
+
+
+def choose_gateway():
+    def render(cursor):
+        lines = ["? Which gateway do you want to connect to?"]
+        for index, option in enumerate(GATEWAYS):
+            lines.append(("> " if index == cursor else "  ") + option)
+        lines.append("[↑↓ to move, enter to select, type to filter]")
+        sys.stdout.write("\r\n".join(lines) + "\r\n")
+        sys.stdout.flush()
+
+    cursor = 0
+    render(cursor)
+    pending = b""
+    while True:
+        chunk = os.read(0, 16)
+        if not chunk:
+            sys.exit(1)
+        pending += chunk
+        while pending:
+            if pending.startswith(b"\x1b[B"):
+                pending = pending[3:]
+                cursor = (cursor + 1) % len(GATEWAYS)
+                render(cursor)
+            elif pending[:1] in (b"\r", b"\n"):
+                return GATEWAYS[cursor]
+            else:
+                pending = pending[1:]
+
+
+def tunnel_path():
+    argv = sys.argv[1:]
+    name = argv[argv.index("--interface") + 1] if "--interface" in argv else "gpd0"
+    return os.path.join(os.environ["BENCH_NET"], name)
+
+
+def tunnel_down(*_args):
+    shutil.rmtree(tunnel_path(), ignore_errors=True)
+    sys.exit(0)
+
+
+def tunnel_up(gateway, mtu, ipv6):
+    say(f"[INFO  gpclient::connect] Connecting to the only available gateway: {gateway}")
+    os.makedirs(tunnel_path(), exist_ok=True)
+    with open(os.path.join(tunnel_path(), "address"), "w") as handle:
+        handle.write(TUNNEL_ADDRESS)
+    with open(os.path.join(tunnel_path(), "mtu"), "w") as handle:
+        handle.write(mtu)
+    if ipv6:
+        with open(os.path.join(tunnel_path(), "address6"), "w") as handle:
+            handle.write(TUNNEL_ADDRESS6)
+    say("[INFO  openconnect] Connected as 10.20.30.40, using SSL")
+    signal.signal(signal.SIGTERM, tunnel_down)
+    signal.signal(signal.SIGHUP, tunnel_down)
+    while True:
+        signal.pause()
+
+
+def main(argv):
+    if "disconnect" in argv:
+        shutil.rmtree(tunnel_path(), ignore_errors=True)
+        return 0
+
+    scenario = os.environ.get("BENCH_SCENARIO", "saml")
+    cooked = None
+    if sys.stdin.isatty():
+        cooked = termios.tcgetattr(0)
+        tty.setraw(0)
+    say("[INFO  gpclient::cli] gpclient started: fake (benchmark)")
+
+    if scenario == "openssl" and "--fix-openssl" not in argv:
+        say(
+            "[ERROR gpclient] error:0A000152:SSL routines:final_renegotiate:"
+            "unsafe legacy renegotiation disabled"
+        )
+        say("Re-run it with the `--fix-openssl` option to work around this issue")
+        return 1
+
+    gateway = "gw-a (a.example.com)"
+    if scenario in ("credentials", "otp"):
+        say("Please enter the login credentials (Portal: vpn.example.com)")
+        if "--user" not in argv:
+            ask("Username")
+        if "--passwd-on-stdin" in argv and cooked is not None:
+            read_password_line(cooked)
+        else:
+            ask("Password", secret=True)
+        if scenario == "otp":
+            say("Please enter RSA token (Gateway: a.example.com)")
+            ask("Enter the next tokencode")
+    elif scenario == "multigateway":
+        time.sleep(float(os.environ.get("BENCH_AUTH_DELAY", "0")))
+        gateway = choose_gateway()
+    else:
+        say("[INFO  gpauth] Opening the authentication window")
+        time.sleep(float(os.environ.get("BENCH_AUTH_DELAY", "0")))
+
+    mtu = argv[argv.index("--mtu") + 1] if "--mtu" in argv else "1400"
+    tunnel_up(gateway, mtu, ipv6="--disable-ipv6" not in argv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
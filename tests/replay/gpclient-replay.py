@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded gpclient PTY session (asciicast v2, see GPCLIENT_RECORD).
+
+Stands in for gpclient: point GPCLIENT_BINARY at a wrapper that runs
+
+    gpclient-replay.py [--speed N] recording.cast
+
+and the service talks to the recording exactly as it talked to the real
+gpclient. Output events are written back byte for byte with their recorded
+pacing (divided by --speed; 0 plays as fast as possible). At every input event
+the replay waits for the service to type something and checks it against the
+recording - a redacted secret only has to end the same way (with Enter).
+The arguments the service passes are ignored.
+
+Exit status: the recorded gpclient's exit status if the recording has one
+(an "exit N" marker), 0 otherwise; 3 when the service typed something other
+than what was recorded.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tty
+
+REDACTED = "<redacted>"
+EXIT_MISMATCH = 3
+
+
+def load_cast(path):
+    """Return (header, events) of an asciicast v2 file"""
+    with open(path, encoding="utf-8") as handle:
+        header = json.loads(handle.readline())
+        if header.get("version") != 2:
+            raise ValueError(f"{path}: not an asciicast v2 recording")
+        events = [json.loads(line) for line in handle if line.strip()]
+    return header, events
+
+
+def _read_input(expected):
+    """Read what the service types for one recorded input event"""
+    if REDACTED in expected:
+        # Length unknown: read up to the terminating key of the answer
+        terminator = expected[-1].encode()
+        received = b""
+        while not received.endswith(terminator):
+            byte = os.read(0, 1)
+            if not byte:
+                break
+            received += byte
+        return received, received.endswith(terminator)
+
+    wanted = expected.encode("utf-8", errors="surrogateescape")
+    received = b""
+    while len(received) < len(wanted):
+        data = os.read(0, len(wanted) - len(received))
+        if not data:
+            break
+        received += data
+    return received, received == wanted
+
+
+def replay(events, speed=1.0, out=None):
+    """Play the events; return the exit status to end with"""
+    out = out if out is not None else sys.stdout.buffer
+    previous = 0.0
+    for timestamp, kind, data in events:
+        if speed > 0 and timestamp > previous:
+            time.sleep((timestamp - previous) / speed)
+        previous = timestamp
+
+        if kind == "o":
+            out.write(data.encode("utf-8", errors="surrogateescape"))
+            out.flush()
+        elif kind == "i":
+            received, matched = _read_input(data)
+            if not matched:
+                sys.stderr.write(
+                    f"replay: expected {data!r} at {timestamp}s, got {received!r}\n"
+                )
+                return EXIT_MISMATCH
+        elif kind == "m" and data.startswith("exit "):
+            return int(data.split()[1])
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("recording")
+    args, _ = parser.parse_known_args(argv)
+
+    _, events = load_cast(args.recording)
+    if os.isatty(0):
+        # Like gpclient's prompts: keys arrive unbuffered and unechoed
+        tty.setraw(0)
+    return replay(events, args.speed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
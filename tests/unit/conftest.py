@@ -6,8 +6,10 @@ available (and not needed) for unit-testing the pure parsing helpers.
 A minimal stub is injected before the service module is loaded.
 """
 
+import asyncio
 import importlib.util
 import os
+import selectors
 import sys
 import types
 
@@ -79,3 +81,72 @@ def dbus_signals():
     calls.clear()
     yield calls
     calls.clear()
+
+
+class _VirtualSelector:
+    """Selector that advances the loop's virtual clock instead of sleeping.
+
+    When a select() would block until the next timer, nothing can happen in
+    between except I/O: the real selector is polled (for up to `io_grace` real
+    seconds) and, if no I/O is ready, the clock jumps straight to the timer.
+    With nothing scheduled at all it blocks on real I/O (a subprocess exiting).
+    """
+
+    def __init__(self, io_grace: float):
+        self._selector = selectors.DefaultSelector()
+        self._io_grace = io_grace
+        self.loop = None
+
+    def select(self, timeout=None):
+        if timeout is None or timeout <= 0:
+            return self._selector.select(timeout)
+        events = self._selector.select(min(timeout, self._io_grace))
+        if not events:
+            self.loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() only moves when every task is waiting.
+
+    The service does all its waiting through the loop (see "Timing" in the
+    service), so debounces, poll intervals and timeouts run in virtual time.
+    """
+
+    def __init__(self, io_grace: float = 0.0):
+        selector = _VirtualSelector(io_grace)
+        super().__init__(selector)
+        selector.loop = self
+        self._now = 0.0
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        self._now += seconds
+
+
+@pytest.fixture
+def virtual_clock():
+    """Run coroutines on a VirtualClockLoop: `virtual_clock.run(coro)`.
+
+    `virtual_clock.loop.time()` tells how much virtual time has passed. Pass
+    io_grace (real seconds to wait for I/O before skipping ahead) to
+    `virtual_clock.run()` when a real subprocess takes part.
+    """
+
+    class Runner:
+        loop = None
+
+        def run(self, coro, io_grace: float = 0.0):
+            self.loop = VirtualClockLoop(io_grace)
+            try:
+                return self.loop.run_until_complete(coro)
+            finally:
+                self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+                self.loop.close()
+
+    return Runner()
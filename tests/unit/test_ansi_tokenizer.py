@@ -0,0 +1,150 @@
+"""
+Tests for AnsiTokenizer, which cleans gpclient's raw PTY output in one pass:
+compared against strip_ansi() on random output cut at random read boundaries,
+plus the escape events it reports and what it carries between reads.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import random
+import re
+
+import pytest
+
+# Pieces random output is made of: text, escape sequences (complete, broken
+# and the ones reported as events), control characters and line breaks
+PIECES = [
+    "Password",
+    " ",
+    "gw-zürich",
+    "↑↓",
+    "東京",
+    "\x1b[32m",
+    "\x1b[0m",
+    "\x1b[39m",
+    "\x1b[?25l",
+    "\x1b[?25h",
+    "\x1b[2K",
+    "\x1b[K",
+    "\x1b[1K",
+    "\x1b[12K",
+    "\x1b[4A",
+    "\x1b[1G",
+    "\x1b]0;title\x07",
+    "\x1b]2;title\x1b\\",
+    "\x1b]",
+    "\x1b[",
+    "\x1b",
+    "\x1bM",
+    "[?25l",
+    "\x07",
+    "\x00",
+    "\x7f",
+    "\x0b",
+    "\t",
+    "\r",
+    "\n",
+    "\r\n",
+    "\x85",
+    " ",
+]
+
+
+def _tokens_as_text(service_module, tokens):
+    """Text runs joined, each line break as \\n, events left out"""
+    out = []
+    for token in tokens:
+        if isinstance(token, str):
+            out.append(token)
+        elif token == service_module.TOKEN_LINE_BREAK:
+            out.append("\n")
+    return "".join(out)
+
+
+def _reference(service_module, text):
+    """strip_ansi(), with line breaks as the tokenizer counts them"""
+    return re.sub(r"\r\n?|\n", "\n", service_module.strip_ansi(text))
+
+
+def _feed_in_reads(service_module, data, cuts):
+    tokenizer = service_module.AnsiTokenizer()
+    tokens = []
+    start = 0
+    for cut in sorted(cuts) + [len(data)]:
+        tokens += tokenizer.feed(data[start:cut])
+        start = cut
+    return tokens + tokenizer.feed(b"", final=True)
+
+
+class TestAgainstStripAnsi:
+    @pytest.mark.parametrize("seed", range(40))
+    def test_random_output_in_random_reads(self, service_module, seed):
+        rng = random.Random(seed)
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(1, 200)))
+        data = text.encode()
+        cuts = [rng.randrange(len(data) + 1) for _ in range(rng.randint(0, 12))]
+
+        tokens = _feed_in_reads(service_module, data, cuts)
+
+        assert _tokens_as_text(service_module, tokens) == _reference(service_module, text)
+
+    def test_every_single_byte_boundary(self, service_module):
+        text = "\x1b[32m?\x1b[0m Wählen: \x1b]0;t\x1b\\\x1b[2K\r\n[↑↓ to move]\x1b[?25h"
+        data = text.encode()
+        expected = _reference(service_module, text)
+        for cut in range(len(data) + 1):
+            tokens = _feed_in_reads(service_module, data, [cut])
+            assert _tokens_as_text(service_module, tokens) == expected, cut
+
+
+class TestEvents:
+    def test_cursor_and_clear_line(self, service_module):
+        tokens = service_module.AnsiTokenizer().feed(
+            b"\x1b[?25l\x1b[2K\r\x1b[32m?\x1b[0m Password: \x1b[?25h"
+        )
+
+        assert tokens == [
+            service_module.TOKEN_CURSOR_HIDE,
+            service_module.TOKEN_CLEAR_LINE,
+            "",
+            service_module.TOKEN_LINE_BREAK,
+            "? Password: ",
+            service_module.TOKEN_CURSOR_SHOW,
+        ]
+
+    def test_event_cut_by_a_read(self, service_module):
+        tokenizer = service_module.AnsiTokenizer()
+
+        assert tokenizer.feed(b"? Pass\x1b[?2") == ["? Pass"]
+        assert tokenizer.feed(b"5hword") == [service_module.TOKEN_CURSOR_SHOW, "word"]
+
+    def test_scanner_follows_the_cursor(self, service_module):
+        tokenizer = service_module.AnsiTokenizer()
+        scanner = service_module.OutputScanner()
+
+        scanner.feed_tokens(tokenizer.feed(b"\x1b[?25l? Username: "))
+        assert not scanner.cursor_visible
+        lines = scanner.feed_tokens(tokenizer.feed(b"\x1b[?25h\r\njdoe\r\n"))
+        assert scanner.cursor_visible
+        assert lines == ["? Username: ", "jdoe"]
+        assert scanner.tail == ""
+
+
+class TestCarry:
+    def test_crlf_cut_by_a_read_is_one_break(self, service_module):
+        tokenizer = service_module.AnsiTokenizer()
+
+        assert tokenizer.feed(b"line\r") == ["line", service_module.TOKEN_LINE_BREAK]
+        assert tokenizer.feed(b"\nnext") == ["next"]
+
+    def test_long_osc_is_not_held_back(self, service_module):
+        limit = service_module.ANSI_CARRY_LIMIT
+        tokenizer = service_module.AnsiTokenizer()
+
+        tokens = tokenizer.feed(b"\x1b]0;" + b"t" * (2 * limit))
+
+        assert tokens == ["0;" + "t" * (2 * limit)]
+
+    def test_unicode_line_separators(self, service_module):
+        tokens = service_module.AnsiTokenizer().feed("a b\x85c\r\n".encode())
+        assert tokens == ["a b\x85c", service_module.TOKEN_LINE_BREAK]
@@ -20,7 +20,9 @@ DIALOG = os.path.abspath(
 SERVICE = "org.freedesktop.NetworkManager.gpclient"
 
 
-def run_dialog(data=None, secrets=None, hints=(), interaction=True, reprompt=False):
+def run_dialog(
+    data=None, secrets=None, hints=(), interaction=True, reprompt=False, external_ui=False
+):
     args = [
         sys.executable,
         DIALOG,
@@ -35,6 +37,8 @@ def run_dialog(data=None, secrets=None, hints=(), interaction=True, reprompt=Fal
         args.append("-i")
     if reprompt:
         args.append("-r")
+    if external_ui:
+        args.append("--external-ui-mode")
     for hint in hints:
         args.extend(["-t", hint])
 
@@ -140,3 +144,92 @@ class TestHints:
         )
         assert result.returncode == 1
         assert "Unsupported VPN service" in result.stdout + result.stderr
+
+
+def parse_keyfile(text):
+    groups = {}
+    group = None
+    for line in text.splitlines():
+        if line.startswith("[") and line.endswith("]"):
+            group = groups.setdefault(line[1:-1], {})
+        elif "=" in line:
+            key, value = line.split("=", 1)
+            group[key] = value
+    return groups
+
+
+class TestExternalUiMode:
+    """GNOME Shell renders the prompt itself from the keyfile on stdout"""
+
+    def test_otp_challenge_is_described(self):
+        result = run_dialog(
+            data={"gateway": "vpn.example.com"},
+            secrets={"otp": "123456", "password": "s3cret"},
+            hints=["x-vpn-message:Enter your RSA passcode", "password", "otp"],
+            reprompt=True,
+            external_ui=True,
+        )
+
+        assert result.returncode == 0
+        groups = parse_keyfile(result.stdout)
+        assert groups["VPN Plugin UI"] == {
+            "Version": "2",
+            "Description": "Enter your RSA passcode",
+            "Title": "Authenticate VPN: Work VPN",
+        }
+        assert groups["otp"] == {
+            "Value": "",
+            "Label": "Token / one-time code",
+            "IsSecret": "false",
+            "ShouldAsk": "true",
+        }
+        # Reprompt: the stored password was rejected, so it is not offered
+        assert groups["password"]["Value"] == ""
+        assert groups["password"]["IsSecret"] == "true"
+
+    def test_upfront_password_is_prefilled(self):
+        result = run_dialog(
+            data={"gateway": "vpn.example.com", "auth-mode": "credentials"},
+            secrets={"password": "s3cret", "otp": "123456"},
+            hints=["password", "otp"],
+            external_ui=True,
+        )
+
+        groups = parse_keyfile(result.stdout)
+        assert groups["password"]["Value"] == "s3cret"
+        assert groups["otp"]["Value"] == ""
+        assert groups["VPN Plugin UI"]["Description"] == (
+            "Credentials are required to connect to “Work VPN”."
+        )
+
+    def test_stored_password_needs_no_prompt(self):
+        result = run_dialog(
+            data={"gateway": "vpn.example.com", "auth-mode": "credentials"},
+            secrets={"password": "s3cret"},
+            external_ui=True,
+        )
+
+        assert result.returncode == 0
+        assert parse_keyfile(result.stdout)["password"] == {
+            "Value": "s3cret",
+            "Label": "Password",
+            "IsSecret": "true",
+            "ShouldAsk": "false",
+        }
+
+    def test_saml_describes_nothing_to_ask(self):
+        result = run_dialog(data={"gateway": "vpn.example.com"}, external_ui=True)
+
+        assert result.returncode == 0
+        assert list(parse_keyfile(result.stdout)) == ["VPN Plugin UI"]
+
+    def test_values_are_escaped(self):
+        result = run_dialog(
+            data={"gateway": "vpn.example.com"},
+            hints=["x-vpn-message: Line one\nline two", "otp"],
+            external_ui=True,
+        )
+
+        assert parse_keyfile(result.stdout)["VPN Plugin UI"]["Description"] == (
+            "\\sLine one\\nline two"
+        )
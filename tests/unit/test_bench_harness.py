@@ -0,0 +1,69 @@
+"""
+Smoke test for the connect-path benchmarks (tests/bench), so the harness keeps
+up with the service it drives.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import importlib.util
+import os
+from pathlib import Path
+
+BENCH_PATH = Path(__file__).resolve().parents[1] / "bench" / "bench_connect.py"
+
+
+def _bench():
+    spec = importlib.util.spec_from_file_location("bench_connect", BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestBenchHarness:
+    def test_scenario_reaches_started(self, service_module, monkeypatch):
+        bench = _bench()
+        # run_scenario points these at its fakes; put them back afterwards
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", "/usr/bin/gpclient")
+        monkeypatch.setattr(service_module, "SYS_CLASS_NET", "/sys/class/net")
+        monkeypatch.setattr(
+            service_module, "ACTIVATION_DIR", service_module.ACTIVATION_DIR
+        )
+        monkeypatch.setattr(
+            service_module, "GPCLIENT_LOCK_FILE", service_module.GPCLIENT_LOCK_FILE
+        )
+        monkeypatch.setattr(
+            service_module, "PUSHED_CONFIG_DIR", service_module.PUSHED_CONFIG_DIR
+        )
+        monkeypatch.setenv("PATH", bench.SHIMS + os.pathsep + os.environ["PATH"])
+        monkeypatch.setenv("BENCH_NET", "")
+        monkeypatch.setenv("BENCH_SCENARIO", "")
+        monkeypatch.delenv("SUDO_UID", raising=False)
+
+        # otp: a stored password goes in on stdin, the token code is a prompt
+        samples = bench.run_scenario(service_module, "otp", 1)
+
+        assert len(samples["time-to-STARTED"]) == 1
+        assert {"activation", "gpclient", "prompt", "tunnel detection"} <= set(samples)
+
+    def test_regressions_need_both_margins(self):
+        bench = _bench()
+        previous = {
+            "results": {
+                "saml": {
+                    "time-to-STARTED": {"p50_ms": 500.0},
+                    "real-user": {"p50_ms": 1.0},
+                }
+            }
+        }
+        current = {
+            "saml": {
+                "time-to-STARTED": {"p50_ms": 700.0},
+                "real-user": {"p50_ms": 3.0},  # 3x, but only 2 ms
+            }
+        }
+
+        assert bench.regressions(previous, current) == [
+            "saml/time-to-STARTED: p50 500.0 -> 700.0 ms"
+        ]
+        assert bench.percentile([5, 1, 3, 2, 4], 0.95) == 5
+        assert bench.percentile([5, 1, 3, 2, 4], 0.50) == 3
@@ -0,0 +1,168 @@
+"""
+Tests for concurrent sessions (one service process per connection under
+--bus-name): claiming a tunnel interface per activation, gpclient's lock file
+and the host-wide cleanup that must leave other sessions alone.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def host(service_module, tmp_path, monkeypatch):
+    """Claim directory, /sys/class/net and gpclient lock file under tmp_path"""
+    net = tmp_path / "net"
+    net.mkdir()
+    monkeypatch.setattr(service_module, "ACTIVATION_DIR", str(tmp_path / "activations"))
+    monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(net))
+    monkeypatch.setattr(
+        service_module, "GPCLIENT_LOCK_FILE", str(tmp_path / "gpclient.lock")
+    )
+    return tmp_path
+
+
+def _other_session(host, interface, pid=None):
+    """A claim held by another (live) service process"""
+    claims = host / "activations"
+    claims.mkdir(exist_ok=True)
+    (claims / interface).write_text(str(pid or os.getppid()))
+
+
+def _dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+class TestActivationClaim:
+    def test_first_session_gets_gpd0(self, service_module, host):
+        claim = service_module.ActivationClaim()
+        assert claim.claim() == "gpd0"
+        assert claim.claim() == "gpd0"
+        assert (host / "activations" / "gpd0").read_text() == str(os.getpid())
+
+    def test_claimed_and_present_names_are_skipped(self, service_module, host):
+        _other_session(host, "gpd0")
+        _other_session(host, "gpd1")
+        (host / "net" / "gpd2").mkdir()
+        claim = service_module.ActivationClaim()
+
+        assert claim.claim() == "gpd3"
+        assert claim.others() == {"gpd0": os.getppid(), "gpd1": os.getppid()}
+
+    def test_claim_of_a_crashed_service_is_taken_over(self, service_module, host):
+        _other_session(host, "gpd0", pid=_dead_pid())
+        claim = service_module.ActivationClaim()
+
+        assert claim.others() == {}
+        assert claim.claim() == "gpd0"
+        assert (host / "activations" / "gpd0").read_text() == str(os.getpid())
+
+    def test_release_leaves_other_claims(self, service_module, host):
+        claim = service_module.ActivationClaim()
+        claim.claim()
+        _other_session(host, "gpd1")
+        claim.release()
+
+        assert sorted(os.listdir(host / "activations")) == [".lock", "gpd1"]
+        assert claim.interface is None
+
+    def test_unwritable_directory_falls_back(self, service_module, host, monkeypatch):
+        (host / "file").write_text("")
+        monkeypatch.setattr(service_module, "ACTIVATION_DIR", str(host / "file" / "x"))
+        plugin = service_module.GpclientVPNPlugin()
+
+        assert plugin._activation.claim() is None
+        assert plugin._tunnel_candidates() == service_module.TUNNEL_INTERFACES
+
+
+class TestGpclientLock:
+    def test_free_lock_is_shared(self, service_module, host):
+        claim = service_module.ActivationClaim()
+        assert claim.private_gpclient_lock() is None
+
+        # A PID that is alive but not a gpclient does not hold the lock
+        (host / "gpclient.lock").write_text(str(os.getpid()))
+        assert claim.private_gpclient_lock() is None
+
+    def test_held_lock_gets_a_private_one(self, service_module, host, monkeypatch):
+        monkeypatch.setattr(service_module, "gpclient_lock_holder", lambda: 4242)
+        claim = service_module.ActivationClaim()
+        path = claim.private_gpclient_lock()
+
+        assert os.path.exists(path)
+        command = service_module.private_lock_command(["gpclient", "connect"], path)
+        assert command[:3] == ["unshare", "--mount", "--propagation"]
+        assert command[-4:] == [
+            path,
+            service_module.GPCLIENT_LOCK_FILE,
+            "gpclient",
+            "connect",
+        ]
+
+        claim.release()
+        assert not os.path.exists(path)
+
+    def test_private_lock_command_binds_the_lock(self, service_module, host):
+        # The sh part alone: the bind mount replaced by a copy
+        command = service_module.private_lock_command(["cat", "lock"], "private")
+        script = command[command.index("-c") + 1].replace("mount --bind", "cp")
+        (host / "private").write_text("mine")
+        result = subprocess.run(
+            ["sh", "-c", script, "private", "lock", "cat", "lock"],
+            cwd=host,
+            capture_output=True,
+            text=True,
+        )
+        assert result.stdout == "mine"
+
+
+class TestHostWideActions:
+    def _launcher(self, host):
+        marker = host / "gpclient-called"
+        launcher = host / "gpclient"
+        launcher.write_text(f'#!/bin/sh\necho "$@" >> "{marker}"\n')
+        launcher.chmod(0o755)
+        return str(launcher), marker
+
+    def test_disconnect_leaves_other_sessions(
+        self, service_module, host, monkeypatch, dbus_signals
+    ):
+        launcher, marker = self._launcher(host)
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", launcher)
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._activation.claim()
+        _other_session(host, "gpd1")
+
+        asyncio.run(plugin.Disconnect())
+
+        assert not marker.exists()
+        assert sorted(os.listdir(host / "activations")) == [".lock", "gpd1"]
+
+    def test_disconnect_alone_runs_gpclient_disconnect(
+        self, service_module, host, monkeypatch, dbus_signals
+    ):
+        launcher, marker = self._launcher(host)
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", launcher)
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._activation.claim()
+
+        asyncio.run(plugin.Disconnect())
+
+        assert marker.read_text() == "disconnect\n"
+
+    def test_detection_watches_the_claimed_interface(self, service_module, host):
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._activation.claim()
+        assert plugin._tunnel_candidates() == ["gpd0"]
+
+    def test_stale_cleanup_looks_at_gpdn_only(self, service_module, host):
+        for name in ("gpd0", "gpd1", "gpdx", "tun0"):
+            (host / "net" / name).mkdir()
+        plugin = service_module.GpclientVPNPlugin()
+        assert plugin._gpd_interfaces() == ["gpd0", "gpd1"]
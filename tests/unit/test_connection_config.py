@@ -0,0 +1,134 @@
+"""
+Tests for ConnectionConfig: the connection settings parsed once per profile
+revision, with the IPv4 addresses for Ip4Config packed up front.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import socket
+import struct
+
+import pytest
+
+UUID = "c0ffee00-0000-0000-0000-000000000000"
+
+
+def _u32(address):
+    return struct.unpack("<I", socket.inet_aton(address))[0]
+
+
+def _settings(data=None, secrets=None, ipv4=None, ipv6=None):
+    """A Connect() settings dict the way sdbus hands it over"""
+    return {
+        "connection": {"uuid": ("s", UUID), "id": ("s", "Work VPN")},
+        "vpn": {
+            "service-type": ("s", "org.freedesktop.NetworkManager.gpclient"),
+            "data": ("a{ss}", {"gateway": "vpn.example.com", **(data or {})}),
+            "secrets": ("a{ss}", secrets or {}),
+        },
+        "ipv4": ipv4 or {},
+        "ipv6": ipv6 or {},
+    }
+
+
+class TestFromSettings:
+    def test_defaults(self, service_module):
+        config = service_module.ConnectionConfig.from_settings(_settings())
+
+        assert config.uuid == UUID
+        assert config.gateway == "vpn.example.com"
+        assert config.auth_mode == "saml"
+        assert config.custom_routes == ()
+        assert config.dns_servers == ()
+        assert config.hip_cache_ttl == service_module.HIP_CACHE_TTL
+        assert (config.transport_setting, config.mtu_setting) == ("auto", "auto")
+        assert config.dpd_interval is None
+        assert not config.disable_ipv6
+
+    def test_routes_are_compacted_and_packed(self, service_module):
+        route_data = [
+            {"dest": ("s", "10.0.0.0"), "prefix": ("u", 24)},
+            {"dest": ("s", "10.0.1.0"), "prefix": ("u", 24)},
+        ]
+        config = service_module.ConnectionConfig.from_settings(
+            _settings(
+                data={"dns": "192.0.2.53; fd00::53"},
+                ipv4={"route-data": ("aa{sv}", route_data)},
+            )
+        )
+
+        assert config.custom_routes == (("10.0.0.0", 23),)
+        assert config.dns_servers == ("192.0.2.53", "fd00::53")
+        assert dict(config.packed) == {
+            "10.0.0.0": _u32("10.0.0.0"),
+            "192.0.2.53": _u32("192.0.2.53"),
+        }
+
+    def test_legacy_routes(self, service_module):
+        routes = [[_u32("172.16.0.0"), 12, 0, 0]]
+        config = service_module.ConnectionConfig.from_settings(
+            _settings(ipv4={"routes": ("aau", routes), "never-default": ("b", True)})
+        )
+
+        assert config.custom_routes == (("172.16.0.0", 12),)
+        assert config.never_default
+
+    def test_invalid_values_fall_back(self, service_module, caplog):
+        config = service_module.ConnectionConfig.from_settings(
+            _settings(
+                data={
+                    "transport": "quic",
+                    "mtu": "100",
+                    "dpd-interval": "soon",
+                    "fix-openssl": "maybe",
+                }
+            )
+        )
+
+        assert (config.transport_setting, config.mtu_setting) == ("auto", "auto")
+        assert config.fix_openssl_mode == "auto"
+        assert config.dpd_interval is None
+        assert "Invalid dpd-interval" in caplog.text
+
+    def test_is_immutable(self, service_module):
+        config = service_module.ConnectionConfig.from_settings(_settings())
+        with pytest.raises(AttributeError):
+            config.gateway = "other.example.com"
+        with pytest.raises(TypeError):
+            config.packed["10.0.0.1"] = 1
+
+    def test_no_gateway(self, service_module):
+        settings = _settings()
+        settings["vpn"]["data"] = ("a{ss}", {})
+        with pytest.raises(Exception, match="No gateway specified"):
+            service_module.ConnectionConfig.from_settings(settings)
+
+
+class TestRevisionCache:
+    def test_unchanged_settings_are_parsed_once(self, service_module):
+        plugin = service_module.GpclientVPNPlugin()
+        first = plugin._connection_config(_settings(secrets={"otp": "123456"}))
+        # A retry with a new one-time code is the same revision
+        second = plugin._connection_config(_settings(secrets={"otp": "654321"}))
+
+        assert second is first
+        assert "otp" not in repr(first)
+
+    def test_changed_settings_are_parsed_again(self, service_module):
+        plugin = service_module.GpclientVPNPlugin()
+        first = plugin._connection_config(_settings())
+        second = plugin._connection_config(_settings(data={"mtu": "1300"}))
+
+        assert second is not first
+        assert second.mtu_setting == "1300"
+        assert plugin._connection_config(_settings(data={"mtu": "1300"})) is second
+
+    def test_packed_addresses_are_used(self, service_module, monkeypatch):
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._config = plugin._connection_config(_settings(data={"dns": "192.0.2.53"}))
+
+        def unpacked(address):
+            raise AssertionError(f"{address} packed again")
+
+        monkeypatch.setattr(service_module, "ipv4_u32", unpacked)
+        assert plugin._ipv4_u32("192.0.2.53") == _u32("192.0.2.53")
@@ -0,0 +1,201 @@
+"""
+Tests for learned prompts: a connection whose recent activations always asked
+for a one-time code first gets the code requested at activation start, held in
+memory until gpclient's prompt appears.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+
+UUID = "e5b3e5b3-0000-0000-0000-000000000000"
+
+OTP_FIRST = [
+    {"kind": "username", "label": "Username", "phase": "Portal", "asked": False},
+    {"kind": "otp", "label": "Enter the next tokencode", "phase": "Portal", "asked": True},
+]
+PASSWORD_FIRST = [
+    {"kind": "password", "label": "Password", "phase": "Portal", "asked": True},
+    {"kind": "otp", "label": "Passcode", "phase": "Portal", "asked": True},
+]
+
+
+def _history(service_module, tmp_path, runs):
+    history = service_module.PromptHistory(str(tmp_path / "prompt-history.json"))
+    for run in runs:
+        history.record(UUID, run)
+    return history
+
+
+def _plugin(service_module, tmp_path, runs):
+    plugin = service_module.GpclientVPNPlugin()
+    plugin._connection_uuid = UUID
+    plugin._interactive = True
+    plugin._prompt_history = _history(service_module, tmp_path, runs)
+
+    async def nmcli(*_arguments):
+        return True
+
+    plugin._nmcli_modify = nmcli
+    written = []
+    plugin._write_answer = lambda answer, secret=True: written.append(answer)
+    return plugin, written
+
+
+def _secrets_requests(dbus_signals):
+    return [payload for name, payload in dbus_signals if name == "SecretsRequired"]
+
+
+async def _answer(plugin, code):
+    await plugin.NewSecrets({"vpn": {"secrets": ("a{ss}", {"otp": code})}})
+
+
+class TestPromptHistory:
+    def test_needs_enough_runs(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [OTP_FIRST])
+        assert history.early_prompt(UUID) is None
+
+        history.record(UUID, OTP_FIRST)
+        assert history.early_prompt(UUID)["label"] == "Enter the next tokencode"
+
+    def test_only_when_the_code_is_asked_first(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [PASSWORD_FIRST, PASSWORD_FIRST])
+        assert history.early_prompt(UUID) is None
+
+    def test_a_run_without_the_code_stops_it(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [OTP_FIRST, OTP_FIRST, []])
+        assert history.early_prompt(UUID) is None
+
+        # ...until it drops out of the recent runs
+        for _ in range(service_module.PROMPT_HISTORY_RUNS):
+            history.record(UUID, OTP_FIRST)
+        assert len(history.runs(UUID)) == service_module.PROMPT_HISTORY_RUNS
+        assert history.early_prompt(UUID) is not None
+
+    def test_other_connections_are_separate(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [OTP_FIRST, OTP_FIRST])
+        assert history.early_prompt("another-uuid") is None
+
+
+class TestEarlyOtp:
+    def test_code_typed_while_gpclient_connects(
+        self, service_module, virtual_clock, tmp_path, dbus_signals
+    ):
+        plugin, written = _plugin(service_module, tmp_path, [OTP_FIRST, OTP_FIRST])
+
+        async def scenario():
+            plugin._start_early_otp()
+            await asyncio.sleep(0)
+            assert len(_secrets_requests(dbus_signals)) == 1
+            await _answer(plugin, "123456")
+            # TLS and prelogin
+            await asyncio.sleep(5)
+            await plugin._handle_prompt("Enter the next tokencode")
+
+        virtual_clock.run(scenario())
+
+        assert written == ["123456"]
+        message, hints = _secrets_requests(dbus_signals)[0]
+        assert hints == [f"x-vpn-message:{message}", "otp"]
+        assert len(_secrets_requests(dbus_signals)) == 1
+
+    def test_prompt_waits_for_the_user(
+        self, service_module, virtual_clock, tmp_path, dbus_signals
+    ):
+        plugin, written = _plugin(service_module, tmp_path, [OTP_FIRST, OTP_FIRST])
+
+        async def scenario():
+            plugin._start_early_otp()
+            await asyncio.sleep(1)
+            prompt = asyncio.create_task(plugin._handle_prompt("Enter the next tokencode"))
+            await asyncio.sleep(10)
+            assert written == []
+            await _answer(plugin, "654321")
+            await prompt
+
+        virtual_clock.run(scenario())
+
+        assert written == ["654321"]
+        assert len(_secrets_requests(dbus_signals)) == 1
+
+    def test_stale_code_is_asked_again(
+        self, service_module, virtual_clock, tmp_path, dbus_signals
+    ):
+        plugin, written = _plugin(service_module, tmp_path, [OTP_FIRST, OTP_FIRST])
+
+        async def scenario():
+            plugin._start_early_otp()
+            await asyncio.sleep(0)
+            await _answer(plugin, "111111")
+            await asyncio.sleep(service_module.EARLY_OTP_MAX_AGE + 1)
+            prompt = asyncio.create_task(plugin._handle_prompt("Enter the next tokencode"))
+            await asyncio.sleep(1)
+            await _answer(plugin, "222222")
+            await prompt
+
+        virtual_clock.run(scenario())
+
+        assert written == ["222222"]
+        assert len(_secrets_requests(dbus_signals)) == 2
+
+    def test_unused_code_is_discarded_and_never_stored(
+        self, service_module, virtual_clock, tmp_path, dbus_signals
+    ):
+        plugin, written = _plugin(service_module, tmp_path, [OTP_FIRST, OTP_FIRST])
+
+        async def scenario():
+            plugin._start_early_otp()
+            await asyncio.sleep(0)
+            await _answer(plugin, "123456")
+            await asyncio.sleep(0)
+            # The portal skipped the challenge this time
+            plugin._record_prompts()
+
+        virtual_clock.run(scenario())
+
+        assert written == []
+        assert plugin._early_otp_task is None
+        assert "123456" not in (tmp_path / "prompt-history.json").read_text()
+        assert plugin._prompt_history.early_prompt(UUID) is None
+
+    def test_not_without_a_history_or_interaction(
+        self, service_module, virtual_clock, tmp_path, dbus_signals
+    ):
+        plugin, _written = _plugin(service_module, tmp_path, [PASSWORD_FIRST] * 2)
+        plugin._start_early_otp()
+        assert plugin._early_otp_task is None
+
+        (tmp_path / "otp").mkdir()
+        plugin, _written = _plugin(service_module, tmp_path / "otp", [OTP_FIRST] * 2)
+        assert plugin._prompt_history.early_prompt(UUID) is not None
+        plugin._interactive = False
+        plugin._start_early_otp()
+        assert plugin._early_otp_task is None
+
+    def test_prompts_are_learned(self, service_module, virtual_clock, tmp_path):
+        plugin, written = _plugin(service_module, tmp_path, [])
+        plugin.vpn_username = "jdoe"
+        plugin._reset_phase_state()
+
+        async def scenario():
+            await plugin._handle_prompt("Username")
+            prompt = asyncio.create_task(plugin._handle_prompt("Enter the next tokencode"))
+            await asyncio.sleep(1)
+            await _answer(plugin, "123456")
+            await prompt
+            plugin._record_prompts()
+
+        virtual_clock.run(scenario())
+
+        assert written == ["jdoe", "123456"]
+        assert plugin._prompt_history.runs(UUID) == [
+            [
+                {"kind": "username", "label": "Username", "phase": "", "asked": False},
+                {
+                    "kind": "otp",
+                    "label": "Enter the next tokencode",
+                    "phase": "",
+                    "asked": True,
+                },
+            ]
+        ]
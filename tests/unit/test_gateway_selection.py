@@ -6,6 +6,7 @@ Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
 """
 
 import asyncio
+import shutil
 
 # A single-page gateway list as inquire renders it: the question, one line per
 # option (marker, space, value; '>' marks the cursor) and the help footer. Every
@@ -139,7 +140,10 @@ class TestGatewayQuestionIsNotAUsername:
         # The frame ends with a terminated help line, so the tail is empty and
         # detect_prompt() sees nothing to answer
         scanner = service_module.OutputScanner()
-        scanner.feed("\r\n".join(SINGLE_PAGE) + "\r\n")
+        tokens = service_module.AnsiTokenizer().feed(
+            ("\r\n".join(SINGLE_PAGE) + "\r\n").encode()
+        )
+        scanner.feed_tokens(tokens)
         assert scanner.tail == ""
         assert service_module.detect_prompt(scanner.tail) is None
 
@@ -397,9 +401,7 @@ class TestResolveBrowser:
 
     def test_without_the_wrapper_the_binary_is_used(self, service_module, monkeypatch):
         self._with_wrapper(service_module, monkeypatch, present=False)
-        monkeypatch.setattr(
-            service_module.shutil, "which", lambda name: f"/usr/bin/{name}"
-        )
+        monkeypatch.setattr(shutil, "which", lambda name: f"/usr/bin/{name}")
         assert service_module.resolve_browser("firefox") == ("/usr/bin/firefox", None)
         assert service_module.resolve_browser("edge") == (
             "/usr/bin/microsoft-edge",
@@ -0,0 +1,219 @@
+"""
+Tests for the caching HIP report wrapper (scripts/hip-wrapper.py) that the
+service passes to gpclient as --csd-wrapper.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+WRAPPER = Path(__file__).resolve().parents[2] / "scripts" / "hip-wrapper.py"
+
+# Stands in for hipreport.sh: counts its runs and reports the session fields
+FAKE_HIPREPORT = r"""#!/bin/sh
+echo run >> "$(dirname "$0")/runs"
+while [ $# -gt 0 ]; do
+  case "$1" in
+    --md5) md5=$2; shift ;;
+    --client-ip) ip=$2; shift ;;
+    --cookie) user=$(echo "$2" | sed -n 's/.*user=\([^&]*\).*/\1/p'); shift ;;
+  esac
+  shift
+done
+cat <<XML
+<hip-report name="hip-report">
+	<md5-sum>$md5</md5-sum>
+	<user-name>$user</user-name>
+	<ip-address>$ip</ip-address>
+	<generate-time>01/01/2020 00:00:00</generate-time>
+	<entry name="host-info"><os>Linux Test</os></entry>
+	<entry name="firewall"><enabled>yes</enabled><name>"yes"</name></entry>
+</hip-report>
+XML
+"""
+
+
+def _setup(tmp_path):
+    fake = tmp_path / "hipreport.sh"
+    fake.write_text(FAKE_HIPREPORT)
+    fake.chmod(0o755)
+    state = tmp_path / "av-definitions"
+    state.write_text("v1")
+    env = dict(
+        os.environ,
+        GPCLIENT_HIP_REAL_WRAPPER=str(fake),
+        GPCLIENT_HIP_CACHE_DIR=str(tmp_path / "cache"),
+        GPCLIENT_HIP_STATE_FILES=str(state),
+    )
+    return env, state
+
+
+def _run(env, md5="aaaa1111", ip="10.1.2.3", user="jdoe", **extra):
+    argv = [
+        sys.executable,
+        str(WRAPPER),
+        "--cookie",
+        f"authcookie=x&user={user}&domain=corp",
+        "--client-ip",
+        ip,
+        "--md5",
+        md5,
+        "--client-os",
+        "Linux",
+    ]
+    result = subprocess.run(
+        argv, env=dict(env, **extra), capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+
+def _as_user(uid, home, check):
+    """check(module) in a child running as uid with HOME=home; its result
+
+    The wrapper's source is read here: uid may not be able to reach it.
+    """
+    source = WRAPPER.read_text()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_end)
+            os.environ["HOME"] = home
+            for key in ("XDG_CACHE_HOME", "GPCLIENT_HIP_CACHE_DIR"):
+                os.environ.pop(key, None)
+            # Loaded first: the standard library may not be readable as uid
+            module = types.ModuleType("hip_wrapper")
+            exec(compile(source, str(WRAPPER), "exec"), module.__dict__)
+            if os.getuid() != uid:
+                os.setgroups([])
+                os.setgid(uid)
+                os.setuid(uid)
+            result = json.dumps(check(module))
+            os.write(write_end, result.encode())
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as handle:
+        output = handle.read()
+    os.waitpid(pid, 0)
+    return json.loads(output) if output else None
+
+
+def _runs(tmp_path):
+    return len((tmp_path / "runs").read_text().splitlines())
+
+
+class TestHipCache:
+    def test_second_session_comes_from_the_cache(self, tmp_path):
+        env, _ = _setup(tmp_path)
+
+        first = _run(env)
+        second = _run(env, md5="bbbb2222", ip="10.9.9.9", user="asmith")
+
+        assert _runs(tmp_path) == 1
+        assert "<md5-sum>aaaa1111</md5-sum>" in first
+        assert "<md5-sum>bbbb2222</md5-sum>" in second
+        assert "<ip-address>10.9.9.9</ip-address>" in second
+        assert "<user-name>asmith</user-name>" in second
+        assert "01/01/2020" not in second
+        assert "<os>Linux Test</os>" in second
+
+    def test_short_user_name_is_replaced_only_in_user_name(self, tmp_path):
+        env, _ = _setup(tmp_path)
+
+        first = _run(env, user="yes")
+        second = _run(env, user="asmith")
+
+        assert _runs(tmp_path) == 1
+        assert "<user-name>yes</user-name>" in first
+        assert "<user-name>asmith</user-name>" in second
+        assert '<enabled>yes</enabled><name>"yes"</name>' in second
+
+    def test_host_state_change_regenerates(self, tmp_path):
+        env, state = _setup(tmp_path)
+
+        _run(env)
+        state.write_text("v2 with newer definitions")
+        _run(env)
+
+        assert _runs(tmp_path) == 2
+
+    def test_ttl(self, tmp_path):
+        env, _ = _setup(tmp_path)
+
+        _run(env, GPCLIENT_HIP_CACHE_TTL="0")
+        _run(env, GPCLIENT_HIP_CACHE_TTL="0")
+        assert _runs(tmp_path) == 2
+        assert not (tmp_path / "cache").exists()
+
+        _run(env)
+        cache = tmp_path / "cache" / "hip-report.json"
+        entry = json.loads(cache.read_text())
+        entry["created"] -= 3600
+        cache.write_text(json.dumps(entry))
+        _run(env, GPCLIENT_HIP_CACHE_TTL="600")
+        assert _runs(tmp_path) == 4
+
+    def test_cache_is_private(self, tmp_path):
+        env, _ = _setup(tmp_path)
+
+        _run(env)
+
+        cache = tmp_path / "cache" / "hip-report.json"
+        assert stat.S_IMODE(cache.stat().st_mode) == 0o600
+
+    def test_default_cache_is_per_user(self):
+        # The wrapper runs as the desktop user openconnect drops to
+        uid = 65534 if os.getuid() == 0 else os.getuid()
+        home = tempfile.mkdtemp(prefix="hip-home-")
+        try:
+            os.chmod(home, 0o755)
+            if os.getuid() == 0:
+                os.chown(home, uid, uid)
+
+            def check(module):
+                path = os.path.join(module.CACHE_DIR, module.CACHE_FILE)
+                module.store_cache(path, {"report": "<hip-report/>"})
+                return {
+                    "path": path,
+                    "entry": module.load_cache(path),
+                    "dir_mode": stat.S_IMODE(os.stat(module.CACHE_DIR).st_mode),
+                    "file_mode": stat.S_IMODE(os.stat(path).st_mode),
+                    "uid": os.stat(path).st_uid,
+                }
+
+            result = _as_user(uid, home, check)
+        finally:
+            subprocess.run(["rm", "-rf", home], check=True)
+
+        assert result is not None
+        assert result["path"] == os.path.join(
+            home, ".cache", "nm-gpclient", "hip-report.json"
+        )
+        assert result["entry"] == {"report": "<hip-report/>"}
+        assert result["dir_mode"] == 0o700
+        assert result["file_mode"] == 0o600
+        assert result["uid"] == uid
+
+    def test_failed_report_is_not_cached(self, tmp_path):
+        env, _ = _setup(tmp_path)
+        failing = tmp_path / "failing.sh"
+        failing.write_text("#!/bin/sh\necho partial\nexit 2\n")
+        failing.chmod(0o755)
+
+        result = subprocess.run(
+            [sys.executable, str(WRAPPER), "--md5", "x"],
+            env=dict(env, GPCLIENT_HIP_REAL_WRAPPER=str(failing)),
+            capture_output=True,
+            text=True,
+        )
+
+        assert result.returncode == 2
+        assert not (tmp_path / "cache" / "hip-report.json").exists()
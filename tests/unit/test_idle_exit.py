@@ -0,0 +1,98 @@
+"""
+Tests for the idle exit: the service leaves after a period without a session or
+a call from NetworkManager, unless --persist (or a zero timeout) keeps it.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import sys
+
+
+class FakeProcess:
+    pid = 4242
+    returncode = None
+
+
+def _plugin(service_module):
+    return service_module.GpclientVPNPlugin()
+
+
+class TestWaitUntilIdle:
+    def test_idle_service_exits_after_the_timeout(self, service_module, virtual_clock):
+        async def scenario():
+            plugin = _plugin(service_module)
+            await plugin.wait_until_idle(60)
+
+        virtual_clock.run(scenario())
+
+        assert 60 <= virtual_clock.loop.time() < 60 + service_module.IDLE_CHECK_INTERVAL
+
+    def test_not_while_gpclient_runs(self, service_module, virtual_clock):
+        async def scenario():
+            plugin = _plugin(service_module)
+            plugin.gpclient_process = FakeProcess()
+            waiting = asyncio.create_task(plugin.wait_until_idle(60))
+            await asyncio.sleep(3600)
+            assert not waiting.done()
+
+            plugin.gpclient_process.returncode = 0
+            await waiting
+
+        virtual_clock.run(scenario())
+
+        # The end of the session is noticed at the next check
+        interval = service_module.IDLE_CHECK_INTERVAL
+        assert 3660 - interval <= virtual_clock.loop.time() <= 3660 + interval
+
+    def test_calls_from_networkmanager_restart_the_timer(
+        self, service_module, virtual_clock
+    ):
+        async def scenario():
+            plugin = _plugin(service_module)
+            waiting = asyncio.create_task(plugin.wait_until_idle(60))
+            await asyncio.sleep(50)
+            # The user is typing the password for the next Connect()
+            await plugin.NeedSecrets({"vpn": {"data": ("a{ss}", {})}})
+            await asyncio.sleep(50)
+            assert not waiting.done()
+            await waiting
+
+        virtual_clock.run(scenario())
+
+        assert 110 <= virtual_clock.loop.time() < 110 + service_module.IDLE_CHECK_INTERVAL
+
+
+class TestMainLoop:
+    def _main(self, service_module, monkeypatch, *argv):
+        monkeypatch.setattr(
+            service_module.GpclientVPNPlugin,
+            "export_to_dbus",
+            lambda self, path: None,
+            raising=False,
+        )
+        monkeypatch.setattr(sys, "argv", ["nm-gpclient-service", *argv])
+        monkeypatch.delenv(service_module.IDLE_EXIT_ENV, raising=False)
+        monkeypatch.delenv("JOURNAL_STREAM", raising=False)
+        return service_module.main_async()
+
+    def test_idle_exit(self, service_module, monkeypatch, caplog):
+        code = asyncio.run(
+            asyncio.wait_for(
+                self._main(service_module, monkeypatch, "--idle-exit", "0.01"), 5
+            )
+        )
+
+        assert code == 0
+        assert "No session for 0.01s, exiting" in caplog.text
+
+    def test_persist_keeps_running(self, service_module, monkeypatch):
+        async def scenario():
+            main = asyncio.create_task(
+                self._main(service_module, monkeypatch, "--persist", "--idle-exit", "0.01")
+            )
+            await asyncio.sleep(0.2)
+            assert not main.done()
+            main.cancel()
+
+        asyncio.run(scenario())
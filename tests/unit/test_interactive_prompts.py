@@ -165,33 +165,41 @@ class TestClassifyPromptKind:
 
 
 class TestOutputScanner:
-    def test_complete_lines_and_tail(self, service_module):
+    @staticmethod
+    def _scanner(service_module):
+        """An OutputScanner fed raw output through an AnsiTokenizer, like the
+        service's reader"""
         scanner = service_module.OutputScanner()
-        lines = scanner.feed("line1\r\nline2\n? Password: ")
+        tokenizer = service_module.AnsiTokenizer()
+        return scanner, lambda raw: scanner.feed_tokens(tokenizer.feed(raw.encode()))
+
+    def test_complete_lines_and_tail(self, service_module):
+        scanner, feed = self._scanner(service_module)
+        lines = feed("line1\r\nline2\n? Password: ")
         assert lines == ["line1", "line2"]
         assert scanner.tail == "? Password: "
 
     def test_tail_accumulates_across_chunks(self, service_module):
-        scanner = service_module.OutputScanner()
-        scanner.feed("? Pass")
-        lines = scanner.feed("word: ")
+        scanner, feed = self._scanner(service_module)
+        feed("? Pass")
+        lines = feed("word: ")
         assert lines == []
         assert scanner.tail == "? Password: "
 
     def test_carriage_return_redraw_splits_lines(self, service_module):
         # inquire redraws the prompt line using \r
-        scanner = service_module.OutputScanner()
-        scanner.feed("? Username: \r? Username: j\r? Username: jd")
+        scanner, feed = self._scanner(service_module)
+        feed("? Username: \r? Username: j\r? Username: jd")
         assert scanner.tail == "? Username: jd"
 
     def test_full_rsa_flow_from_issue_6(self, service_module):
-        scanner = service_module.OutputScanner()
+        scanner, feed = self._scanner(service_module)
         raw = (
             "[2026-07-16T23:25:20Z INFO  gpclient::cli] gpclient started: 2.5.1\r\n"
             "Please enter RSA token (Portal: vpneast.comtechtel.com)\r\n"
             "\x1b[32m?\x1b[0m Username: "
         )
-        lines = scanner.feed(service_module.strip_ansi(raw))
+        lines = feed(raw)
 
         banners = [
             b
@@ -0,0 +1,203 @@
+"""
+Tests for IPv6 tunnels: both address families come from one `ip -o addr`
+pass, and the service emits Config (has-ip6) and Ip6Config with the pushed
+IPv6 DNS servers and split routes.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import ipaddress
+import os
+import subprocess
+from pathlib import Path
+
+HOOK = Path(__file__).resolve().parents[2] / "config" / "90-gpclient-routing"
+
+IP_ADDR_OUTPUT = (
+    r"7: gpd0    inet 10.1.2.3/32 scope global gpd0\       valid_lft forever"
+    "\n"
+    r"7: gpd0    inet6 fe80::1d2c/64 scope link stable-privacy \       valid_lft"
+    "\n"
+    r"7: gpd0    inet6 fd00:20:30::40/64 scope global \       valid_lft forever"
+    "\n"
+)
+
+
+def _packed(address):
+    return ipaddress.ip_address(address).packed
+
+
+def _fake_ip(tmp_path, monkeypatch, output):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "output").write_text(output)
+    script = bin_dir / "ip"
+    script.write_text(f'#!/bin/sh\necho "$*" > "{bin_dir}/args"\ncat "{bin_dir}/output"\n')
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return bin_dir
+
+
+class TestInterfaceAddresses:
+    def test_both_families_in_one_pass(self, service_module, tmp_path, monkeypatch):
+        bin_dir = _fake_ip(tmp_path, monkeypatch, IP_ADDR_OUTPUT)
+        plugin = service_module.GpclientVPNPlugin()
+
+        ipv4, ipv6 = asyncio.run(plugin._get_iface_addresses("gpd0"))
+
+        assert ipv4 == ("10.1.2.3", 32)
+        # The link-local address is skipped
+        assert ipv6 == ("fd00:20:30::40", 64)
+        assert (bin_dir / "args").read_text().split() == [
+            "-o",
+            "addr",
+            "show",
+            "dev",
+            "gpd0",
+        ]
+
+    def test_ipv4_only_and_peer_address(self, service_module, tmp_path, monkeypatch):
+        _fake_ip(
+            tmp_path,
+            monkeypatch,
+            "7: tun0    inet 10.9.8.7 peer 10.9.8.1/32 scope global tun0\n",
+        )
+        plugin = service_module.GpclientVPNPlugin()
+
+        assert asyncio.run(plugin._get_iface_addresses("tun0")) == (
+            ("10.9.8.7", 32),
+            None,
+        )
+
+
+def _emit(service_module, monkeypatch, tmp_path, pushed, **attributes):
+    """Run the tunnel check on a dual-stack gpd0 with `pushed` handed over"""
+    (tmp_path / "gpd0").mkdir()
+    monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(tmp_path))
+    path = tmp_path / "pushed"
+    path.write_text("".join(f"{key}={value}\n" for key, value in pushed.items()))
+    plugin = service_module.GpclientVPNPlugin()
+    plugin._pushed_config_path = str(path)
+    for name, value in attributes.items():
+        setattr(plugin, name, value)
+
+    async def addresses(iface):
+        return ("10.1.2.3", 32), ("fd00:20:30::40", 64)
+
+    plugin._get_iface_addresses = addresses
+    asyncio.run(plugin._check_tunnel_loop())
+
+
+class TestIp6Config:
+
+    def test_dual_stack_tunnel(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        pushed = {
+            "INTERNAL_IP4_DNS": "10.0.0.53 fd00::53",
+            "SPLIT_INC_ROUTES": "10.0.0.0/8",
+            "SPLIT_INC6_ROUTES": "fd00:0:1::/48 fd00::/48 2001:db8::/32",
+        }
+        _emit(service_module, monkeypatch, tmp_path, pushed)
+
+        names = [name for name, _ in dbus_signals]
+        assert names.index("Config") < names.index("Ip4Config")
+        assert names.index("Ip4Config") < names.index("Ip6Config")
+        generic = dict(dbus_signals)["Config"]
+        assert generic["tundev"] == ("s", "gpd0")
+        assert generic["has-ip4"] == ("b", True)
+        assert generic["has-ip6"] == ("b", True)
+
+        ip4 = dict(dbus_signals)["Ip4Config"]
+        assert len(ip4["dns"][1]) == 1
+
+        ip6 = dict(dbus_signals)["Ip6Config"]
+        assert ip6["address"] == ("ay", _packed("fd00:20:30::40"))
+        assert ip6["prefix"] == ("u", 64)
+        assert ip6["dns"] == ("aay", [_packed("fd00::53")])
+        zero = bytes(16)
+        assert ip6["routes"] == (
+            "a(ayuayu)",
+            # The DNS server's host route is inside the merged fd00::/47
+            [(_packed("2001:db8::"), 32, zero, 0), (_packed("fd00::"), 47, zero, 0)],
+        )
+
+    def test_disabled_ipv6_reports_ipv4_only(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        _emit(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            {"SPLIT_INC6_ROUTES": "fd00::/8"},
+            disable_ipv6=True,
+        )
+
+        assert "Ip6Config" not in [name for name, _ in dbus_signals]
+        assert dict(dbus_signals)["Config"]["has-ip6"] == ("b", False)
+
+    def test_ipv6_never_default(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        _emit(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            {"SPLIT_INC6_ROUTES": "::/0 fd00::/8"},
+            ipv6_never_default=True,
+        )
+
+        routes = dict(dbus_signals)["Ip6Config"]["routes"][1]
+        assert [(route[0], route[1]) for route in routes] == [(_packed("fd00::"), 8)]
+
+
+class TestRoutingHookIpv6:
+    def test_ipv6_split_routes_are_handed_over(self, tmp_path):
+        env = {
+            "PATH": os.environ["PATH"],
+            "GPCLIENT_NM_PUSHED_CONFIG": str(tmp_path / "pushed"),
+            "INTERNAL_IP4_DNS": "10.0.0.53 fd00::53",
+            "CISCO_IPV6_SPLIT_INC": "2",
+            "CISCO_IPV6_SPLIT_INC_0_ADDR": "fd00::",
+            "CISCO_IPV6_SPLIT_INC_0_MASKLEN": "48",
+            "CISCO_IPV6_SPLIT_INC_1_ADDR": "2001:db8::",
+            "CISCO_IPV6_SPLIT_INC_1_MASKLEN": "32",
+        }
+        result = subprocess.run(
+            ["sh", "-c", f'. "{HOOK}"\necho "$CISCO_IPV6_SPLIT_INC"'],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert result.stdout.strip() == "0"
+        pushed = (tmp_path / "pushed").read_text()
+        assert "SPLIT_INC6_ROUTES=fd00::/48 2001:db8::/32\n" in pushed
+
+
+class TestExternalGateway:
+    def test_gateway_is_the_vpn_server(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        _emit(service_module, monkeypatch, tmp_path, {"VPNGATEWAY": "198.51.100.7"})
+
+        generic = dict(dbus_signals)["Config"]
+        assert generic["gateway"] == ("u", service_module.ipv4_u32("198.51.100.7"))
+
+    def test_ipv6_vpn_server(self, service_module, monkeypatch, tmp_path, dbus_signals):
+        _emit(service_module, monkeypatch, tmp_path, {"VPNGATEWAY": "2001:db8::7"})
+
+        assert dict(dbus_signals)["Config"]["gateway"] == (
+            "ay",
+            _packed("2001:db8::7"),
+        )
+
+    def test_left_out_without_vpngateway(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        _emit(service_module, monkeypatch, tmp_path, {})
+
+        assert "gateway" not in dict(dbus_signals)["Config"]
+        assert "gateway" in dict(dbus_signals)["Ip4Config"]
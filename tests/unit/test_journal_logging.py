@@ -0,0 +1,143 @@
+"""
+Tests for the journal logging layer: native journal protocol with structured
+fields, the rate limit on gpclient output and the output dumped on failure.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import logging
+import socket
+import struct
+
+
+def _parse_journal_datagram(data):
+    """Decode the native journal protocol (both the plain and binary form)"""
+    fields = {}
+    while data:
+        newline = data.index(b"\n")
+        head = data[:newline]
+        if b"=" in head:
+            key, _, value = head.partition(b"=")
+            data = data[newline + 1 :]
+        else:
+            key = head
+            (length,) = struct.unpack("<Q", data[newline + 1 : newline + 9])
+            value = data[newline + 9 : newline + 9 + length]
+            data = data[newline + 9 + length + 1 :]
+        fields[key.decode()] = value.decode()
+    return fields
+
+
+def _record(message, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord(
+        "nm_gpclient_service", level, "/x/service.py", 42, message, args, None, "fn"
+    )
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class TestJournalHandler:
+    def test_structured_fields_reach_the_journal(self, service_module, tmp_path):
+        path = str(tmp_path / "journal.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(path)
+        handler = service_module.JournalHandler(path)
+        service_module.LOG_CONTEXT.update(
+            CONNECTION_UUID="uuid-1", PHASE="portal-auth", GPCLIENT_PID="4242"
+        )
+        try:
+            handler.emit(_record("gpclient output: %s", "hello"))
+            fields = _parse_journal_datagram(server.recv(65536))
+        finally:
+            service_module.LOG_CONTEXT.clear()
+            handler.close()
+            server.close()
+
+        assert fields["MESSAGE"] == "gpclient output: hello"
+        assert fields["PRIORITY"] == "6"
+        assert fields["SYSLOG_IDENTIFIER"] == "nm-gpclient-service"
+        assert fields["CONNECTION_UUID"] == "uuid-1"
+        assert fields["PHASE"] == "portal-auth"
+        assert fields["GPCLIENT_PID"] == "4242"
+        assert fields["CODE_LINE"] == "42"
+
+    def test_multiline_message_uses_the_binary_form(self, service_module):
+        handler = service_module.JournalHandler("/nonexistent")
+        record = _record(
+            "Last lines:\n%s", "a\nb", level=logging.ERROR, journal={"GATEWAY": "gw"}
+        )
+
+        fields = _parse_journal_datagram(handler.encode(record))
+        handler.close()
+
+        assert fields["MESSAGE"] == "Last lines:\na\nb"
+        assert fields["PRIORITY"] == "3"
+        assert fields["GATEWAY"] == "gw"
+
+    def test_arguments_are_formatted_only_when_emitted(self, service_module):
+        class Exploding:
+            def __str__(self):
+                raise AssertionError("formatted a disabled debug message")
+
+        service_module.logger.debug("Full connection data: %s", Exploding())
+
+
+class TestTokenBucket:
+    def test_burst_then_rate(self, service_module):
+        now = [0.0]
+        bucket = service_module.TokenBucket(rate=2.0, burst=3, clock=lambda: now[0])
+
+        assert [bucket.allow() for _ in range(4)] == [True, True, True, False]
+        now[0] += 0.5  # one token back at 2/s
+        assert bucket.allow() is True
+        assert bucket.allow() is False
+        now[0] += 100  # refills up to the burst, not beyond
+        assert sum(bucket.allow() for _ in range(10)) == 3
+
+
+class TestGpclientOutputLogging:
+    def test_flood_is_limited_and_counted(self, service_module, caplog):
+        plugin = service_module.GpclientVPNPlugin()
+        now = [0.0]
+        plugin._output_limiter = service_module.TokenBucket(
+            rate=1.0, burst=5, clock=lambda: now[0]
+        )
+
+        with caplog.at_level(logging.INFO, logger="nm_gpclient_service"):
+            for index in range(100):
+                plugin._log_gpclient_line(f"[DEBUG openconnect] packet {index}")
+            # Errors get through even while the limiter is empty
+            plugin._log_gpclient_line("[ERROR gpclient] Error: it broke")
+            plugin._flush_suppressed_lines()
+
+        messages = [record.getMessage() for record in caplog.records]
+        output = [m for m in messages if m.startswith("gpclient output:")]
+        assert len(output) == 6
+        assert output[-1] == "gpclient output: [ERROR gpclient] Error: it broke"
+        assert "95 gpclient output lines not logged (rate limit)" in messages
+
+    def test_output_is_dumped_only_on_failure(
+        self, service_module, caplog, dbus_signals
+    ):
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._output_ring.extend(["line one", "line two"])
+
+        with caplog.at_level(logging.INFO, logger="nm_gpclient_service"):
+            plugin._emit_failure(service_module.NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED)
+            plugin._emit_failure(service_module.NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED)
+
+        dumps = [
+            record.getMessage()
+            for record in caplog.records
+            if record.getMessage().startswith("Last ")
+        ]
+        assert dumps == ["Last 2 lines of gpclient output:\nline one\nline two"]
+
+    def test_ring_buffer_is_bounded(self, service_module):
+        plugin = service_module.GpclientVPNPlugin()
+
+        for index in range(service_module.GPCLIENT_OUTPUT_RING_LINES * 3):
+            plugin._output_ring.append(f"line {index}")
+
+        assert len(plugin._output_ring) == service_module.GPCLIENT_OUTPUT_RING_LINES
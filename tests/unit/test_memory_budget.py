@@ -0,0 +1,102 @@
+"""
+Tests for the per-session memory budget - gpclient output lines, the failure
+ring and the gateway list are trimmed and counted instead of growing - and for
+the tracemalloc snapshots TakeMemorySnapshot() compares.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import tracemalloc
+
+import pytest
+
+
+@pytest.fixture
+def small_budget(service_module, monkeypatch):
+    monkeypatch.setattr(service_module, "OUTPUT_LINE_MAX_CHARS", 10)
+    monkeypatch.setattr(service_module, "OUTPUT_RING_MAX_CHARS", 25)
+    monkeypatch.setattr(service_module, "GATEWAY_LIST_MAX_ENTRIES", 2)
+
+
+class TestOutputBudget:
+    def test_long_lines_keep_their_end(self, service_module, small_budget):
+        plugin = service_module.GpclientVPNPlugin()
+
+        lines = plugin._consume_output(b"0123456789abcdef\r\nshort\r\n")
+        # A prompt that never ends its line, spread over several reads
+        for _ in range(5):
+            plugin._consume_output(b"progress.. ")
+        plugin._consume_output(b"Password: ")
+
+        assert lines == ["6789abcdef", "short"]
+        assert plugin._output_scanner.tail == "Password: "
+        assert plugin.TrimmedOutput() == {"line-chars": 6 + 55}
+
+    def test_ring_drops_the_oldest_lines(self, service_module, small_budget):
+        plugin = service_module.GpclientVPNPlugin()
+
+        for line in ("first line", "second line", "third line", "4th"):
+            plugin._output_ring.append(line)
+
+        assert list(plugin._output_ring) == ["second line", "third line", "4th"]
+        assert plugin._output_ring.chars == 24
+        assert plugin.TrimmedOutput() == {"ring-lines": 1}
+        plugin._output_ring.clear()
+        assert plugin._output_ring.chars == 0
+
+    def test_ring_keeps_a_line_over_the_budget(self, service_module, small_budget):
+        ring = service_module.OutputRing(400)
+
+        ring.append("x" * 30)
+
+        assert len(ring) == 1
+        assert not ring.trimmed
+
+    def test_ring_line_limit_still_applies(self, service_module):
+        ring = service_module.OutputRing(2)
+
+        for line in ("a", "bb", "ccc"):
+            ring.append(line)
+
+        assert list(ring) == ["bb", "ccc"]
+        assert ring.chars == 5
+        assert not ring.trimmed
+
+    def test_gateway_list_is_capped(self, service_module, small_budget):
+        plugin = service_module.GpclientVPNPlugin()
+
+        plugin._record_gateways(["gw-a (a)", "gw-b (b)", "gw-a (a)", "gw-c (c)"])
+
+        assert plugin._gateway_list == ["gw-a (a)", "gw-b (b)"]
+        assert plugin.TrimmedOutput() == {"gateways": 1}
+
+
+class TestMemorySnapshots:
+    def test_diff_shows_the_allocating_line(self, service_module):
+        memory = service_module.MemorySnapshots()
+        was_tracing = tracemalloc.is_tracing()
+        try:
+            assert memory.take() == []
+            assert memory.tracing
+            kept = [bytearray(1024) for _ in range(200)]
+            changes = memory.take()
+        finally:
+            if not was_tracing:
+                memory.stop()
+
+        assert kept
+        assert "test_memory_budget.py" in changes[0]
+        assert len(changes) <= service_module.MEMORY_DIFF_TOP
+
+    def test_over_dbus(self, service_module):
+        plugin = service_module.GpclientVPNPlugin()
+
+        async def run():
+            first = await plugin.TakeMemorySnapshot()
+            await plugin.StopMemoryTracing()
+            return first
+
+        assert asyncio.run(run()) == []
+        assert not tracemalloc.is_tracing()
+        assert not plugin._memory.tracing
@@ -0,0 +1,181 @@
+"""
+Tests for path MTU probing and the tunnel MTU passed to gpclient and reported
+to NetworkManager.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+
+import pytest
+
+ROUTE_TABLE = """\
+Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT
+gpd0\t00000000\t00000000\t0001\t0\t0\t50\t00000000\t0\t0\t0
+wlan0\t00000000\t0101A8C0\t0003\t0\t0\t600\t00000000\t0\t0\t0
+eth0\t00000000\t010010AC\t0003\t0\t0\t100\t00000000\t0\t0\t0
+eth0\t000010AC\t00000000\t0001\t0\t0\t100\t0000FFFF\t0\t0\t0
+"""
+
+ARP_TABLE = """\
+IP address       HW type     Flags       HW address            Mask     Device
+192.168.1.1      0x1         0x2         11:22:33:44:55:66     *        wlan0
+172.16.0.1       0x1         0x2         aa:bb:cc:dd:ee:ff     *        eth0
+"""
+
+
+class FakeProber:
+    def __init__(self, path_mtu):
+        self.path_mtu = path_mtu
+        self.probed = []
+
+    async def probe(self, address):
+        self.probed.append(address)
+        return self.path_mtu
+
+
+class TestDeriveTunnelMtu:
+    def test_esp_fills_whole_cipher_blocks(self, service_module):
+        mtu = service_module.derive_tunnel_mtu(1500, "esp")
+
+        assert mtu == 1422
+        assert (mtu + service_module.ESP_TRAILER) % service_module.ESP_BLOCK_SIZE == 0
+        assert mtu + service_module.ESP_OVERHEAD + service_module.ESP_TRAILER <= 1500
+
+    def test_tls_overhead(self, service_module):
+        assert service_module.derive_tunnel_mtu(1500, "tls") == 1403
+        assert service_module.derive_tunnel_mtu(1400, "tls") == 1303
+
+    def test_tiny_path_is_clamped(self, service_module):
+        assert (
+            service_module.derive_tunnel_mtu(400) == service_module.MIN_TUNNEL_MTU
+        )
+
+
+class TestServerHost:
+    @pytest.mark.parametrize(
+        "server",
+        [
+            "vpn.example.com",
+            "vpn.example.com:443",
+            "https://vpn.example.com/global-protect",
+            " https://vpn.example.com:8443 ",
+        ],
+    )
+    def test_host_is_extracted(self, service_module, server):
+        assert service_module.server_host(server) == "vpn.example.com"
+
+
+class TestUplinkIdentity:
+    def test_lowest_metric_default_route_outside_the_tunnel(
+        self, service_module, tmp_path, monkeypatch
+    ):
+        route = tmp_path / "route"
+        route.write_text(ROUTE_TABLE)
+        arp = tmp_path / "arp"
+        arp.write_text(ARP_TABLE)
+        monkeypatch.setattr(service_module, "PROC_NET_ROUTE", str(route))
+        monkeypatch.setattr(service_module, "PROC_NET_ARP", str(arp))
+
+        assert service_module.uplink_identity() == "eth0/aa:bb:cc:dd:ee:ff"
+
+    def test_gateway_address_without_an_arp_entry(
+        self, service_module, tmp_path, monkeypatch
+    ):
+        route = tmp_path / "route"
+        route.write_text(ROUTE_TABLE)
+        monkeypatch.setattr(service_module, "PROC_NET_ROUTE", str(route))
+        monkeypatch.setattr(service_module, "PROC_NET_ARP", str(tmp_path / "none"))
+
+        assert service_module.uplink_identity() == "eth0/172.16.0.1"
+
+    def test_no_default_route(self, service_module, tmp_path, monkeypatch):
+        route = tmp_path / "route"
+        route.write_text(ROUTE_TABLE.splitlines()[0] + "\n")
+        monkeypatch.setattr(service_module, "PROC_NET_ROUTE", str(route))
+
+        assert service_module.uplink_identity() == ""
+
+
+class TestPathMtuProber:
+    def test_loopback_stand_in(self, service_module, virtual_clock):
+        # Nothing listens on the probe port: the path MTU is loopback's
+        prober = service_module.PathMtuProber()
+
+        mtu = virtual_clock.run(prober.probe("127.0.0.1"))
+
+        assert mtu is not None and mtu >= 1280
+
+
+class TestChooseTunnelMtu:
+    def _plugin(self, service_module, tmp_path, monkeypatch, setting="auto"):
+        monkeypatch.setattr(service_module, "uplink_identity", lambda: "eth0/aa:bb")
+        plugin = service_module.GpclientVPNPlugin()
+        plugin.gateway = "127.0.0.1"
+        plugin.mtu_setting = setting
+        plugin._mtu_prober = FakeProber(1400)
+        plugin._mtu_cache = service_module.MtuCache(str(tmp_path / "mtu.json"))
+        return plugin
+
+    def test_probe_result_is_cached_per_server_and_uplink(
+        self, service_module, tmp_path, monkeypatch
+    ):
+        plugin = self._plugin(service_module, tmp_path, monkeypatch)
+
+        first = asyncio.run(plugin._choose_tunnel_mtu())
+        second = asyncio.run(plugin._choose_tunnel_mtu())
+
+        assert first == second == service_module.derive_tunnel_mtu(1400)
+        assert plugin._mtu_prober.probed == ["127.0.0.1"]
+        assert plugin._mtu_cache.get("127.0.0.1|eth0/aa:bb") == 1400
+
+    def test_stale_cache_entry_is_probed_again(
+        self, service_module, tmp_path, monkeypatch
+    ):
+        plugin = self._plugin(service_module, tmp_path, monkeypatch)
+        plugin._mtu_cache.put("127.0.0.1|eth0/aa:bb", 1300)
+        plugin._mtu_cache.ttl = -1
+
+        assert asyncio.run(plugin._choose_tunnel_mtu()) == (
+            service_module.derive_tunnel_mtu(1400)
+        )
+        assert plugin._mtu_prober.probed == ["127.0.0.1"]
+
+    def test_fixed_and_disabled_settings(self, service_module, tmp_path, monkeypatch):
+        plugin = self._plugin(service_module, tmp_path, monkeypatch, setting="1380")
+        assert asyncio.run(plugin._choose_tunnel_mtu()) == 1380
+
+        plugin.mtu_setting = "off"
+        assert asyncio.run(plugin._choose_tunnel_mtu()) is None
+        assert plugin._mtu_prober.probed == []
+
+    def test_failed_probe_leaves_it_to_gpclient(
+        self, service_module, tmp_path, monkeypatch
+    ):
+        plugin = self._plugin(service_module, tmp_path, monkeypatch)
+        plugin._mtu_prober = FakeProber(None)
+
+        assert asyncio.run(plugin._choose_tunnel_mtu()) is None
+        assert plugin._mtu_cache.get("127.0.0.1|eth0/aa:bb") is None
+
+
+class TestMtuReported:
+    def test_interface_mtu_goes_into_ip4config(
+        self, service_module, tmp_path, monkeypatch, dbus_signals
+    ):
+        gpd0 = tmp_path / "gpd0"
+        gpd0.mkdir()
+        (gpd0 / "mtu").write_text("1422\n")
+        monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(tmp_path))
+        plugin = service_module.GpclientVPNPlugin()
+        plugin.tunnel_mtu = 1300
+
+        async def addresses(iface):
+            return ("10.1.2.3", 32), None
+
+        plugin._get_iface_addresses = addresses
+        asyncio.run(plugin._check_tunnel_loop())
+
+        config = next(payload for name, payload in dbus_signals if name == "Ip4Config")
+        assert config["mtu"] == ("u", 1422)
+        assert config["address"] == ("u", service_module.ipv4_u32("10.1.2.3"))
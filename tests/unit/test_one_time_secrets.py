@@ -113,8 +113,8 @@ class TestSplitEscapeSequences:
         plugin = service_module.GpclientVPNPlugin()
 
         # "\x1b[39m? Password: " arriving in two reads, cut inside the sequence
-        assert plugin._consume_output("\x1b[3") == []
-        lines = plugin._consume_output("9m? Password: \r\n")
+        assert plugin._consume_output(b"\x1b[3") == []
+        lines = plugin._consume_output(b"9m? Password: \r\n")
 
         assert lines == ["? Password: "]
         assert service_module.detect_prompt(lines[0]) == "Password"
@@ -126,16 +126,16 @@ class TestSplitEscapeSequences:
 
         # The report shows "?[39m Password" - the prefix and the colour code
         # arriving separately
-        plugin._consume_output("? \x1b[")
-        lines = plugin._consume_output("39mPassword: \r\n")
+        plugin._consume_output(b"? \x1b[")
+        lines = plugin._consume_output(b"39mPassword: \r\n")
 
         assert lines == ["? Password: "]
         assert service_module.detect_prompt(lines[0]) == "Password"
 
     def test_complete_sequence_is_not_held_back(self, service_module):
-        text = "\x1b[39m? Password: "
+        text = b"\x1b[39m? Password: "
         assert service_module.INCOMPLETE_ANSI_RE.search(text) is None
 
     def test_lone_escape_is_held_back(self, service_module):
-        match = service_module.INCOMPLETE_ANSI_RE.search("hello\x1b")
-        assert match and match.group(0) == "\x1b"
+        match = service_module.INCOMPLETE_ANSI_RE.search(b"hello\x1b")
+        assert match and match.group(0) == b"\x1b"
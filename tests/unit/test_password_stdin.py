@@ -0,0 +1,222 @@
+"""
+Tests for stored passwords passed with gpclient --passwd-on-stdin: for a
+connection whose recent runs always took the stored password, it is written to
+the PTY as a line once gpclient says it reads it - no prompt round-trip, and no
+terminal echo in the output.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import sys
+
+PASSWORD = "s3cret-Pa55"
+UUID = "5f0e5f0e-0000-0000-0000-000000000000"
+
+STORED = [
+    {"kind": "password", "label": "Password", "phase": "Portal", "asked": False},
+    {"kind": "password", "label": "Password", "phase": "Gateway", "asked": False},
+]
+STORED_THEN_MFA = STORED + [
+    {
+        "kind": "otp",
+        "label": "Enter the next tokencode",
+        "phase": "Gateway",
+        "asked": True,
+    }
+]
+TOKEN_PORTAL = [
+    {"kind": "otp", "label": "Password", "phase": "Portal", "asked": True},
+    {"kind": "password", "label": "Password", "phase": "Gateway", "asked": False},
+]
+TYPED = [{"kind": "password", "label": "Password", "phase": "Portal", "asked": True}]
+
+# Stand-in for gpclient's standard login with --passwd-on-stdin: the banner,
+# the log line, then one line read in canonical mode, which the gateway round
+# reuses. What it read goes to the file named in argv[1].
+FAKE_GPCLIENT = r'''
+import sys
+
+out = sys.argv[1]
+args = sys.argv[2:]
+sys.stdout.write("argv: %s\r\n" % " ".join(args))
+sys.stdout.write("Please enter the login credentials (Portal: vpn.example.com)\r\n")
+if "--passwd-on-stdin" in args:
+    sys.stdout.write(
+        "[INFO  gpclient::connect] Reading password from standard input\r\n"
+    )
+    sys.stdout.flush()
+    with open(out, "w") as handle:
+        handle.write(sys.stdin.readline())
+    # The gateway round takes the same password
+    sys.stdout.write("Please enter the login credentials (Gateway: gw.example.com)\r\n")
+    sys.stdout.write(
+        "[INFO  gpclient::connect] Reusing the password read from standard input\r\n"
+    )
+sys.stdout.write("[INFO  openconnect] Connected as 10.20.30.40, using SSL\r\n")
+sys.stdout.flush()
+'''
+
+# A prompt-looking line and the log line in one write; then whatever else is
+# typed within a second is recorded too
+FAKE_GPCLIENT_PROMPT_FIRST = r'''
+import os, select, sys
+
+out = sys.argv[1]
+sys.stdout.write(
+    "Password:\r\n"
+    "[INFO  gpclient::connect] Reading password from standard input\r\n"
+)
+sys.stdout.flush()
+read = sys.stdin.readline()
+while select.select([0], [], [], 1.0)[0]:
+    chunk = os.read(0, 1024)
+    if not chunk:
+        break
+    read += chunk.decode()
+with open(out, "w") as handle:
+    handle.write(read)
+'''
+
+
+def _history(service_module, tmp_path, runs):
+    history = service_module.PromptHistory(str(tmp_path / "prompt-history.json"))
+    for run in runs:
+        history.record(UUID, run)
+    return history
+
+
+def _plugin(
+    service_module,
+    monkeypatch,
+    tmp_path,
+    password,
+    runs=(STORED, STORED),
+    fake=FAKE_GPCLIENT,
+):
+    script = tmp_path / "gpclient.py"
+    script.write_text(fake)
+    launcher = tmp_path / "gpclient.sh"
+    launcher.write_text(
+        f'#!/bin/bash\nexec "{sys.executable}" "{script}" "{tmp_path / "read"}" "$@"\n'
+    )
+    launcher.chmod(0o755)
+    monkeypatch.setattr(service_module, "GPCLIENT_BINARY", str(launcher))
+
+    plugin = service_module.GpclientVPNPlugin()
+    plugin.gateway = "vpn.example.com"
+    plugin.browser = "/bin/true"
+    plugin.vpn_username = "jdoe"
+    plugin.vpn_password = password
+    plugin._username_prefilled = True
+    plugin._reset_phase_state()
+    plugin._connection_uuid = UUID
+    plugin._prompt_history = _history(service_module, tmp_path, runs)
+    return plugin
+
+
+async def _run(plugin):
+    assert await plugin._start_gpclient()
+    await asyncio.wait_for(plugin.stdout_monitor_task, timeout=30)
+
+
+class TestPasswordOnStdin:
+    def test_stored_password_is_read_from_stdin(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(service_module, monkeypatch, tmp_path, PASSWORD)
+
+        asyncio.run(_run(plugin))
+
+        assert (tmp_path / "read").read_text() == PASSWORD + "\n"
+        assert any("--passwd-on-stdin" in line for line in plugin._output_ring)
+        # Not echoed back by the terminal, so never logged
+        assert not any(PASSWORD in line for line in plugin._output_ring)
+        assert not [name for name, _ in dbus_signals if name == "SecretsRequired"]
+        assert plugin._prompts_seen == STORED
+
+    def test_a_prompt_after_it_is_a_challenge(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(service_module, monkeypatch, tmp_path, PASSWORD)
+        asyncio.run(_run(plugin))
+
+        # In the gateway round too, where gpclient reused the password
+        assert plugin._phase_key == ("Gateway", "gw.example.com")
+        assert plugin._classify_prompt_kind("Password", "") == "otp"
+
+    def test_no_stored_password_keeps_the_prompt(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(service_module, monkeypatch, tmp_path, "")
+
+        asyncio.run(_run(plugin))
+
+        assert not plugin._password_on_stdin
+        assert not (tmp_path / "read").exists()
+        assert not any("--passwd-on-stdin" in line for line in plugin._output_ring)
+
+    def test_unlearned_connection_keeps_the_prompt(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(service_module, monkeypatch, tmp_path, PASSWORD, runs=[STORED])
+
+        asyncio.run(_run(plugin))
+
+        assert not plugin._password_on_stdin
+        assert not (tmp_path / "read").exists()
+
+    def test_prompt_in_the_same_chunk_is_answered_once(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            PASSWORD,
+            fake=FAKE_GPCLIENT_PROMPT_FIRST,
+        )
+
+        asyncio.run(_run(plugin))
+
+        assert (tmp_path / "read").read_text() == PASSWORD + "\n"
+        assert not [name for name, _ in dbus_signals if name == "SecretsRequired"]
+
+    def test_pending_prompt_check_is_cancelled(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        plugin = _plugin(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            PASSWORD,
+            fake=FAKE_GPCLIENT_PROMPT_FIRST,
+        )
+
+        async def run():
+            # A debounced check left by earlier output
+            pending = asyncio.create_task(asyncio.sleep(60))
+            plugin._prompt_task = pending
+            await _run(plugin)
+            return pending.cancelled()
+
+        assert asyncio.run(run())
+        assert (tmp_path / "read").read_text() == PASSWORD + "\n"
+
+
+class TestLearnedPasswordRounds:
+    def test_stored_password_in_every_round(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [STORED, STORED_THEN_MFA])
+        assert history.password_on_stdin(UUID)
+        assert not history.password_on_stdin("another-uuid")
+
+    def test_needs_enough_runs(self, service_module, tmp_path):
+        assert not _history(service_module, tmp_path, [STORED]).password_on_stdin(UUID)
+
+    def test_not_for_a_token_in_the_password_field(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [STORED, TOKEN_PORTAL])
+        assert not history.password_on_stdin(UUID)
+
+    def test_not_when_the_user_typed_it(self, service_module, tmp_path):
+        history = _history(service_module, tmp_path, [STORED, TYPED])
+        assert not history.password_on_stdin(UUID)
@@ -0,0 +1,132 @@
+"""
+Tests for SamplingProfiler: a wall-clock profile of the event loop's thread and
+the pending tasks' await chains, written as collapsed stacks when it is stopped
+- by StopProfiling(), or by the next STARTED or failure.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import re
+import time
+
+import pytest
+
+COLLAPSED_LINE = re.compile(r"^\S.* (\d+)$")
+
+
+def _busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+async def _waiting_for_the_portal(event):
+    await event.wait()
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as handle:
+        lines = handle.read().splitlines()
+    for line in lines:
+        assert COLLAPSED_LINE.match(line), line
+    return lines
+
+
+@pytest.fixture
+def profiler(service_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(service_module, "PROFILE_SAMPLE_INTERVAL", 0.002)
+    monkeypatch.setattr(service_module, "PROFILE_TASK_INTERVAL", 0.01)
+    return service_module.SamplingProfiler(str(tmp_path / "profiles"))
+
+
+class TestSamplingProfiler:
+    def test_threads_and_tasks(self, profiler):
+        async def run():
+            event = asyncio.Event()
+            waiting = asyncio.create_task(
+                _waiting_for_the_portal(event), name="portal-login"
+            )
+            assert profiler.start("test")
+            assert not profiler.start("again")
+            await asyncio.sleep(0.05)
+            _busy(0.1)
+            await asyncio.sleep(0.05)
+            path = profiler.stop("test")
+            event.set()
+            await waiting
+            return path
+
+        path = asyncio.run(run())
+
+        assert os.path.dirname(path) == profiler.directory
+        assert path.endswith(".collapsed")
+        lines = _read(path)
+        loop_stacks = [line for line in lines if line.startswith("thread:event-loop;")]
+        assert any("_busy (test_profiler.py:" in line for line in loop_stacks)
+        # The await chain down to the Event the task waits on
+        task = [line for line in lines if line.startswith("task:portal-login;")]
+        assert task
+        assert "_waiting_for_the_portal (test_profiler.py:" in task[0]
+        assert "Event.wait (locks.py:" in task[0]
+        assert not profiler.running
+
+    def test_unnamed_tasks_are_named_by_coroutine(self, profiler):
+        async def run():
+            event = asyncio.Event()
+            waiting = asyncio.create_task(_waiting_for_the_portal(event))
+            profiler.start("test")
+            await asyncio.sleep(0.05)
+            path = profiler.stop("test")
+            event.set()
+            await waiting
+            return path
+
+        lines = _read(asyncio.run(run()))
+
+        assert any(line.startswith("task:_waiting_for_the_portal;") for line in lines)
+
+    def test_stop_when_not_running(self, profiler):
+        assert profiler.stop("test") is None
+
+    def test_time_limit(self, service_module, profiler, monkeypatch):
+        monkeypatch.setattr(service_module, "PROFILE_MAX_SECONDS", 0.05)
+
+        async def run():
+            profiler.start("test")
+            await asyncio.sleep(0.2)
+            return profiler.running
+
+        assert not asyncio.run(run())
+        assert os.listdir(profiler.directory)
+
+    def test_unwritable_directory(self, profiler, tmp_path, caplog):
+        (tmp_path / "file").write_text("")
+        profiler.directory = str(tmp_path / "file" / "profiles")
+
+        async def run():
+            profiler.start("test")
+            await asyncio.sleep(0.02)
+            return profiler.stop("test")
+
+        assert asyncio.run(run()) is None
+        assert "Cannot write the profile" in caplog.text
+        assert not profiler.running
+
+
+class TestStoppedByTheActivation:
+    def test_failure_writes_the_profile(self, service_module, profiler, dbus_signals):
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._profiler = profiler
+
+        async def run():
+            await plugin.StartProfiling()
+            with pytest.raises(ValueError):
+                await plugin.StartProfiling()
+            await asyncio.sleep(0.02)
+            plugin._emit_failure(service_module.NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED)
+            return await plugin.StopProfiling()
+
+        assert asyncio.run(run()) == ""
+        assert len(os.listdir(profiler.directory)) == 1
@@ -0,0 +1,251 @@
+"""
+Tests for the auth dialog's prompt service: the thin client that forwards a
+prompt over the session bus, the fallback to an in-process dialog, and the
+service side's bookkeeping. GTK and the session bus are replaced by fakes - the
+dialog itself needs an X11/Wayland session.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import importlib.util
+import io
+import os
+import sys
+import types
+
+import pytest
+
+DIALOG = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__), "..", "..", "auth-dialog", "nm-gpclient-auth-dialog.py"
+    )
+)
+VPN_SERVICE = "org.freedesktop.NetworkManager.gpclient"
+
+
+@pytest.fixture
+def dialog_module():
+    spec = importlib.util.spec_from_file_location("nm_gpclient_auth_dialog", DIALOG)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeVariant:
+    def __init__(self, signature, value):
+        self.signature = signature
+        self.value = value
+
+    def unpack(self):
+        return self.value
+
+
+class FakeBus:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def call_sync(self, name, path, interface, method, parameters, *_rest):
+        self.calls.append((name, path, interface, method, parameters))
+        return FakeVariant("(ba{ss})", self.reply)
+
+
+@pytest.fixture
+def session_bus(monkeypatch):
+    """Fake gi.repository with a session bus answering Ask() from `state`"""
+    state = {"bus": None}
+
+    def bus_get_sync(bus_type, _cancellable):
+        if state["bus"] is None:
+            raise RuntimeError("Cannot autolaunch D-Bus without X11 $DISPLAY")
+        return state["bus"]
+
+    glib = types.SimpleNamespace(
+        Variant=FakeVariant,
+        VariantType=types.SimpleNamespace(new=lambda signature: signature),
+    )
+    gio = types.SimpleNamespace(
+        BusType=types.SimpleNamespace(SESSION="session"),
+        DBusCallFlags=types.SimpleNamespace(NONE=0),
+        bus_get_sync=bus_get_sync,
+    )
+    repository = types.ModuleType("gi.repository")
+    repository.Gio = gio
+    repository.GLib = glib
+    gi = types.ModuleType("gi")
+    gi.repository = repository
+    monkeypatch.setitem(sys.modules, "gi", gi)
+    monkeypatch.setitem(sys.modules, "gi.repository", repository)
+    return state
+
+
+class TestPromptClient:
+    def test_answer_comes_from_the_service(self, dialog_module, session_bus):
+        session_bus["bus"] = FakeBus((True, {"otp": "123456"}))
+
+        reached, result = dialog_module.ask_prompt_service(
+            "Work VPN", ["otp"], None, {}, {"gateway": "vpn.example.com"}, False
+        )
+
+        assert (reached, result) == (True, {"otp": "123456"})
+        name, path, _interface, method, parameters = session_bus["bus"].calls[0]
+        assert (name, path, method) == (
+            dialog_module.PROMPT_SERVICE_NAME,
+            dialog_module.PROMPT_SERVICE_PATH,
+            "Ask",
+        )
+        assert parameters.signature == "(sassa{ss}a{ss}b)"
+        assert parameters.value == (
+            "Work VPN",
+            ["otp"],
+            "",
+            {},
+            {"gateway": "vpn.example.com"},
+            False,
+        )
+
+    def test_cancel_in_the_service_is_a_cancel(self, dialog_module, session_bus):
+        session_bus["bus"] = FakeBus((False, {}))
+
+        assert dialog_module.ask_prompt_service(
+            "Work VPN", ["password"], None, {}, {}, True
+        ) == (True, None)
+
+    def test_no_session_bus(self, dialog_module, session_bus, capsys):
+        assert dialog_module.ask_prompt_service(
+            "Work VPN", ["otp"], None, {}, {}, False
+        ) == (False, None)
+        assert "asking in-process" in capsys.readouterr().err
+
+    def test_unreachable_service_falls_back_to_gtk(
+        self, dialog_module, monkeypatch, capsys
+    ):
+        asked = []
+        monkeypatch.setattr(
+            dialog_module, "ask_prompt_service", lambda *args: (False, None)
+        )
+        monkeypatch.setattr(
+            dialog_module,
+            "ask_user",
+            lambda *args: asked.append(args) or {"otp": "654321"},
+        )
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["dialog", "-u", "uuid", "-n", "Work VPN", "-s", VPN_SERVICE]
+            + ["-i", "-t", "x-vpn-message:Enter token", "-t", "otp"],
+        )
+        monkeypatch.setattr(sys, "stdin", io.StringIO("DONE\nQUIT\n"))
+
+        assert dialog_module.main() == 0
+        assert asked[0][:3] == ("Work VPN", ["otp"], "Enter token")
+        assert capsys.readouterr().out == "otp\n654321\n\n\n"
+
+
+class FakeDialog:
+    def __init__(self):
+        self.handlers = {}
+        self.destroyed = False
+
+    def connect(self, signal, handler):
+        self.handlers[signal] = handler
+
+    def present(self):
+        pass
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class FakeInvocation:
+    def __init__(self):
+        self.value = None
+        self.error = None
+
+    def return_value(self, value):
+        self.value = value
+
+    def return_dbus_error(self, name, message):
+        self.error = name
+
+
+class FakeGLib:
+    Variant = FakeVariant
+
+    def __init__(self):
+        self.timers = {}
+        self._next = 1
+
+    def timeout_add_seconds(self, seconds, callback):
+        self._next += 1
+        self.timers[self._next] = (seconds, callback)
+        return self._next
+
+    def source_remove(self, source):
+        del self.timers[source]
+
+
+class TestPromptService:
+    def _service(self, dialog_module, monkeypatch):
+        dialogs = []
+
+        def build_dialog(_gtk, *args):
+            dialog = FakeDialog()
+            entry = types.SimpleNamespace(get_text=lambda: "123456")
+            dialogs.append(dialog)
+            return dialog, {"otp": entry}
+
+        monkeypatch.setattr(dialog_module, "build_dialog", build_dialog)
+        gtk = types.SimpleNamespace(
+            ResponseType=types.SimpleNamespace(OK=-5, CANCEL=-6),
+            main_quit=lambda: None,
+        )
+        glib = FakeGLib()
+        return dialog_module.PromptService(gtk, glib), glib, dialogs
+
+    def _ask(self, service, invocation):
+        parameters = FakeVariant(
+            "(sassa{ss}a{ss}b)", ("Work VPN", ["otp"], "Token", {}, {}, False)
+        )
+        service.on_method_call(
+            None, ":1.5", "/", "iface", "Ask", parameters, invocation
+        )
+
+    def test_answer_and_idle_exit(self, dialog_module, monkeypatch):
+        service, glib, dialogs = self._service(dialog_module, monkeypatch)
+        service.arm_idle_exit()
+        assert len(glib.timers) == 1
+
+        invocation = FakeInvocation()
+        self._ask(service, invocation)
+        # No idle exit while a prompt is on screen
+        assert glib.timers == {}
+        dialogs[0].handlers["response"](dialogs[0], -5)
+
+        assert invocation.value.signature == "(ba{ss})"
+        assert invocation.value.value == (True, {"otp": "123456"})
+        assert dialogs[0].destroyed
+        assert [seconds for seconds, _ in glib.timers.values()] == [
+            dialog_module.PROMPT_SERVICE_IDLE_EXIT
+        ]
+
+    def test_concurrent_prompts_and_cancel(self, dialog_module, monkeypatch):
+        service, glib, dialogs = self._service(dialog_module, monkeypatch)
+        first, second = FakeInvocation(), FakeInvocation()
+        self._ask(service, first)
+        self._ask(service, second)
+
+        dialogs[0].handlers["response"](dialogs[0], -6)
+        assert first.value.value == (False, {})
+        assert glib.timers == {}
+
+        dialogs[1].handlers["response"](dialogs[1], -5)
+        assert second.value.value == (True, {"otp": "123456"})
+        assert len(glib.timers) == 1
+
+    def test_unknown_method(self, dialog_module, monkeypatch):
+        service, _glib, _dialogs = self._service(dialog_module, monkeypatch)
+        invocation = FakeInvocation()
+        service.on_method_call(None, ":1.5", "/", "iface", "Frob", None, invocation)
+
+        assert invocation.error == "org.freedesktop.DBus.Error.UnknownMethod"
@@ -0,0 +1,163 @@
+"""
+Tests for PtyReader: gpclient's output read into one reusable buffer and
+decoded incrementally by AnsiTokenizer, so a character split between two reads
+- the ↑↓ of inquire's Select help line - survives instead of becoming U+FFFD.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import pty
+import sys
+
+HELP_LINE = "[↑↓ to move, enter to select, type to filter]"
+
+# Writes the Select frame in two parts, cut in the middle of the "↑"
+FAKE_GPCLIENT = r'''
+import os, sys, time, tty
+
+tty.setraw(0)
+frame = (
+    "? Which gateway do you want to connect to?\r\n"
+    "> gw-warsaw (gw1.example.com)\r\n"
+    "  gw-frankfurt (gw2.example.com)\r\n"
+    "%s\r\n" % sys.argv[1]
+).encode()
+cut = frame.index("↑".encode()) + 1
+os.write(1, frame[:cut])
+time.sleep(0.2)
+os.write(1, frame[cut:])
+time.sleep(0.2)
+'''
+
+# Several lines written one by one, then gone at once - gpclient failing early
+QUICK_EXIT = "; ".join(f"printf 'line {n} of the output\\r\\n'" for n in range(8))
+
+
+async def _read_all(service_module, reader, parts):
+    """Write `parts` one by one, each read back before the next is written"""
+    tokenizer = service_module.AnsiTokenizer()
+    text = []
+    for part in parts:
+        os.write(reader.write_fd, part)
+        chunk = await reader.read()
+        text.append("".join(tokenizer.feed(chunk)))
+    return text
+
+
+def _pipe_reader(service_module):
+    read_fd, write_fd = os.pipe()
+    reader = service_module.PtyReader(read_fd)
+    reader.write_fd = write_fd
+    return reader
+
+
+class TestPtyReader:
+    def test_split_character_is_decoded_whole(self, service_module):
+        reader = _pipe_reader(service_module)
+        encoded = HELP_LINE.encode()
+        try:
+            text = asyncio.run(
+                _read_all(service_module, reader, [encoded[:2], encoded[2:]])
+            )
+        finally:
+            reader.close()
+            os.close(reader.write_fd)
+
+        assert text[0] == "["
+        assert "".join(text) == HELP_LINE
+
+    def test_reads_reuse_one_buffer(self, service_module):
+        reader = _pipe_reader(service_module)
+
+        async def two_reads():
+            os.write(reader.write_fd, b"first")
+            first = await reader.read()
+            assert bytes(first) == b"first"
+            os.write(reader.write_fd, b"second")
+            second = await reader.read()
+            return first, second
+
+        try:
+            first, second = asyncio.run(two_reads())
+        finally:
+            reader.close()
+            os.close(reader.write_fd)
+
+        assert first.obj is second.obj
+        assert bytes(second) == b"second"
+
+    def test_eof_flushes_a_truncated_character(self, service_module):
+        reader = _pipe_reader(service_module)
+
+        async def until_eof():
+            tokenizer = service_module.AnsiTokenizer()
+            os.write(reader.write_fd, "↑".encode()[:2])
+            os.close(reader.write_fd)
+            tokens = tokenizer.feed(await reader.read())
+            assert await reader.read() is None
+            return tokens + tokenizer.feed(b"", final=True)
+
+        try:
+            assert asyncio.run(until_eof()) == ["�"]
+        finally:
+            reader.close()
+
+
+class TestMonitorOverPty:
+    def test_select_frame_split_mid_character(self, service_module, tmp_path):
+        fake = tmp_path / "fake-gpclient.py"
+        fake.write_text(FAKE_GPCLIENT)
+
+        async def run():
+            plugin = service_module.GpclientVPNPlugin()
+            master, slave = pty.openpty()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                str(fake),
+                HELP_LINE,
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+            )
+            os.close(slave)
+            plugin._pty_master = master
+            plugin.gpclient_process = process
+
+            monitor = asyncio.create_task(plugin._monitor_gpclient_output())
+            try:
+                await asyncio.wait_for(process.wait(), timeout=20)
+                await asyncio.wait_for(monitor, timeout=10)
+            finally:
+                if not monitor.done():
+                    monitor.cancel()
+                if plugin._prompt_task and not plugin._prompt_task.done():
+                    plugin._prompt_task.cancel()
+            return plugin
+
+        plugin = asyncio.run(run())
+
+        assert HELP_LINE in plugin._output_ring
+        assert not any("�" in line for line in plugin._output_ring)
+
+    def test_output_before_a_quick_exit_is_all_read(self, service_module):
+        expected = [f"line {n} of the output" for n in range(8)]
+
+        async def run():
+            plugin = service_module.GpclientVPNPlugin()
+            master, slave = pty.openpty()
+            process = await asyncio.create_subprocess_exec(
+                "/bin/sh", "-c", QUICK_EXIT, stdin=slave, stdout=slave, stderr=slave
+            )
+            os.close(slave)
+            plugin._pty_master = master
+            plugin.gpclient_process = process
+            await asyncio.wait_for(plugin._monitor_gpclient_output(), timeout=10)
+            if plugin._prompt_task and not plugin._prompt_task.done():
+                plugin._prompt_task.cancel()
+            return list(plugin._output_ring)
+
+        # The race with the exit does not show every time
+        for _ in range(20):
+            assert asyncio.run(run()) == expected
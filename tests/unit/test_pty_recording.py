@@ -0,0 +1,235 @@
+"""
+Tests for recording gpclient PTY sessions (GPCLIENT_RECORD) and replaying them
+through the service with tests/replay/gpclient-replay.py.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import json
+import os
+import pty
+import stat
+import sys
+from pathlib import Path
+
+REPLAY = Path(__file__).resolve().parents[1] / "replay" / "gpclient-replay.py"
+
+FAKE_CREDENTIALS_GPCLIENT = r'''
+import os, sys, tty
+
+
+def read_answer():
+    value = b""
+    while True:
+        chunk = os.read(0, 16)
+        if not chunk:
+            break
+        for byte in chunk:
+            if byte in (13, 10):
+                return value.decode()
+            value += bytes([byte])
+    return value.decode()
+
+
+def ask(label, secret):
+    sys.stdout.write("? %s: " % label)
+    sys.stdout.flush()
+    value = read_answer()
+    shown = "*" * len(value) if secret else value
+    sys.stdout.write("\r? %s: %s\r\n" % (label, shown))
+    sys.stdout.flush()
+    return value
+
+
+tty.setraw(0)
+sys.stdout.write("[INFO  gpclient::cli] gpclient started: fake\r\n")
+sys.stdout.write("Please enter the login credentials (Portal: vpn.example.com)\r\n")
+sys.stdout.flush()
+
+user = ask("Username", False)
+password = ask("Password", True)
+# A careless server echoing the secret back must not leak it into a recording
+sys.stdout.write("[DEBUG gpclient] login for %s with %s\r\n" % (user, password))
+
+if user == "jdoe" and password == "s3cret":
+    sys.stdout.write(
+        "[INFO  gpclient::connect] Connecting to the only available gateway: "
+        "gw-a (a.example.com)\r\n"
+    )
+else:
+    sys.stdout.write("Authentication failure\r\n")
+sys.stdout.flush()
+sys.exit(0)
+'''
+
+
+def _load_cast(path):
+    with open(path) as handle:
+        header = json.loads(handle.readline())
+        return header, [json.loads(line) for line in handle]
+
+
+async def _drive(plugin, argv):
+    """Run `argv` on a PTY and let the service's monitor talk to it"""
+    master, slave = pty.openpty()
+    process = await asyncio.create_subprocess_exec(
+        *argv, stdin=slave, stdout=slave, stderr=slave
+    )
+    os.close(slave)
+    plugin._pty_master = master
+    plugin.gpclient_process = process
+
+    monitor = asyncio.create_task(plugin._monitor_gpclient_output())
+    try:
+        await asyncio.wait_for(process.wait(), timeout=20)
+        await asyncio.wait_for(monitor, timeout=10)
+    finally:
+        if not monitor.done():
+            monitor.cancel()
+        if plugin._prompt_task and not plugin._prompt_task.done():
+            plugin._prompt_task.cancel()
+    return process.returncode
+
+
+def _plugin(service_module, username="jdoe", password="s3cret"):
+    plugin = service_module.GpclientVPNPlugin()
+    plugin.vpn_username = username
+    plugin.vpn_password = password
+    plugin._reset_phase_state()
+    return plugin
+
+
+def _record(service_module, tmp_path):
+    fake = tmp_path / "fake-gpclient.py"
+    fake.write_text(FAKE_CREDENTIALS_GPCLIENT)
+    target = tmp_path / "session.cast"
+
+    plugin = _plugin(service_module)
+    plugin._recorder = service_module.PtyRecorder(str(target))
+    assert plugin._recorder.start("gpclient connect vpn.example.com") == str(target)
+    asyncio.run(_drive(plugin, [sys.executable, str(fake)]))
+    return target
+
+
+class TestPtyRecorder:
+    def test_session_is_recorded_with_secrets_redacted(
+        self, service_module, tmp_path
+    ):
+        target = _record(service_module, tmp_path)
+
+        header, events = _load_cast(target)
+        assert header["version"] == 2
+        assert (header["width"], header["height"]) == (
+            service_module.PTY_COLUMNS,
+            service_module.PTY_ROWS,
+        )
+        output = "".join(data for _, kind, data in events if kind == "o")
+        assert "Please enter the login credentials" in output
+        assert [data for _, kind, data in events if kind == "i"] == [
+            "jdoe\r",
+            "<redacted>\r",
+        ]
+        assert "login for jdoe with <redacted>" in output
+        assert "s3cret" not in target.read_text()
+        assert events[-1][1:] == ["m", "exit 0"]
+        times = [event[0] for event in events]
+        assert times == sorted(times)
+
+    def test_bytes_survive_a_split_character(self, service_module, tmp_path):
+        target = tmp_path / "split.cast"
+        recorder = service_module.PtyRecorder(str(target))
+        recorder.start("split")
+        # "↑" is e2 86 91 - a read can end in the middle of it
+        recorder.output(b"[\xe2\x86")
+        recorder.output(b"\x91 to move]\xff")
+        recorder.stop()
+
+        _, events = _load_cast(target)
+        replayed = b"".join(
+            data.encode("utf-8", errors="surrogateescape") for _, _, data in events
+        )
+        assert replayed == "[↑ to move]".encode() + b"\xff"
+
+    def test_secret_split_across_reads_is_redacted(self, service_module, tmp_path):
+        target = tmp_path / "split-secret.cast"
+        recorder = service_module.PtyRecorder(str(target))
+        recorder.start("split")
+        recorder.add_secret("s3cret")
+        recorder.output(b"login with s3")
+        recorder.output(b"c")
+        recorder.output(b"ret done, s")
+        recorder.output(b"ee you\r\n")
+        recorder.output(b"last s")
+        recorder.stop()
+
+        _, events = _load_cast(target)
+        output = "".join(data for _, kind, data in events if kind == "o")
+        assert output == "login with <redacted> done, see you\r\nlast s"
+        assert "s3" not in target.read_text()
+
+    def test_recording_is_private(self, service_module, tmp_path):
+        target = tmp_path / "session.cast"
+        target.write_text("an older recording")
+        target.chmod(0o644)
+        recorder = service_module.PtyRecorder(str(target))
+
+        recorder.start("gpclient")
+        recorder.stop()
+
+        assert stat.S_IMODE(target.stat().st_mode) == 0o600
+
+    def test_disabled_recorder_writes_nothing(self, service_module, tmp_path):
+        recorder = service_module.PtyRecorder("")
+
+        assert recorder.start("gpclient") is None
+        recorder.output(b"hello")
+        recorder.input(b"jdoe\r")
+        assert not recorder.recording
+        assert list(tmp_path.iterdir()) == []
+
+    def test_enable_recording_over_dbus(self, service_module, tmp_path):
+        plugin = service_module.GpclientVPNPlugin()
+
+        asyncio.run(plugin.EnableRecording(str(tmp_path)))
+        assert plugin._recorder.enabled
+        path = plugin._recorder.start("gpclient", "uuid-1")
+        assert os.path.dirname(path) == str(tmp_path)
+        assert os.path.basename(path).startswith("gpclient-uuid-1-")
+
+        asyncio.run(plugin.DisableRecording())
+        assert not plugin._recorder.enabled
+        assert not plugin._recorder.recording
+
+
+class TestReplay:
+    def test_recording_replays_through_the_prompt_logic(
+        self, service_module, tmp_path
+    ):
+        target = _record(service_module, tmp_path)
+        plugin = _plugin(service_module)
+
+        returncode = asyncio.run(
+            _drive(
+                plugin,
+                [sys.executable, str(REPLAY), "--speed", "0", str(target)],
+            )
+        )
+
+        assert returncode == 0
+        lines = list(plugin._recent_lines)
+        assert any("Connecting to the only available gateway" in line for line in lines)
+        assert plugin._gateway_list == ["gw-a (a.example.com)"]
+
+    def test_different_answer_is_reported(self, service_module, tmp_path):
+        target = _record(service_module, tmp_path)
+        plugin = _plugin(service_module, username="alice")
+
+        returncode = asyncio.run(
+            _drive(
+                plugin,
+                [sys.executable, str(REPLAY), "--speed", "0", str(target)],
+            )
+        )
+
+        assert returncode == 3
@@ -0,0 +1,237 @@
+"""
+Tests for route compaction and hand-over: compact_routes() in the service and
+the awk stage in config/90-gpclient-routing agree on the smallest CIDR set, the
+never-default / ignore-auto-routes policy is applied once, and the split-include
+routes reach NetworkManager in Ip4Config instead of being installed by
+vpnc-script.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import importlib.util
+import socket
+import struct
+import subprocess
+from pathlib import Path
+
+BENCH_PATH = Path(__file__).resolve().parents[1] / "bench" / "bench_routes.py"
+
+
+def _bench():
+    spec = importlib.util.spec_from_file_location("bench_routes", BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _hook(routes, never_default=False, ignore_auto=False, excluded=()):
+    """Source the hook; return (included, excluded) as vpnc-script sees them"""
+    bench = _bench()
+    env = bench.hook_environment(routes, never_default)
+    env["GPCLIENT_NM_IGNORE_AUTO_ROUTES"] = "1" if ignore_auto else "0"
+    exclude_env = bench.hook_environment(excluded, False)
+    env.update(
+        {
+            key.replace("_INC", "_EXC"): value
+            for key, value in exclude_env.items()
+            if key.startswith("CISCO_SPLIT_INC")
+        }
+    )
+    script = f""". "{bench.HOOK}"
+for kind in INC EXC; do
+  eval "_n=\\$CISCO_SPLIT_$kind"
+  _i=0
+  while [ "$_i" -lt "$_n" ]; do
+    eval "echo $kind \\$CISCO_SPLIT_${{kind}}_${{_i}}_ADDR/\\$CISCO_SPLIT_${{kind}}_${{_i}}_MASKLEN \\$CISCO_SPLIT_${{kind}}_${{_i}}_MASK"
+    _i=$((_i+1))
+  done
+done
+"""
+    result = subprocess.run(
+        ["sh", "-c", script], env=env, capture_output=True, text=True, check=True
+    )
+    found = {"INC": [], "EXC": []}
+    for line in result.stdout.splitlines():
+        kind, cidr, mask = line.split()
+        found[kind].append((cidr, mask))
+    return found["INC"], found["EXC"]
+
+
+class TestCompactRoutes:
+    def test_adjacent_and_subsumed_routes_merge(self, service_module):
+        routes = [
+            ("10.0.1.0", 24),
+            ("10.0.0.0", 24),
+            ("10.0.0.77", 32),
+            ("10.0.2.0", 24),
+            ("10.0.1.0", 24),
+            ("192.168.5.3", 25),
+        ]
+
+        assert service_module.compact_routes(routes) == [
+            ("10.0.0.0", 23),
+            ("10.0.2.0", 24),
+            ("192.168.5.0", 25),
+        ]
+
+    def test_never_default_drops_the_default_route(self, service_module):
+        routes = [("0.0.0.0", 0), ("10.0.0.0", 8)]
+
+        assert service_module.compact_routes(routes) == [("0.0.0.0", 0)]
+        assert service_module.compact_routes(routes, never_default=True) == [
+            ("10.0.0.0", 8)
+        ]
+
+    def test_invalid_route_is_skipped(self, service_module):
+        routes = [("10.0.0.0", 33), ("not-an-address", 24), ("172.16.0.0", 12)]
+
+        assert service_module.compact_routes(routes) == [("172.16.0.0", 12)]
+
+
+class TestRoutingHookCompaction:
+    def test_hook_merges_and_drops_default(self):
+        routes = [
+            ("10.0.1.0", 24),
+            ("10.0.0.0", 24),
+            ("0.0.0.0", 0),
+            ("10.0.0.77", 32),
+            ("255.255.255.255", 32),
+        ]
+
+        included, _ = _hook(routes, never_default=True)
+
+        assert included == [
+            ("10.0.0.0/23", "255.255.254.0"),
+            ("255.255.255.255/32", "255.255.255.255"),
+        ]
+
+    def test_excluded_routes_are_compacted_too(self):
+        _, excluded = _hook([], excluded=[("192.0.2.0", 25), ("192.0.2.128", 25)])
+
+        assert excluded == [("192.0.2.0/24", "255.255.255.0")]
+
+    def test_ignore_auto_routes_disables_split_routing(self):
+        included, excluded = _hook(
+            [("10.0.0.0", 8)], ignore_auto=True, excluded=[("10.1.0.0", 16)]
+        )
+
+        assert included == [] and excluded == []
+
+    def test_hook_agrees_with_the_service(self, service_module):
+        bench = _bench()
+        routes = bench.synthetic_routes(1500)
+
+        installed, _ = bench.run_hook(routes, never_default=True)
+
+        expected = service_module.compact_routes(routes, never_default=True)
+        assert sorted(installed) == sorted(f"{a}/{p}" for a, p in expected)
+        assert len(installed) < len(routes) / 2
+
+
+
+def _u32(address):
+    return struct.unpack("<I", socket.inet_aton(address))[0]
+
+
+class TestSplitRoutesToNetworkManager:
+    def _handover(self, tmp_path, routes, **flags):
+        bench = _bench()
+        env = bench.hook_environment(routes, flags.get("never_default", False))
+        env["GPCLIENT_NM_PUSHED_CONFIG"] = str(tmp_path / "pushed")
+        env["INTERNAL_IP4_DNS"] = "10.0.0.53"
+        if not routes:
+            del env["CISCO_SPLIT_INC"]
+        script = f'. "{bench.HOOK}"\necho "${{CISCO_SPLIT_INC-<unset>}}"\n'
+        result = subprocess.run(
+            ["sh", "-c", script], env=env, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip(), (tmp_path / "pushed").read_text()
+
+    def test_hook_hands_compacted_routes_over(self, tmp_path):
+        left, pushed = self._handover(
+            tmp_path, [("10.0.0.0", 24), ("10.0.1.0", 24), ("172.16.0.0", 12)]
+        )
+
+        assert left == "0"
+        assert "SPLIT_INC_ROUTES=10.0.0.0/23 172.16.0.0/12\n" in pushed
+
+    def test_full_tunnel_leaves_the_default_route_to_networkmanager(self, tmp_path):
+        left, pushed = self._handover(tmp_path, [])
+
+        # "0", not unset: vpnc-script would add a default route otherwise
+        assert left == "0"
+        assert "SPLIT_INC_ROUTES=\n" in pushed
+
+    def _emit(self, service_module, monkeypatch, tmp_path, pushed, **attributes):
+        (tmp_path / "gpd0").mkdir()
+        monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(tmp_path))
+        path = tmp_path / "pushed"
+        path.write_text("".join(f"{key}={value}\n" for key, value in pushed.items()))
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._pushed_config_path = str(path)
+        for name, value in attributes.items():
+            setattr(plugin, name, value)
+
+        async def addresses(iface):
+            return ("10.1.2.3", 32), None
+
+        plugin._get_iface_addresses = addresses
+        asyncio.run(plugin._check_tunnel_loop())
+
+    def test_pushed_and_custom_routes_in_ip4config(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        pushed = {
+            "INTERNAL_IP4_DNS": "192.168.100.53",
+            "SPLIT_INC_ROUTES": "10.0.0.0/23 172.16.0.0/12",
+        }
+        self._emit(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            pushed,
+            custom_routes=[("10.0.2.0", 23), ("172.16.5.0", 24)],
+        )
+
+        config = next(p for name, p in dbus_signals if name == "Ip4Config")
+        assert config["routes"] == (
+            "a(uuuu)",
+            [
+                (_u32("10.0.0.0"), 22, 0, 0),
+                (_u32("172.16.0.0"), 12, 0, 0),
+                (_u32("192.168.100.53"), 32, 0, 0),
+            ],
+        )
+        # The same encoding for every address in the dict
+        assert config["address"] == ("u", _u32("10.1.2.3"))
+        assert config["gateway"] == ("u", _u32("10.1.2.3"))
+
+    def test_ignore_auto_routes_keeps_only_custom_routes(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        pushed = {"INTERNAL_IP4_DNS": "10.0.0.53", "SPLIT_INC_ROUTES": "10.0.0.0/8"}
+        self._emit(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            pushed,
+            ignore_auto_routes=True,
+            custom_routes=[("192.0.2.0", 24)],
+        )
+
+        config = next(p for name, p in dbus_signals if name == "Ip4Config")
+        assert config["routes"] == ("a(uuuu)", [(_u32("192.0.2.0"), 24, 0, 0)])
+
+    def test_full_tunnel_sends_no_routes(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        self._emit(
+            service_module,
+            monkeypatch,
+            tmp_path,
+            {"INTERNAL_IP4_DNS": "10.0.0.53", "SPLIT_INC_ROUTES": ""},
+        )
+
+        config = next(p for name, p in dbus_signals if name == "Ip4Config")
+        assert "routes" not in config
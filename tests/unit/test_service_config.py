@@ -0,0 +1,155 @@
+"""
+Tests for the service configuration: /etc/nm-gpclient/service.conf and its
+drop-ins replace the tunable constants, invalid values keep the default, and a
+reload (SIGHUP) undoes what the files no longer set.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import re
+import signal
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def config_path(service_module, monkeypatch, tmp_path):
+    """A config file path; the tunables get their values back afterwards"""
+    for constant, *_ in service_module.SERVICE_TUNABLES.values():
+        monkeypatch.setattr(service_module, constant, getattr(service_module, constant))
+    return tmp_path / "service.conf"
+
+
+def _dropin(config_path, name, text):
+    directory = config_path.parent / "service.conf.d"
+    directory.mkdir(exist_ok=True)
+    (directory / name).write_text(text)
+
+
+class TestApply:
+    def test_no_files_keeps_the_defaults(self, service_module, config_path):
+        assert service_module.apply_service_config(str(config_path)) == []
+        assert service_module.PROMPT_DEBOUNCE_SECONDS == 0.5
+
+    def test_dropins_override_in_name_order(self, service_module, config_path):
+        config_path.write_text(
+            "[service]\nprompt-debounce = 0.3\nselect-max-steps = 50\n"
+        )
+        _dropin(config_path, "20-site.conf", "[service]\nprompt-debounce = 0.2\n")
+        _dropin(config_path, "10-vendor.conf", "[service]\nprompt-debounce = 0.1\n")
+        _dropin(config_path, "30-notes.txt", "[service]\nprompt-debounce = 4\n")
+
+        changed = service_module.apply_service_config(str(config_path))
+
+        assert changed == ["prompt-debounce", "select-max-steps"]
+        assert service_module.PROMPT_DEBOUNCE_SECONDS == 0.2
+        assert service_module.SELECT_MAX_STEPS == 50
+
+    def test_session_leader_processes(self, service_module, config_path):
+        config_path.write_text(
+            "[service]\nsession-leader-processes = gnome-shell,\n  sway systemd\n"
+        )
+        service_module.apply_service_config(str(config_path))
+
+        assert service_module.SESSION_LEADER_PROCESSES == (
+            "gnome-shell",
+            "sway",
+            "systemd",
+        )
+        assert service_module.service_tunables()["session-leader-processes"] == (
+            "gnome-shell, sway, systemd"
+        )
+
+    def test_invalid_values_keep_the_default(self, service_module, config_path, caplog):
+        config_path.write_text(
+            "[service]\n"
+            "secrets-request-timeout = 1\n"
+            "select-max-steps = 2.5\n"
+            "session-leader-processes = gnome-shell; rm -rf\n"
+            "tunnel-poll-interval = 0.25\n"
+            "prompt-debounce = 30s\n"
+            "kill-timeout = 1\n"
+            "[network]\nmtu = 1300\n"
+        )
+
+        assert service_module.apply_service_config(str(config_path)) == [
+            "tunnel-poll-interval"
+        ]
+        assert service_module.SECRETS_REQUEST_TIMEOUT == 300
+        assert service_module.SELECT_MAX_STEPS == 200
+        assert service_module.SESSION_LEADER_PROCESSES[0] == "gnome-shell"
+        assert service_module.SESSION_LEADER_PROCESSES[-1] == "systemd"
+        for text in (
+            "invalid secrets-request-timeout",
+            "invalid select-max-steps",
+            "invalid session-leader-processes",
+            "invalid prompt-debounce",
+            "unknown section [network]",
+            "unknown setting kill-timeout",
+        ):
+            assert text in caplog.text
+
+    def test_unreadable_file_is_skipped(self, service_module, config_path, caplog):
+        config_path.write_text("prompt-debounce = 0.3\n")
+        _dropin(config_path, "10.conf", "[service]\nselect-max-steps = 10\n")
+
+        assert service_module.apply_service_config(str(config_path)) == [
+            "select-max-steps"
+        ]
+        assert f"Ignoring {config_path}" in caplog.text
+
+    def test_reload_reverts_removed_settings(self, service_module, config_path):
+        config_path.write_text(
+            "[service]\nprompt-debounce = 0.3\nselect-max-steps = 50\n"
+        )
+        service_module.apply_service_config(str(config_path))
+
+        config_path.write_text("[service]\nselect-max-steps = 50\n")
+
+        assert service_module.apply_service_config(str(config_path)) == [
+            "prompt-debounce"
+        ]
+        assert service_module.PROMPT_DEBOUNCE_SECONDS == 0.5
+
+    def test_sighup_reloads(self, service_module, config_path):
+        async def run():
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(
+                signal.SIGHUP, service_module.apply_service_config, str(config_path)
+            )
+            try:
+                config_path.write_text("[service]\ntunnel-poll-interval = 2\n")
+                os.kill(os.getpid(), signal.SIGHUP)
+                await asyncio.sleep(0.1)
+            finally:
+                loop.remove_signal_handler(signal.SIGHUP)
+
+        asyncio.run(run())
+
+        assert service_module.TUNNEL_POLL_INTERVAL == 2
+
+
+class TestTunables:
+    def test_property_shows_what_is_in_effect(self, service_module, config_path):
+        config_path.write_text("[service]\nselect-redraw-timeout = 3\n")
+        service_module.apply_service_config(str(config_path))
+
+        tunables = service_module.GpclientVPNPlugin().Tunables()
+
+        assert set(tunables) == set(service_module.SERVICE_TUNABLES)
+        assert tunables["select-redraw-timeout"] == "3"
+        assert tunables["prompt-debounce"] == "0.5"
+
+    def test_shipped_template_lists_the_defaults(self, service_module, config_path):
+        with open(os.path.join(ROOT, "config", "service.conf")) as handle:
+            template = handle.read()
+        # Every setting, commented out with its default value
+        settings = dict(re.findall(r"^#([a-z-]+) = (.*)$", template, re.MULTILINE))
+
+        assert settings == service_module.service_tunables()
+        config_path.write_text(re.sub(r"^#([a-z-]+ =)", r"\1", template, flags=re.M))
+        assert service_module.apply_service_config(str(config_path)) == []
@@ -0,0 +1,159 @@
+"""
+Tests for split DNS: the vpnc hook hands the pushed DNS configuration to the
+service, which reports servers and (routing-only) domains in Ip4Config.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import subprocess
+from pathlib import Path
+
+HOOK = Path(__file__).resolve().parents[2] / "config" / "90-gpclient-routing"
+
+PUSHED_ENV = {
+    "reason": "connect",
+    "VPNGATEWAY": "198.51.100.7",
+    "TUNDEV": "gpd0",
+    "INTERNAL_IP4_DNS": "10.0.0.53 10.0.1.53",
+    "CISCO_DEF_DOMAIN": "corp.example.com",
+    "CISCO_SPLIT_DNS": "corp.example.com,lab.example.net",
+}
+
+
+def _source_hook(extra_env):
+    """Source the hook like vpnc-script does; return the variables it leaves"""
+    script = (
+        f'. "{HOOK}"\n'
+        'echo "INTERNAL_IP4_DNS=${INTERNAL_IP4_DNS-<unset>}"\n'
+        'echo "CISCO_DEF_DOMAIN=${CISCO_DEF_DOMAIN-<unset>}"\n'
+        'echo "CISCO_SPLIT_DNS=${CISCO_SPLIT_DNS-<unset>}"\n'
+    )
+    env = {"PATH": os.environ["PATH"], **PUSHED_ENV, **extra_env}
+    result = subprocess.run(
+        ["sh", "-c", script], env=env, capture_output=True, text=True, check=True
+    )
+    return dict(line.split("=", 1) for line in result.stdout.splitlines())
+
+
+def _u32(address, order):
+    return struct.unpack(order, socket.inet_aton(address))[0]
+
+
+class TestDnsSearchDomains:
+    def test_pushed_and_profile_domains(self, service_module):
+        pushed = {
+            "CISCO_DEF_DOMAIN": "corp.example.com",
+            "CISCO_SPLIT_DNS": "corp.example.com,lab.example.net",
+        }
+
+        domains = service_module.dns_search_domains(
+            pushed, ["extra.example.org", "~internal.example"]
+        )
+
+        assert domains == [
+            "corp.example.com",
+            "extra.example.org",
+            "~lab.example.net",
+            "~internal.example",
+        ]
+
+    def test_nothing_pushed_nothing_configured(self, service_module):
+        assert service_module.dns_search_domains({}, []) == []
+
+    def test_trailing_dots_and_duplicates(self, service_module):
+        pushed = {"CISCO_SPLIT_DNS": "a.example. a.example"}
+
+        assert service_module.dns_search_domains(pushed, ["~a.example"]) == [
+            "~a.example"
+        ]
+
+
+class TestRoutingHook:
+    def test_pushed_dns_is_handed_over(self, tmp_path):
+        target = tmp_path / "pushed"
+
+        left = _source_hook({"GPCLIENT_NM_PUSHED_CONFIG": str(target)})
+
+        assert left == {
+            "INTERNAL_IP4_DNS": "<unset>",
+            "CISCO_DEF_DOMAIN": "<unset>",
+            "CISCO_SPLIT_DNS": "<unset>",
+        }
+        saved = dict(line.split("=", 1) for line in target.read_text().splitlines())
+        assert saved["INTERNAL_IP4_DNS"] == "10.0.0.53 10.0.1.53"
+        assert saved["CISCO_SPLIT_DNS"] == "corp.example.com,lab.example.net"
+        assert saved["VPNGATEWAY"] == "198.51.100.7"
+
+    def test_without_the_service_vpnc_script_keeps_dns(self):
+        left = _source_hook({})
+
+        assert left["INTERNAL_IP4_DNS"] == "10.0.0.53 10.0.1.53"
+        assert left["CISCO_DEF_DOMAIN"] == "corp.example.com"
+
+    def test_unwritable_file_keeps_dns_with_vpnc_script(self, tmp_path):
+        left = _source_hook(
+            {"GPCLIENT_NM_PUSHED_CONFIG": str(tmp_path / "missing" / "pushed")}
+        )
+
+        assert left["INTERNAL_IP4_DNS"] == "10.0.0.53 10.0.1.53"
+
+
+class TestIp4ConfigDns:
+    def _emit(self, service_module, monkeypatch, tmp_path, **attributes):
+        (tmp_path / "gpd0").mkdir()
+        monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(tmp_path))
+        pushed = tmp_path / "pushed"
+        pushed.write_text(
+            "".join(f"{key}={value}\n" for key, value in PUSHED_ENV.items())
+        )
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._pushed_config_path = str(pushed)
+        for name, value in attributes.items():
+            setattr(plugin, name, value)
+
+        async def addresses(iface):
+            return ("10.1.2.3", 32), None
+
+        plugin._get_iface_addresses = addresses
+        asyncio.run(plugin._check_tunnel_loop())
+        return plugin
+
+    def test_pushed_servers_and_domains(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        self._emit(
+            service_module, monkeypatch, tmp_path, dns_domains=["~internal.example"]
+        )
+
+        config = next(p for name, p in dbus_signals if name == "Ip4Config")
+        assert config["dns"] == (
+            "au",
+            [_u32("10.0.0.53", "<I"), _u32("10.0.1.53", "<I")],
+        )
+        assert config["domains"] == (
+            "as",
+            ["corp.example.com", "~lab.example.net", "~internal.example"],
+        )
+
+    def test_profile_servers_override_pushed_ones(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        self._emit(service_module, monkeypatch, tmp_path, dns_servers=["192.0.2.1"])
+
+        config = next(p for name, p in dbus_signals if name == "Ip4Config")
+        assert config["dns"] == ("au", [_u32("192.0.2.1", "<I")])
+
+    def test_pushed_file_is_removed_on_disconnect(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", "/nonexistent")
+        plugin = self._emit(service_module, monkeypatch, tmp_path)
+
+        asyncio.run(plugin.Disconnect())
+
+        assert not (tmp_path / "pushed").exists()
+        assert plugin._pushed_config_path is None
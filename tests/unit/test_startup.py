@@ -0,0 +1,131 @@
+"""
+Tests for the service's start-up path: what importing it loads, measured with
+`python3 -X importtime` in a fresh interpreter, and the launcher that imports
+it as an installed module.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "service"))
+
+# Just enough of sdbus for the service module to import
+SDBUS_STUB = """
+class DbusInterfaceCommonAsync:
+    def __init_subclass__(cls, **kwargs):
+        pass
+
+
+def _decorator_factory(*args, **kwargs):
+    def decorator(func):
+        return func
+    return decorator
+
+
+dbus_method_async = dbus_property_async = dbus_signal_async = _decorator_factory
+request_default_bus_name_async = sd_bus_open_system = set_default_bus = None
+"""
+
+# Only needed once a connection or an auth prompt needs them
+LAZY_MODULES = ("ipaddress", "pathlib", "pty", "shutil", "termios")
+
+# Modules the service may load beyond asyncio's own (json and its parts today)
+MAX_EXTRA_MODULES = 10
+
+# Importing the service from bytecode takes about 1 ms; compiling the source on
+# every start costs ~16 ms. How long it takes is for tests/bench/bench_startup.py
+
+
+@pytest.fixture(scope="module")
+def module_dir(tmp_path_factory):
+    """The service installed as a byte-compiled module, next to an sdbus stub"""
+    directory = tmp_path_factory.mktemp("nm-gpclient")
+    module = directory / "nm_gpclient_service.py"
+    shutil.copy(os.path.join(SERVICE_DIR, "nm-gpclient-service.py"), module)
+    py_compile.compile(str(module), doraise=True)
+    (directory / "sdbus.py").write_text(SDBUS_STUB)
+    py_compile.compile(str(directory / "sdbus.py"), doraise=True)
+    return directory
+
+
+def _imports(module_dir, statement):
+    """{module: (self us, cumulative us)} for a fresh interpreter running statement"""
+    env = dict(os.environ, PYTHONPATH=str(module_dir))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        env=env,
+        text=True,
+        timeout=60,
+        check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        imports[name.strip()] = (int(own), int(cumulative))
+    return imports
+
+
+@pytest.fixture(scope="module")
+def profile(module_dir):
+    baseline = _imports(module_dir, "import sdbus, asyncio")
+    service = _imports(module_dir, "import nm_gpclient_service")
+    return baseline, service
+
+
+class TestImportProfile:
+    def test_lazy_modules_are_not_imported(self, profile):
+        _baseline, service = profile
+        assert "nm_gpclient_service" in service
+        assert [name for name in LAZY_MODULES if name in service] == []
+
+    def test_few_modules_beyond_asyncio(self, profile):
+        baseline, service = profile
+        extra = set(service) - set(baseline) - {"nm_gpclient_service"}
+        assert len(extra) <= MAX_EXTRA_MODULES, sorted(extra)
+
+    def test_imported_from_bytecode(self, module_dir):
+        result = subprocess.run(
+            [sys.executable, "-v", "-c", "import nm_gpclient_service"],
+            capture_output=True,
+            env=dict(os.environ, PYTHONPATH=str(module_dir)),
+            text=True,
+            timeout=60,
+            check=True,
+        )
+        # "# code object from '.../nm_gpclient_service.cpython-3XX.pyc'"
+        loaded = [
+            line
+            for line in result.stderr.splitlines()
+            if line.startswith("# code object from") and "nm_gpclient_service" in line
+        ]
+        assert len(loaded) == 1, result.stderr[-2000:]
+        assert loaded[0].rstrip("'").endswith(".pyc")
+
+    def test_patterns_compile_on_first_use(self, service_module):
+        pattern = service_module.LazyPattern(r"gpd(\d+)")
+        assert pattern._compiled is None
+        assert pattern.match("gpd3").group(1) == "3"
+        assert pattern.pattern == r"gpd(\d+)"
+
+
+class TestLauncher:
+    def test_runs_the_installed_module(self, module_dir):
+        result = subprocess.run(
+            [sys.executable, os.path.join(SERVICE_DIR, "launcher.py"), "--help"],
+            capture_output=True,
+            env=dict(os.environ, PYTHONPATH=str(module_dir)),
+            text=True,
+            timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "--bus-name" in result.stdout
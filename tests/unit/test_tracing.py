@@ -0,0 +1,178 @@
+"""
+Tests for activation tracing (GPCLIENT_TRACE / EnableTracing).
+
+A trace is a Chrome trace event file; what matters is that Perfetto and
+chrome://tracing can load it: a traceEvents list of complete ("X") spans with
+microsecond timestamps, each on a named track.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import json
+import stat
+import sys
+
+import pytest
+
+FAKE_GPCLIENT_FAILING = r'''
+import sys
+sys.stdout.write("[INFO  gpclient::cli] gpclient started: fake\r\n")
+sys.stdout.write("Error: portal is on fire\r\n")
+sys.stdout.flush()
+sys.exit(1)
+'''
+
+
+def _load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _spans(trace):
+    return [event for event in trace["traceEvents"] if event["ph"] == "X"]
+
+
+class TestActivationTrace:
+    def test_disabled_trace_records_nothing(self, service_module, tmp_path):
+        trace = service_module.ActivationTrace("")
+        trace.start(gateway="vpn.example.com")
+
+        with trace.span("step", "preflight") as span:
+            span.annotate(ok=True)
+
+        assert trace.span("other", "gpclient") is service_module.NULL_SPAN
+        assert trace.finish("started") is None
+        assert list(tmp_path.iterdir()) == []
+
+    def test_spans_are_written_as_chrome_trace_events(self, service_module, tmp_path):
+        target = tmp_path / "trace.json"
+        trace = service_module.ActivationTrace(str(target))
+        trace.start(gateway="vpn.example.com")
+
+        with trace.span("cleanup-stale-gpd0", "preflight"):
+            pass
+        gpclient = trace.span("gpclient", "gpclient", pid=1234)
+        trace.instant("retry", "gpclient", reason="openssl legacy renegotiation")
+
+        assert trace.finish("started", "uuid-1") == str(target)
+
+        data = _load(target)
+        spans = {event["name"]: event for event in _spans(data)}
+        assert set(spans) == {"activation", "cleanup-stale-gpd0", "gpclient"}
+        assert spans["activation"]["args"] == {
+            "gateway": "vpn.example.com",
+            "outcome": "started",
+        }
+        # Still running when the activation finished - closed and marked open
+        assert spans["gpclient"]["args"] == {"pid": 1234, "open": True}
+        assert gpclient.ended
+        # Child spans lie inside the activation
+        root = spans["activation"]
+        for span in spans.values():
+            assert span["ts"] >= root["ts"]
+            assert span["ts"] + span["dur"] <= root["ts"] + root["dur"] + 1
+        # Every track has a name for the viewer
+        names = {
+            event["args"]["name"]
+            for event in data["traceEvents"]
+            if event["name"] == "thread_name"
+        }
+        assert {"preflight", "gpclient", "tunnel"} <= names
+        assert any(event["ph"] == "i" for event in data["traceEvents"])
+
+    def test_directory_gets_one_file_per_activation(self, service_module, tmp_path):
+        trace = service_module.ActivationTrace(str(tmp_path))
+
+        trace.start()
+        first = trace.finish("started", "uuid-1")
+        trace.start()
+        second = trace.finish("failure 1", "uuid-1")
+
+        assert first and second and first != second
+        names = [path.name for path in tmp_path.iterdir()]
+        assert len(names) == 2
+        assert all(name.startswith("nm-gpclient-uuid-1-") for name in names)
+
+    def test_trace_is_private(self, service_module, tmp_path):
+        target = tmp_path / "trace.json"
+        target.write_text("{}")
+        target.chmod(0o644)
+        trace = service_module.ActivationTrace(str(target))
+
+        trace.start()
+        trace.finish("started")
+
+        assert stat.S_IMODE(target.stat().st_mode) == 0o600
+
+    def test_exceptions_are_recorded_on_the_span(self, service_module, tmp_path):
+        target = tmp_path / "trace.json"
+        trace = service_module.ActivationTrace(str(target))
+        trace.start()
+
+        try:
+            with trace.span("session-env", "preflight"):
+                raise RuntimeError("pgrep exploded")
+        except RuntimeError:
+            pass
+        trace.finish("failure 1")
+
+        span = next(s for s in _spans(_load(target)) if s["name"] == "session-env")
+        assert "pgrep exploded" in span["args"]["error"]
+
+
+class TestTracedActivation:
+    def test_failed_gpclient_run_is_traced(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        fake = tmp_path / "gpclient.py"
+        fake.write_text(FAKE_GPCLIENT_FAILING)
+        launcher = tmp_path / "gpclient.sh"
+        launcher.write_text(f'#!/bin/bash\nexec "{sys.executable}" "{fake}" "$@"\n')
+        launcher.chmod(0o755)
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", str(launcher))
+
+        target = tmp_path / "trace.json"
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._trace.path = str(target)
+        plugin.gateway = "portal.example.com"
+        plugin.browser = "/bin/true"
+
+        async def scenario():
+            plugin._trace.start(gateway=plugin.gateway)
+            assert await plugin._start_gpclient()
+            await asyncio.wait_for(plugin.stdout_monitor_task, timeout=20)
+
+        asyncio.run(scenario())
+
+        spans = {event["name"]: event for event in _spans(_load(target))}
+        assert spans["gpclient"]["args"]["returncode"] == 1
+        assert spans["activation"]["args"]["outcome"] == "failure 1"
+        assert "session-env" in spans or "real-user" in spans
+
+    def test_failed_connect_ends_its_span(
+        self, service_module, monkeypatch, tmp_path, dbus_signals
+    ):
+        target = tmp_path / "trace.json"
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._trace.path = str(target)
+
+        def broken(connection):
+            raise ValueError("no gateway in the profile")
+
+        monkeypatch.setattr(plugin, "_connection_config", broken)
+        with pytest.raises(ValueError):
+            asyncio.run(plugin.Connect({}))
+
+        spans = {event["name"]: event for event in _spans(_load(target))}
+        assert spans["_do_connect"]["args"] == {"error": "no gateway in the profile"}
+        assert spans["activation"]["args"]["outcome"] == "failure 1"
+
+    def test_enable_tracing_over_dbus(self, service_module, tmp_path):
+        plugin = service_module.GpclientVPNPlugin()
+
+        asyncio.run(plugin.EnableTracing(str(tmp_path)))
+        assert plugin._trace.enabled
+
+        asyncio.run(plugin.DisableTracing())
+        assert not plugin._trace.enabled
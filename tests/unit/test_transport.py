@@ -0,0 +1,129 @@
+"""
+Tests for the tunnel transport: recognising ESP and the HTTPS fallback in
+gpclient's output, the Transport property and vpn.data transport=esp.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+import os
+import pty
+import sys
+
+FALLBACK_GPCLIENT = r"""
+import sys
+for line in (
+    "[INFO  gpclient::connect] Connecting to the only available gateway: gw-a",
+    "[INFO  openconnect] ESP session established with server",
+    "[INFO  openconnect] ESP tunnel connected; exiting HTTPS mainloop.",
+    "[ERROR openconnect] ESP detected dead peer",
+    "[ERROR openconnect] Failed to connect ESP tunnel; using HTTPS instead.",
+    "[INFO  openconnect] Connecting to HTTPS tunnel endpoint ...",
+):
+    sys.stdout.write(line + "\r\n")
+sys.stdout.flush()
+"""
+
+
+class FakeProcess:
+    pid = 4242
+
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+def _plugin(service_module, setting="auto"):
+    plugin = service_module.GpclientVPNPlugin()
+    plugin.transport_setting = setting
+    plugin.gpclient_process = FakeProcess()
+    return plugin
+
+
+class TestTransportMessages:
+    def test_openconnect_messages(self, service_module):
+        parse = service_module.transport_from_line
+        assert parse("[INFO  openconnect] ESP session established with server") == "esp"
+        assert parse("ESP tunnel connected; exiting HTTPS mainloop.") == "esp"
+        assert parse("Failed to connect ESP tunnel; using HTTPS instead.") == "tls"
+        # --no-dtls, or a gateway that sent no ESP keys
+        assert parse("Connecting to HTTPS tunnel endpoint ...") == "tls"
+        assert parse("ESP detected dead peer") is None
+        assert parse("Connected to gateway") is None
+
+    def test_session_falling_back_is_followed(self, service_module, tmp_path):
+        fake = tmp_path / "fake-gpclient.py"
+        fake.write_text(FALLBACK_GPCLIENT)
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._reset_phase_state()
+        seen = []
+        plugin._note_transport = lambda transport: seen.append(transport)
+
+        async def drive():
+            master, slave = pty.openpty()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, str(fake), stdin=slave, stdout=slave, stderr=slave
+            )
+            os.close(slave)
+            plugin._pty_master = master
+            plugin.gpclient_process = process
+            await asyncio.wait_for(plugin._monitor_gpclient_output(), timeout=20)
+            if plugin._prompt_task and not plugin._prompt_task.done():
+                plugin._prompt_task.cancel()
+
+        asyncio.run(drive())
+
+        assert seen == ["esp", "esp", "tls", "tls"]
+
+
+class TestTransportSetting:
+    def test_property_reports_the_transport(self, service_module, dbus_signals):
+        plugin = _plugin(service_module)
+        assert plugin.Transport() == ""
+
+        plugin._note_transport("esp")
+        assert plugin.Transport() == "esp"
+
+    def test_fallback_is_tolerated_with_auto(self, service_module, dbus_signals, caplog):
+        plugin = _plugin(service_module)
+        plugin._note_transport("esp")
+        plugin._note_transport("tls")
+
+        assert plugin.Transport() == "tls"
+        assert not plugin.gpclient_process.terminated
+        assert not [name for name, _ in dbus_signals if name == "Failure"]
+        assert "transport=tls" in caplog.text
+
+    def test_fallback_fails_the_connection_with_esp(self, service_module, dbus_signals):
+        plugin = _plugin(service_module, setting="esp")
+        plugin._note_transport("tls")
+
+        assert plugin.gpclient_process.terminated
+        assert plugin._login_failed
+        assert (
+            "Failure",
+            service_module.NM_VPN_PLUGIN_FAILURE_CONNECT_FAILED,
+        ) in dbus_signals
+
+    def test_tls_setting_expects_tls(self, service_module, dbus_signals, caplog):
+        plugin = _plugin(service_module, setting="tls")
+        plugin._note_transport("tls")
+
+        assert not plugin.gpclient_process.terminated
+        assert "much slower" not in caplog.text
+
+    def test_tls_setting_derives_the_mtu_for_tls(self, service_module):
+        plugin = _plugin(service_module, setting="tls")
+        plugin.mtu_setting = "auto"
+        plugin.gateway = "vpn.example.com"
+        plugin._mtu_cache = service_module.MtuCache("/nonexistent/mtu-cache.json")
+
+        async def probe(host):
+            return 1500
+
+        plugin._probe_path_mtu = probe
+        assert asyncio.run(plugin._choose_tunnel_mtu()) == (
+            service_module.derive_tunnel_mtu(1500, "tls")
+        )
@@ -0,0 +1,179 @@
+"""
+Timing-heavy scenarios on the virtual-clock loop (conftest.VirtualClockLoop):
+long gateway walks, the secrets timeout and the disconnect deadlines take
+minutes of service time but run in milliseconds.
+
+Run with: make test-unit  (or: python3 -m pytest tests/unit -v)
+"""
+
+import asyncio
+
+import pytest
+
+PAGE_SIZE = 7
+
+
+def _frame(options, cursor):
+    """Render an inquire Select page the way gpclient prints it"""
+    top = min(max(0, cursor - PAGE_SIZE // 2), len(options) - PAGE_SIZE)
+    lines = ["? Which gateway do you want to connect to?"]
+    for index in range(top, top + PAGE_SIZE):
+        if index == cursor:
+            marker = ">"
+        elif index == top and top > 0:
+            marker = "^"
+        elif index == top + PAGE_SIZE - 1 and index < len(options) - 1:
+            marker = "v"
+        else:
+            marker = " "
+        lines.append(f"{marker} {options[index]}")
+    lines.append("[↑↓ to move, enter to select, type to filter]")
+    return lines
+
+
+class FakeGatewayList:
+    """In-process gpclient gateway list: redraws a while after each key"""
+
+    def __init__(self, plugin, options, redraw_delay=0.2):
+        self.plugin = plugin
+        self.options = options
+        self.redraw_delay = redraw_delay
+        self.cursor = 0
+        self.selected = None
+        plugin._write_keys = self.keys
+
+    def render(self):
+        lines = _frame(self.options, self.cursor)
+        self.plugin._recent_lines.extend(lines)
+        self.plugin._line_counter += len(lines)
+
+    def keys(self, data, description):
+        if data == b"\x1b[B":
+            self.cursor = (self.cursor + 1) % len(self.options)
+            asyncio.get_running_loop().call_later(self.redraw_delay, self.render)
+        elif data == b"\r":
+            self.selected = self.options[self.cursor]
+
+
+class TestGatewayWalk:
+    def test_200_step_walk(self, service_module, virtual_clock):
+        options = [f"gw-{index:03d} (gw{index}.example.com)" for index in range(250)]
+        plugin = service_module.GpclientVPNPlugin()
+        plugin.preferred_gateway = "gw-200"
+        gpclient = FakeGatewayList(plugin, options)
+
+        async def scenario():
+            gpclient.render()
+            plugin._schedule_prompt_check()
+            await plugin._prompt_task
+
+        virtual_clock.run(scenario())
+
+        assert gpclient.selected == "gw-200 (gw200.example.com)"
+        # 200 redraws of 0.2 s each (plus polling granularity) - in virtual time
+        assert virtual_clock.loop.time() >= 200 * 0.2
+
+    def test_silent_gpclient_times_out_on_the_first_step(
+        self, service_module, virtual_clock
+    ):
+        options = [f"gw-{index:03d} (gw{index}.example.com)" for index in range(20)]
+        plugin = service_module.GpclientVPNPlugin()
+        plugin.preferred_gateway = "gw-015"
+        gpclient = FakeGatewayList(plugin, options, redraw_delay=60)
+
+        async def scenario():
+            gpclient.render()
+            plugin._schedule_prompt_check()
+            await plugin._prompt_task
+
+        virtual_clock.run(scenario())
+
+        # No redraw within SELECT_REDRAW_TIMEOUT: the highlighted entry is taken
+        assert gpclient.selected == options[1]
+        elapsed = virtual_clock.loop.time()
+        debounce = service_module.PROMPT_DEBOUNCE_SECONDS
+        assert elapsed == pytest.approx(
+            debounce + service_module.SELECT_REDRAW_TIMEOUT,
+            abs=service_module.SELECT_POLL_INTERVAL,
+        )
+
+
+class TestSecretsTimeout:
+    def test_unanswered_request_times_out(self, service_module, virtual_clock):
+        plugin = service_module.GpclientVPNPlugin()
+        plugin._interactive = True
+
+        async def scenario():
+            with pytest.raises(Exception, match="Timed out waiting"):
+                await plugin._request_secret_interactive("otp", "Passcode", "")
+
+        virtual_clock.run(scenario())
+
+        assert virtual_clock.loop.time() == pytest.approx(
+            service_module.SECRETS_REQUEST_TIMEOUT
+        )
+        assert plugin._secret_future is None
+
+
+class StubbornProcess:
+    """gpclient that ignores SIGTERM and only goes away on SIGKILL"""
+
+    pid = 4242
+
+    def __init__(self):
+        self.killed = asyncio.Event()
+        self.signals = []
+
+    def terminate(self):
+        self.signals.append(("TERM", asyncio.get_running_loop().time()))
+
+    def kill(self):
+        self.signals.append(("KILL", asyncio.get_running_loop().time()))
+        self.killed.set()
+
+    async def wait(self):
+        await self.killed.wait()
+        return -9
+
+
+class TestDisconnectDeadlines:
+    def test_sigkill_after_the_terminate_deadline(
+        self, service_module, virtual_clock, monkeypatch, dbus_signals
+    ):
+        monkeypatch.setattr(service_module, "GPCLIENT_BINARY", "/nonexistent/gpclient")
+        plugin = service_module.GpclientVPNPlugin()
+
+        async def scenario():
+            plugin.gpclient_process = StubbornProcess()
+            process = plugin.gpclient_process
+            await plugin.Disconnect()
+            return process
+
+        process = virtual_clock.run(scenario())
+
+        assert process.signals == [
+            ("TERM", 0.0),
+            ("KILL", service_module.GPCLIENT_TERMINATE_TIMEOUT),
+        ]
+        assert ("StateChanged", service_module.NM_VPN_SERVICE_STATE_STOPPED) in (
+            dbus_signals
+        )
+
+    def test_tunnel_poll_uses_the_loop_clock(
+        self, service_module, virtual_clock, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(service_module, "SYS_CLASS_NET", str(tmp_path))
+        plugin = service_module.GpclientVPNPlugin()
+
+        async def scenario():
+            task = asyncio.create_task(plugin._check_tunnel_loop())
+            await asyncio.sleep(service_module.TUNNEL_POLL_INTERVAL * 100)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        virtual_clock.run(scenario())
+
+        assert virtual_clock.loop.time() == pytest.approx(
+            service_module.TUNNEL_POLL_INTERVAL * 100
+        )